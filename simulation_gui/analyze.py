@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from components.Analytics import TraceAnalyzer
+
+parser = argparse.ArgumentParser(
+    description="Compute the per step metrics of traces without opening any window")
+parser.add_argument("trace_files", nargs="+", help="Trace files to analyze")
+parser.add_argument("--model_file", required=True,
+                    help="Model the traces were generated from")
+parser.add_argument("--cols", type=int, help="Number of columns, the one of the model by default")
+parser.add_argument("--rows", type=int, help="Number of rows, the one of the model by default")
+parser.add_argument("--vision", type=int,
+                    help="Vision range of the drones, the largest one of the model by default")
+parser.add_argument("--cache_dir", default="trace_cache",
+                    help="Directory the decoded traces are cached in, to be analyzed again without parsing them")
+parser.add_argument("--no_cache", action="store_true",
+                    help="Parse the traces without reading or writing their cache")
+parser.add_argument("--jobs", type=int, default=1,
+                    help="Number of traces analyzed at once")
+parser.add_argument("--output", default="metrics.csv",
+                    help="Metrics of every step, written as NumPy columns if it ends in .npz and as CSV otherwise")
+parser.add_argument("--summary",
+                    help="Results of every trace, written as JSON if it ends in .json and as CSV otherwise")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    analyzer = TraceAnalyzer(args.model_file, args.cols, args.rows, args.vision,
+                             None if args.no_cache else args.cache_dir)
+
+    start = time.perf_counter()
+    summaries = []
+    columns = {column: [] for column in ["trace"] + analyzer.columns}
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor, \
+            open(args.output, "w", newline="") as output:
+        writer = None
+        if not args.output.endswith(".npz"):
+            writer = csv.writer(output)
+            writer.writerow(["trace"] + analyzer.columns)
+
+        # Traces are written as they are analyzed, in the given order
+        for (trace_file, metrics) in zip(args.trace_files,
+                                         executor.map(analyzer.analyze_file, args.trace_files)):
+            summary = TraceAnalyzer.summary(metrics)
+            summaries.append({"trace": trace_file, **summary})
+            print(f"{trace_file}: {summary['steps']} steps, safe {summary['safe']}, dead {summary['dead']}, "
+                  f"first rescue at step {summary['step_of_first_rescue']}", file=sys.stderr)
+
+            if writer is not None:
+                rows = zip(*[metrics[column].tolist() for column in analyzer.columns])
+                writer.writerows([trace_file, *row] for row in rows)
+            else:
+                columns["trace"].append(np.full(summary["steps"], trace_file))
+                for column in analyzer.columns:
+                    columns[column].append(metrics[column])
+
+    if args.output.endswith(".npz"):
+        np.savez_compressed(args.output, **{column: np.concatenate(parts)
+                                            for (column, parts) in columns.items()})
+    elapsed = time.perf_counter() - start
+    print(f"{len(args.trace_files)} traces in {elapsed:.2f} s", file=sys.stderr)
+
+    if args.summary:
+        with open(args.summary, "w", newline="") as file:
+            if args.summary.endswith(".json"):
+                json.dump(summaries, file, indent=2)
+            else:
+                writer = csv.DictWriter(file, fieldnames=list(summaries[0]))
+                writer.writeheader()
+                writer.writerows(summaries)
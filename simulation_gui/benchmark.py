@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from os import path
+import numpy as np
+
+# Nothing is shown, the widgets draw into their pixmaps
+os.environ["QT_QPA_PLATFORM"] = "offscreen"
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QJsonDocument
+
+from components.Benchmark import Benchmark, SyntheticScenario
+from components.Enums import CellType
+from components.HttpServer import MapStateHandler
+from components.Map import MapWidget, MapEditorWidget
+from components.Model import ModelLayout
+from components.Trace import TraceIndexer, TraceStore, TraceWidget
+from components.TraceCache import TraceCache
+from components.Xtr import XtrReader
+from components.Wire import StateDecoder
+
+cases = ["parse_map", "trace_load", "trace_seek", "trace_cache", "draw_grid", "draw_map", "save_map",
+         "count_entity", "state_ingest", "startup"]
+
+# Time, in seconds, from starting main.py to its window being shown
+startup_targets = {"json_visualizer": 0.5, "live_visualizer": 0.5, "trace_visualizer": 0.5, "editor": 0.5}
+
+parser = argparse.ArgumentParser(
+    description="Time the hot paths of the visualizer on synthetic maps and traces")
+parser.add_argument("--model_file", default="../faster_model_smc.xml",
+                    help="Model the synthetic scenarios are generated from")
+parser.add_argument("--sizes", default="10,25,50,100,200",
+                    help="Sides of the square maps")
+parser.add_argument("--steps", default="100,1000,10000,100000",
+                    help="Lengths of the traces loaded by trace_load")
+parser.add_argument("--max_trace_values", type=int, default=50_000_000,
+                    help="Largest trace, in variable values, generated for trace_load")
+parser.add_argument("--case", action="append", choices=cases,
+                    help="Case to run, all of them by default")
+parser.add_argument("--cell_size", type=int,
+                    help="Size, in pixels, of each cell, by default the largest up to 50 that fits 1000 pixels")
+parser.add_argument("--repeat", type=int, default=5,
+                    help="Number of timed samples of each case")
+parser.add_argument("--min_time", type=float, default=0.2,
+                    help="Minimum time, in seconds, of all the samples of a case together")
+parser.add_argument("--seed", type=int, default=0,
+                    help="Seed of the synthetic scenarios")
+parser.add_argument("--work_dir", default="benchmark_data",
+                    help="Directory the synthetic models and traces are kept in, to be reused by later runs")
+parser.add_argument("--output", default="benchmark.json",
+                    help="JSON file the results are written to")
+parser.add_argument("--compare",
+                    help="Results of a previous run to compare with")
+
+
+def trace_file(scenario: SyntheticScenario, steps: int) -> str:
+    name = path.join(args.work_dir, f"trace_{scenario.map.N_COLS}x{scenario.map.N_ROWS}"
+                                    f"_{steps}_{args.seed}.xtr")
+    if not path.exists(name):
+        print(f"Generating {name}", file=sys.stderr)
+        scenario.write_trace(name + ".part", steps)
+        os.replace(name + ".part", name)
+    return name
+
+
+def open_trace(model_file: str, trace_file: str, size: int, cell_size: int) -> TraceWidget:
+    map = MapWidget(size, size, cell_size)
+    with open(model_file) as model, open(trace_file) as trace:
+        layout = ModelLayout(model)
+        store = TraceStore.read(trace, layout, TraceIndexer(size, size, layout.variables))
+    return TraceWidget(store, map.draw_map)
+
+
+def run_size(benchmark: Benchmark, size: int, selected: list[str]) -> None:
+    cell_size = args.cell_size or max(1, min(50, 1000 // size))
+    params = {"size": f"{size}x{size}"}
+    scenario = SyntheticScenario(args.model_file, size, size, args.seed)
+    model_file = path.join(args.work_dir, f"model_{size}x{size}_{args.seed}.xml")
+    scenario.write_model(model_file)
+    steps = sorted(int(value) for value in args.steps.split(","))
+
+    # Consecutive maps of the shortest trace, to draw and parse real steps
+    trace = open_trace(model_file, trace_file(scenario, steps[0]), size, cell_size)
+    maps = [trace.get_map(step) for step in range(trace.steps)]
+    map = scenario.map
+    # Longest trace loaded, for the cases seeking in it
+    longest = max([length for length in steps
+                   if length * len(scenario.layout.variables) <= args.max_trace_values], default=steps[0])
+
+    if "parse_map" in selected:
+        with open(trace_file(scenario, steps[0])) as file:
+            states = itertools.cycle(list(XtrReader(file, scenario.layout)))
+        benchmark.measure("parse_map", params, lambda: trace.trace.indexer.gather(next(states)))
+
+    if "trace_load" in selected:
+        for length in steps:
+            if length * len(scenario.layout.variables) > args.max_trace_values:
+                print(f"Skipping trace_load size={size}x{size} steps={length}, "
+                      f"over --max_trace_values", file=sys.stderr)
+                continue
+            name = trace_file(scenario, length)
+            benchmark.measure("trace_load", {**params, "steps": length},
+                              lambda: open_trace(model_file, name, size, cell_size),
+                              repeat=min(args.repeat, 3))
+
+    if "trace_seek" in selected:
+        # Steps in random order and one after another
+        long_trace = open_trace(model_file, trace_file(scenario, longest), size, cell_size)
+        random_steps = itertools.cycle(np.random.default_rng(args.seed).integers(0, longest, 1000).tolist())
+        benchmark.measure("trace_seek", {**params, "steps": longest, "order": "random"},
+                          lambda: long_trace.get_map(next(random_steps)))
+        next_steps = itertools.cycle(range(longest))
+        benchmark.measure("trace_seek", {**params, "steps": longest, "order": "sequential"},
+                          lambda: long_trace.get_map(next(next_steps)))
+        print(f"trace memory size={size}x{size} steps={longest}: {long_trace.trace.nbytes} bytes",
+              file=sys.stderr)
+
+    if "trace_cache" in selected:
+        # Conversion of the longest trace, then its reopening from the cache
+        name = trace_file(scenario, longest)
+        cache_dir = path.join(args.work_dir, "trace_cache")
+        cache = TraceCache(cache_dir)
+        benchmark.measure("trace_cache_write", {**params, "steps": longest},
+                          lambda: cache.open(model_file, name, size, size, scenario.layout),
+                          setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True), repeat=min(args.repeat, 3))
+        benchmark.measure("trace_cache_open", {**params, "steps": longest},
+                          lambda: cache.open(model_file, name, size, size))
+        cached = cache.open(model_file, name, size, size)
+        random_steps = itertools.cycle(np.random.default_rng(args.seed).integers(0, longest, 1000).tolist())
+        benchmark.measure("trace_cache_seek", {**params, "steps": longest},
+                          lambda: cached.get(next(random_steps)))
+
+    widget = MapWidget(size, size, cell_size)
+    if "draw_grid" in selected:
+        benchmark.measure("draw_grid", {**params, "cell_size": cell_size}, widget.draw_grid,
+                          setup=MapWidget.backgrounds.clear)
+
+    if "draw_map" in selected:
+        benchmark.measure("draw_map_full", {**params, "cell_size": cell_size},
+                          lambda: widget.draw_map(map), setup=widget.clear)
+        steps_maps = itertools.cycle(maps)
+        benchmark.measure("draw_map_step", {**params, "cell_size": cell_size},
+                          lambda: widget.draw_map(next(steps_maps)))
+
+    if "save_map" in selected:
+        editor = MapEditorWidget(size, size, cell_size, model_file=args.model_file)
+        editor.draw_map(map.copy())
+
+        def save_map() -> None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                editor.save_map()
+
+        directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as temporary:
+            # Every save goes to map_0, removed before the next one
+            os.chdir(temporary)
+            try:
+                benchmark.measure("save_map", params, save_map,
+                                  setup=lambda: shutil.rmtree("map_0", ignore_errors=True))
+            finally:
+                os.chdir(directory)
+
+    if "count_entity" in selected:
+        benchmark.measure("count_entity", params, lambda: map.count_entity(CellType.SURVIVOR))
+        benchmark.measure("count_actors", params, lambda: map.count_actors(CellType.SURVIVOR))
+
+    if "state_ingest" in selected:
+        # Received and parsed into the state handed to the drawing, which is
+        # left out as draw_map measures it
+        handler = MapStateHandler(lambda state: None)
+        json_bodies = itertools.cycle([QJsonDocument(step.to_json()).toJson().data() for step in maps[:2]])
+        benchmark.measure("state_ingest", {**params, "format": "json"},
+                          lambda: (handler.receive("application/json", next(json_bodies)),
+                                   handler.render()))
+        binary_bodies = itertools.cycle([StateDecoder.encode(step) for step in maps[:2]])
+        benchmark.measure("state_ingest", {**params, "format": "binary"},
+                          lambda: (handler.receive(StateDecoder.content_type, next(binary_bodies)),
+                                   handler.render()))
+
+        # Deltas going back and forth between two consecutive steps
+        handler.receive(StateDecoder.content_type, StateDecoder.encode(maps[0]))
+        delta_bodies = itertools.cycle([StateDecoder.encode(maps[1], maps[0]),
+                                        StateDecoder.encode(maps[0], maps[1])])
+        benchmark.measure("state_ingest", {**params, "format": "delta"},
+                          lambda: (handler.receive(StateDecoder.content_type, next(delta_bodies)),
+                                   handler.render()))
+
+
+# Runs main.py in every mode on a small synthetic scenario, the time
+# including the start of the interpreter
+def run_startup(benchmark: Benchmark) -> None:
+    size = 10
+    scenario = SyntheticScenario(args.model_file, size, size, args.seed)
+    model_file = path.abspath(path.join(args.work_dir, f"model_{size}x{size}_{args.seed}.xml"))
+    scenario.write_model(model_file)
+    map_file = path.abspath(path.join(args.work_dir, f"map_{size}x{size}_{args.seed}.json"))
+    with open(map_file, "w") as file:
+        json.dump(scenario.map.to_json(), file)
+
+    # The trace cache is kept with the other generated files and written
+    # beforehand: the window quits before its background load could write it
+    trace = path.abspath(trace_file(scenario, 100))
+    cache_dir = path.abspath(path.join(args.work_dir, "trace_cache"))
+    TraceCache(cache_dir).open(model_file, trace, size, size, scenario.layout)
+
+    options = {
+        "json_visualizer": ["--map_file", map_file],
+        "live_visualizer": [],
+        "trace_visualizer": ["--model_file", model_file, "--trace_file", trace, "--cache_dir", cache_dir],
+        "editor": ["--model_file", path.abspath(args.model_file), "--map_file", map_file],
+    }
+    directory = path.dirname(path.abspath(__file__))
+    for (mode, target) in startup_targets.items():
+        command = [sys.executable, "main.py", "--mode", mode, "--cols", str(size), "--rows", str(size),
+                   "--startup_time"] + options[mode]
+        result = benchmark.measure("startup", {"mode": mode}, lambda: subprocess.run(
+            command, cwd=directory, check=True, capture_output=True))
+        result.update(target=target, met=result["median"] <= target)
+        if not result["met"]:
+            print(f"startup of {mode} over its target of {target} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    app = QApplication([])
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    benchmark = Benchmark(args.repeat, args.min_time)
+    selected = args.case or cases
+    for size in sorted(int(value) for value in args.sizes.split(",")):
+        if set(selected) - {"startup"}:
+            run_size(benchmark, size, selected)
+    if "startup" in selected:
+        run_startup(benchmark)
+
+    benchmark.save(args.output, vars(args))
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        print(f"\nCompared with {args.compare}:")
+        for (name, params, previous, current) in benchmark.compare(args.compare):
+            print(f"{name} {params}: {Benchmark.format_time(previous)} -> "
+                  f"{Benchmark.format_time(current)} ({previous / current:.2f}x)")
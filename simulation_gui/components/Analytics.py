@@ -0,0 +1,170 @@
+from typing import Iterator, TextIO
+import numpy as np
+
+from components.Enums import CellType
+from components.Model import ModelLayout
+from components.Scenario import ScenarioTemplate
+from components.Trace import TraceIndexer
+from components.TraceCache import CachedTrace, TraceCache
+from components.Xtr import XtrReader
+
+
+# Per step metrics of traces, computed without drawing anything. States are
+# read from the trace in chunks and every metric is a NumPy reduction over the
+# whole chunk, the only state carried from a chunk to the next being the cells
+# seen so far by the drones. Steps are the states of the trace in order: one
+# per time unit for the traces of the simulator, one per transition for the
+# traces of verifyta. With a cache directory, the traces are decoded once into
+# a TraceCache and the chunks are then read from its memory mapped records.
+class TraceAnalyzer():
+    columns = ["step", "safe", "dead", "survivors", "zero_responders", "in_need", "assisted",
+               "first_responders", "assisting", "fr_utilisation", "drones", "drone_coverage"]
+    counted = {
+        "survivors": [CellType.SURVIVOR],
+        "zero_responders": [CellType.ZERO_RESP],
+        "in_need": [CellType.IN_NEED],
+        "assisted": [CellType.ASSISTED],
+        "first_responders": [CellType.FIRST_RESP, CellType.ASSISTING],
+        "assisting": [CellType.ASSISTING],
+    }
+    counters = {"safe": "safe_survivors", "dead": "dead_survivors"}
+
+    # Number of cells decoded at once, whatever the map size
+    chunk_cells = 1 << 22
+
+    def __init__(self, model_file: str, N_COLS: int | None = None, N_ROWS: int | None = None,
+                 vision: int | None = None, cache_dir: str | None = None):
+        self.model_file = model_file
+        self.cache = None if cache_dir is None else TraceCache(cache_dir)
+        self.layout = ModelLayout(model_file)
+        self.N_COLS = N_COLS or self.layout.constants["N_COLS"]
+        self.N_ROWS = N_ROWS or self.layout.constants["N_ROWS"]
+        self.indexer = TraceIndexer(self.N_COLS, self.N_ROWS, self.layout.variables)
+        self.vision = TraceAnalyzer.vision_range(model_file, self.layout) if vision is None else vision
+
+        # Counters of the model, missing from the older models
+        self.counter_slots = {}
+        for (column, variable) in self.counters.items():
+            if variable in self.layout.variables:
+                self.counter_slots[column] = self.layout.index(variable)
+
+    # Largest vision range of the drones, 0 if the model does not define it
+    def vision_range(model_file: str, layout: ModelLayout) -> int:
+        values = ScenarioTemplate(model_file).values
+        if "N_v" not in values:
+            return 0
+        text = values["N_v"].strip()
+        if text.startswith("{"):
+            return max(layout.evaluate(item) for item in ModelLayout.split_top_level(text[1:-1], ","))
+        return layout.evaluate(text)
+
+    def chunks(self, trace_file: TextIO) -> Iterator[np.ndarray]:
+        size = max(1, self.chunk_cells // (self.N_COLS * self.N_ROWS))
+        states = []
+        for state in XtrReader(trace_file, self.layout):
+            states.append(state)
+            if len(states) == size:
+                yield np.vstack(states)
+                states = []
+        if states:
+            yield np.vstack(states)
+
+    # Cells, drones and counters of the chunks of a trace file
+    def decoded_chunks(self, trace_file: TextIO) -> Iterator[tuple[np.ndarray, np.ndarray, dict]]:
+        for values in self.chunks(trace_file):
+            (cells, drones) = self.indexer.gather_all(values)
+            shape = (len(values), self.N_COLS, self.N_ROWS)
+            yield (cells.reshape(shape), drones.reshape(shape) != 0, {column: values[:, slot] for (column, slot) in self.counter_slots.items()})
+
+    # Same chunks, read from the records of a cached trace
+    def cached_chunks(self, trace: CachedTrace) -> Iterator[tuple[np.ndarray, np.ndarray, dict]]:
+        size = max(1, self.chunk_cells // (self.N_COLS * self.N_ROWS))
+        counters = {column: trace.variables.index(variable)
+                    for (column, variable) in self.counters.items() if variable in trace.variables}
+        for start in range(0, trace.steps, size):
+            records = trace.records[start:start + size]
+            values = records["values"]
+            yield (records["cells"], records["drones"] != 0,
+                   {column: values[:, index] for (column, index) in counters.items()})
+
+    # Metric columns of every step of the trace
+    def analyze(self, trace_file: TextIO) -> dict[str, np.ndarray]:
+        return self.metrics(self.decoded_chunks(trace_file))
+
+    def metrics(self, chunks: Iterator[tuple[np.ndarray, np.ndarray, dict]]) -> dict[str, np.ndarray]:
+        parts = {column: [] for column in self.columns}
+        seen = np.zeros((self.N_COLS, self.N_ROWS), dtype=bool)
+        first = 0
+
+        for (cells, drones, counters) in chunks:
+            steps = len(cells)
+            columns = {"step": np.arange(first, first + steps)}
+            first += steps
+
+            for (column, values) in counters.items():
+                columns[column] = values.astype(np.int64)
+            for column in self.counters:
+                columns.setdefault(column, np.full(steps, -1, dtype=np.int64))
+
+            flat = cells.reshape(steps, -1)
+            for (column, states) in self.counted.items():
+                columns[column] = np.isin(flat, [state.value for state in states]).sum(axis=1)
+            columns["fr_utilisation"] = np.divide(
+                columns["assisting"], columns["first_responders"],
+                out=np.zeros(steps), where=columns["first_responders"] > 0)
+            columns["drones"] = drones.reshape(steps, -1).sum(axis=1)
+
+            # Cells in view of a drone at any step so far
+            viewed = self.in_view(drones)
+            viewed[0] |= seen
+            viewed = np.logical_or.accumulate(viewed, axis=0)
+            seen = viewed[-1]
+            columns["drone_coverage"] = viewed.reshape(steps, -1).mean(axis=1)
+
+            for column in self.columns:
+                parts[column].append(columns[column])
+
+        return {column: np.concatenate(part) if part else np.zeros(0)
+                for (column, part) in parts.items()}
+
+    # Cells within the vision range of a drone, the range being a Chebyshev
+    # distance like in is_actor_in_range(), dilating one axis at a time
+    def in_view(self, drones: np.ndarray) -> np.ndarray:
+        viewed = drones.copy()
+        for axis in (1, 2):
+            dilated = viewed.copy()
+            for shift in range(1, self.vision + 1):
+                forward = [slice(None)] * 3
+                backward = [slice(None)] * 3
+                forward[axis] = slice(shift, None)
+                backward[axis] = slice(None, -shift)
+                dilated[tuple(forward)] |= viewed[tuple(backward)]
+                dilated[tuple(backward)] |= viewed[tuple(forward)]
+            viewed = dilated
+        return viewed
+
+    def analyze_file(self, trace_file: str) -> dict[str, np.ndarray]:
+        if self.cache is not None:
+            trace = self.cache.open(self.model_file, trace_file, self.N_COLS, self.N_ROWS, self.layout)
+            return self.metrics(self.cached_chunks(trace))
+        with open(trace_file) as file:
+            return self.analyze(file)
+
+    # Scalar results of a trace from its metric columns, None where the trace
+    # is empty or the model has no such counter. The first rescue is the index
+    # of a step, which is a time unit only for the traces of the simulator.
+    def summary(metrics: dict[str, np.ndarray]) -> dict:
+        steps = len(metrics["step"])
+        if not steps:
+            return {"steps": 0, "step_of_first_rescue": None, "safe": None, "dead": None,
+                    "mean_fr_utilisation": None, "drone_coverage": None}
+
+        rescued = np.flatnonzero(metrics["safe"] > 0)
+        return {
+            "steps": steps,
+            "step_of_first_rescue": int(metrics["step"][rescued[0]]) if len(rescued) else None,
+            "safe": int(metrics["safe"][-1]) if metrics["safe"][-1] >= 0 else None,
+            "dead": int(metrics["dead"][-1]) if metrics["dead"][-1] >= 0 else None,
+            "mean_fr_utilisation": float(metrics["fr_utilisation"].mean()),
+            "drone_coverage": float(metrics["drone_coverage"][-1]),
+        }
@@ -0,0 +1,342 @@
+import numpy as np
+
+from components.Enums import CellType
+from components.Simulator import SimulationScenario, Simulator
+
+
+# Runs the episodes of Simulator as stacked arrays: the maps of a batch of K
+# episodes are one (K, N_COLS, N_ROWS) array and every actor attribute is a
+# (K, actors) array. At each step every episode draws its own order of the
+# processes, and the processes found at the same position of the orders are
+# advanced together, one vectorized update per kind of process. Episodes in
+# which every survivor is safe or dead are masked out of the following steps.
+class BatchSimulator(Simulator):
+    unset = np.iinfo(np.int32).max
+    distance_table_cells = 4096
+
+    def __init__(self, scenario: SimulationScenario, horizon: int, batch_size: int = 16384):
+        super().__init__(scenario, horizon)
+        self.batch_size = batch_size
+
+        self.distances = None
+        self.xs_array = np.array(self.xs)
+        self.ys_array = np.array(self.ys)
+        self.near_fire_array = np.array(self.near_fire, dtype=bool)
+        self.near_exit_array = np.array(self.near_exit, dtype=bool)
+        self.nearest_exit_array = np.array(self.nearest_exit)
+        self.radius_array = BatchSimulator.pad(self.radius, 9)
+        self.moves_array = BatchSimulator.pad(self.moves, 8)
+
+        # Distances between every pair of cells, while the table is small
+        if len(self.xs) <= self.distance_table_cells:
+            cells = np.arange(len(self.xs))
+            self.distances = self.distance(cells[:, None], cells[None, :]).astype(np.int16)
+
+        self.N_v_array = np.array(self.N_v)
+        self.N_r_array = np.array(self.N_r)
+        self.survivors_policies_array = np.array(self.survivors_policies)
+        self.first_resp_policies_array = np.array(self.first_resp_policies)
+
+    # Neighbour lists as a table, -1 where a cell has fewer neighbours
+    def pad(lists: list[list[int]], width: int) -> np.ndarray:
+        table = np.full((len(lists), width), -1)
+        for (i, cells) in enumerate(lists):
+            table[i, :len(cells)] = cells
+        return table
+
+    def run(self, runs: int, seed: int | np.random.SeedSequence | None = None) -> np.ndarray:
+        generator = np.random.default_rng(seed)
+        counters = np.zeros((runs, self.horizon + 1, len(self.counters)), dtype=np.int16)
+        for start in range(0, runs, self.batch_size):
+            batch = Batch(self, min(self.batch_size, runs - start), generator)
+            counters[start:start + batch.K] = batch.run()
+        return counters
+
+    def distance(self, cells1: np.ndarray, cells2: np.ndarray) -> np.ndarray:
+        if self.distances is not None:
+            return self.distances[cells1, cells2]
+        return np.maximum(np.abs(self.xs_array[cells1] - self.xs_array[cells2]),
+                          np.abs(self.ys_array[cells1] - self.ys_array[cells2]))
+
+
+# Stacked state of K episodes. Methods take the rows of the episodes to update
+# and, for the actors, the index of the actor in each of those rows.
+class Batch():
+    def __init__(self, simulator: BatchSimulator, K: int, generator: np.random.Generator):
+        self.simulator = simulator
+        self.K = K
+        self.random = generator
+        self.now = 0
+
+        cells = np.array(simulator.initial_cells, dtype=np.int8)
+        self.cells = np.tile(cells, (K, 1)).reshape(K, simulator.N_COLS, simulator.N_ROWS)
+        self.flat = self.cells.reshape(K, -1)
+        self.drones = np.zeros_like(self.flat, dtype=bool)
+
+        zeros = np.zeros(K, dtype=np.int32)
+        self.available_fr = zeros.copy()
+        self.safe_survivors = zeros.copy()
+        self.dead_survivors = zeros.copy()
+        self.timeout = zeros.copy()
+        self.target_in_need = zeros.copy()
+
+        rows = np.arange(K)[:, None]
+        self.drone_pos = np.tile(np.array(simulator.drones_start, dtype=np.int32), (K, 1))
+        self.drone_step = np.zeros_like(self.drone_pos)
+        self.drones[rows, self.drone_pos] = True
+
+        start = np.array(simulator.survivors_start, dtype=np.int32)
+        suffering = simulator.near_fire_array[start]
+        self.survivor_pos = np.tile(start, (K, 1))
+        self.survivor_state = np.tile(np.where(suffering, Simulator.SUFFERING, Simulator.MOVING),
+                                      (K, 1)).astype(np.int8)
+        self.survivor_due = np.tile(np.where(suffering, simulator.T_v, 1), (K, 1)).astype(np.int32)
+        self.survivor_outcome = np.full_like(self.survivor_state, Simulator.SAFE)
+        self.flat[rows, self.survivor_pos] = np.where(
+            suffering, CellType.IN_NEED.value, CellType.SURVIVOR.value)
+
+        self.first_resp_pos = np.tile(np.array(simulator.first_resp_start, dtype=np.int32), (K, 1))
+        self.first_resp_state = np.full(self.first_resp_pos.shape, Simulator.AVAILABLE, dtype=np.int8)
+        self.first_resp_due = np.ones(self.first_resp_pos.shape, dtype=np.int32)
+        self.first_resp_target = np.zeros_like(self.first_resp_pos)
+        self.flat[rows, self.first_resp_pos] = CellType.FIRST_RESP.value
+        self.available_fr += self.first_resp_pos.shape[1]
+
+        # Processes are numbered drones first, then survivors and first
+        # responders, as in the system line
+        (D, S, F) = (self.drone_pos.shape[1], self.survivor_pos.shape[1],
+                     self.first_resp_pos.shape[1])
+        self.kinds = [(0, self.drone_act), (D, self.survivor_act), (D + S, self.first_resp_act)]
+        self.kind_of = np.repeat(np.arange(3), [D, S, F])
+        self.processes = D + S + F
+
+    def counters(self) -> np.ndarray:
+        return np.stack([self.safe_survivors, self.dead_survivors, self.available_fr], axis=1)
+
+    def finished(self, rows: np.ndarray | slice = slice(None)) -> np.ndarray:
+        return self.safe_survivors[rows] + self.dead_survivors[rows] == self.survivor_pos.shape[1]
+
+    def run(self) -> np.ndarray:
+        counters = np.zeros((self.K, self.simulator.horizon + 1, len(Simulator.counters)), dtype=np.int16)
+        counters[:, 0] = self.counters()
+        for now in range(1, self.simulator.horizon + 1):
+            live = np.flatnonzero(~self.finished())
+            if not len(live):
+                counters[:, now:] = counters[:, now - 1:now]
+                break
+            self.step(now, live)
+            counters[:, now] = self.counters()
+        return counters
+
+    def step(self, now: int, live: np.ndarray) -> None:
+        self.now = now
+        orders = np.argsort(self.random.random((len(live), self.processes)), axis=1)
+        for position in range(self.processes):
+            processes = orders[:, position]
+            kinds = self.kind_of[processes]
+            for (kind, (first, act)) in enumerate(self.kinds):
+                selected = kinds == kind
+                if selected.any():
+                    act(live[selected], processes[selected] - first)
+
+    def in_range(self, rows: np.ndarray, pos: np.ndarray, value: int, range: np.ndarray) -> np.ndarray:
+        actors = self.survivor_pos[rows]
+        found = self.flat[rows[:, None], actors] == value
+        return (found & (self.simulator.distance(pos[:, None], actors) <= range[:, None])).any(axis=1)
+
+    # find_nearest_actor(), cell 0 in the rows where there is none
+    def nearest(self, rows: np.ndarray, pos: np.ndarray, value: int, actors: np.ndarray) -> np.ndarray:
+        actors = actors[rows]
+        found = self.flat[rows[:, None], actors] == value
+        distances = np.where(found, self.simulator.distance(pos[:, None], actors), self.simulator.far)
+        nearest = actors[np.arange(len(rows)), np.argmin(distances, axis=1)]
+        return np.where(found.any(axis=1), nearest, 0)
+
+    def drone_act(self, rows: np.ndarray, drones: np.ndarray) -> None:
+        simulator = self.simulator
+        pos = self.drone_pos[rows, drones]
+        N_v = simulator.N_v_array[drones]
+        moving = []
+        while len(rows):
+            near = self.in_range(rows, pos, CellType.IN_NEED.value, N_v) & \
+                self.in_range(rows, pos, CellType.SURVIVOR.value, N_v)
+            moving.append((rows[~near], drones[~near]))
+            listened = self.random.random(np.count_nonzero(near)) < simulator.p_listen
+            (rows, drones, pos, N_v) = (rows[near][listened], drones[near][listened],
+                                        pos[near][listened], N_v[near][listened])
+            if len(rows):
+                self.instruct(rows, pos)
+
+        rows = np.concatenate([rows for (rows, _) in moving])
+        drones = np.concatenate([drones for (_, drones) in moving])
+        pos = self.drone_pos[rows, drones]
+        length = simulator.N_r_array[drones]
+        step = self.drone_step[rows, drones]
+        side = np.minimum(step // length, 3)
+        x = simulator.xs_array[pos] + np.array([1, 0, -1, 0])[side]
+        y = simulator.ys_array[pos] + np.array([0, -1, 0, 1])[side]
+        self.drone_step[rows, drones] = (step + 1) % (4 * length)
+
+        inside = (x >= 0) & (x < simulator.N_COLS) & (y >= 0) & (y < simulator.N_ROWS)
+        (rows, drones, pos) = (rows[inside], drones[inside], pos[inside])
+        target = x[inside] * simulator.N_ROWS + y[inside]
+        self.drones[rows, pos] = False
+        self.drone_pos[rows, drones] = target
+        self.drones[rows, target] = True
+
+    def instruct(self, rows: np.ndarray, pos: np.ndarray) -> None:
+        simulator = self.simulator
+        in_need = self.nearest(rows, pos, CellType.IN_NEED.value, self.survivor_pos)
+        self.flat[rows, in_need] = CellType.ASSISTED.value
+        zero_resp = self.nearest(rows, pos, CellType.SURVIVOR.value, self.survivor_pos)
+        self.flat[rows, zero_resp] = CellType.ZERO_RESP.value
+
+        assisted = self.available_fr[rows] > 0
+        self.timeout[rows] = simulator.distance(in_need, zero_resp) + simulator.T_zr
+        if assisted.any():
+            (fr_rows, fr_pos) = (rows[assisted], pos[assisted])
+            first_resp = self.nearest(fr_rows, fr_pos, CellType.FIRST_RESP.value,
+                                      self.first_resp_pos)
+            self.flat[fr_rows, first_resp] = CellType.ASSISTING.value
+            self.timeout[fr_rows] = simulator.distance(zero_resp[assisted], first_resp) + \
+                simulator.distance(first_resp, in_need[assisted]) + simulator.T_fr
+            self.target_in_need[fr_rows] = in_need[assisted]
+            self.set_timeout(fr_rows, first_resp)
+        self.set_timeout(rows, zero_resp)
+        self.set_timeout(rows, in_need)
+
+    # Broadcast on set_timeout[x][y] to the processes at the cell
+    def set_timeout(self, rows: np.ndarray, cells: np.ndarray) -> None:
+        (now, T_v) = (self.now, self.simulator.T_v)
+        timeout = self.timeout[rows]
+
+        at_cell = self.survivor_pos[rows] == cells[:, None]
+        state = self.survivor_state[rows]
+        (i, survivors) = np.nonzero(at_cell & (state == Simulator.MOVING))
+        self.survivor_state[rows[i], survivors] = Simulator.ASSISTING_DIRECTLY
+        self.survivor_due[rows[i], survivors] = now + timeout[i]
+
+        # The clock of a suffering survivor started at the init
+        (i, survivors) = np.nonzero(at_cell & (state == Simulator.SUFFERING))
+        saved = now + timeout[i] < T_v
+        self.survivor_state[rows[i], survivors] = Simulator.BEING_ASSISTED
+        self.survivor_due[rows[i], survivors] = np.where(saved, now + timeout[i], T_v)
+        self.survivor_outcome[rows[i], survivors] = np.where(saved, Simulator.SAFE, Simulator.DEAD)
+
+        at_cell = (self.first_resp_pos[rows] == cells[:, None]) & \
+            (self.first_resp_state[rows] == Simulator.AVAILABLE)
+        (i, first_resps) = np.nonzero(at_cell)
+        self.first_resp_state[rows[i], first_resps] = Simulator.ASSISTING
+        self.first_resp_due[rows[i], first_resps] = now + timeout[i]
+        self.first_resp_target[rows[i], first_resps] = self.target_in_need[rows[i]]
+        self.available_fr[rows] -= at_cell.sum(axis=1, dtype=np.int32)
+
+    def survivor_act(self, rows: np.ndarray, survivors: np.ndarray) -> None:
+        due = self.survivor_due[rows, survivors] <= self.now
+        (rows, survivors) = (rows[due], survivors[due])
+        state = self.survivor_state[rows, survivors]
+        pos = self.survivor_pos[rows, survivors]
+        simulator = self.simulator
+
+        moving = state == Simulator.MOVING
+        leaving = moving & simulator.near_exit_array[pos]
+        outcome = np.where(state == Simulator.BEING_ASSISTED,
+                           self.survivor_outcome[rows, survivors],
+                           np.where(state == Simulator.SUFFERING, Simulator.DEAD, Simulator.SAFE))
+        leaving |= ~moving
+        self.leave(rows[leaving], survivors[leaving], outcome[leaving])
+
+        moving &= ~leaving
+        (rows, survivors, pos) = (rows[moving], survivors[moving], pos[moving])
+        move = self.choose_moves(rows, pos, simulator.nearest_exit_array[pos], True,
+                                 simulator.survivors_policies_array[survivors])
+        moved = move >= 0
+        self.flat[rows[moved], pos[moved]] = CellType.EMPTY.value
+        self.flat[rows[moved], move[moved]] = CellType.SURVIVOR.value
+        self.survivor_pos[rows[moved], survivors[moved]] = move[moved]
+        self.survivor_due[rows, survivors] = self.now + 1
+
+    def leave(self, rows: np.ndarray, survivors: np.ndarray, outcome: np.ndarray) -> None:
+        pos = self.survivor_pos[rows, survivors]
+        empty = self.flat[rows, pos] != CellType.FIRST_RESP.value
+        self.flat[rows[empty], pos[empty]] = CellType.EMPTY.value
+        self.safe_survivors[rows] += outcome == Simulator.SAFE
+        self.dead_survivors[rows] += outcome == Simulator.DEAD
+        self.survivor_state[rows, survivors] = outcome
+        self.survivor_pos[rows, survivors] = 0
+        self.survivor_due[rows, survivors] = BatchSimulator.unset
+
+    def first_resp_act(self, rows: np.ndarray, first_resps: np.ndarray) -> None:
+        due = self.first_resp_due[rows, first_resps] <= self.now
+        (rows, first_resps) = (rows[due], first_resps[due])
+        state = self.first_resp_state[rows, first_resps]
+        pos = self.first_resp_pos[rows, first_resps]
+        simulator = self.simulator
+
+        # Takes the place of the assisted survivor
+        assisting = state == Simulator.ASSISTING
+        (a_rows, a_first_resps, a_pos) = (rows[assisting], first_resps[assisting], pos[assisting])
+        target = self.first_resp_target[a_rows, a_first_resps]
+        self.flat[a_rows, a_pos] = CellType.EMPTY.value
+        self.flat[a_rows, target] = CellType.FIRST_RESP.value
+        self.first_resp_pos[a_rows, a_first_resps] = target
+        self.first_resp_state[a_rows, a_first_resps] = Simulator.AVAILABLE
+        self.first_resp_target[a_rows, a_first_resps] = 0
+        self.first_resp_due[a_rows, a_first_resps] = self.now + 1
+        self.available_fr[a_rows] += 1
+
+        available = state == Simulator.AVAILABLE
+        (rows, first_resps, pos) = (rows[available], first_resps[available], pos[available])
+        done = self.finished(rows)
+        self.first_resp_state[rows[done], first_resps[done]] = Simulator.DONE
+        self.first_resp_pos[rows[done], first_resps[done]] = 0
+        self.first_resp_due[rows[done], first_resps[done]] = BatchSimulator.unset
+        (rows, first_resps, pos) = (rows[~done], first_resps[~done], pos[~done])
+
+        radius = simulator.radius_array[pos]
+        in_need = (radius >= 0) & (self.flat[rows[:, None], np.maximum(radius, 0)] ==
+                                   CellType.IN_NEED.value)
+        near = in_need.any(axis=1)
+        (n_rows, n_first_resps, n_pos) = (rows[near], first_resps[near], pos[near])
+        target = radius[near, np.argmax(in_need[near], axis=1)]
+        self.flat[n_rows, target] = CellType.ASSISTED.value
+        self.flat[n_rows, n_pos] = CellType.ASSISTING.value
+        self.available_fr[n_rows] -= 1
+        self.timeout[n_rows] = simulator.T_fr
+        self.first_resp_target[n_rows, n_first_resps] = target
+        self.set_timeout(n_rows, target)
+        self.first_resp_state[n_rows, n_first_resps] = Simulator.ASSISTING
+        self.first_resp_due[n_rows, n_first_resps] = self.now + simulator.T_fr
+
+        (rows, first_resps, pos) = (rows[~near], first_resps[~near], pos[~near])
+        target = self.nearest(rows, pos, CellType.IN_NEED.value, self.survivor_pos)
+        move = self.choose_moves(rows, pos, target, False,
+                                 simulator.first_resp_policies_array[first_resps])
+        moved = move >= 0
+        self.flat[rows[moved], pos[moved]] = CellType.EMPTY.value
+        self.flat[rows[moved], move[moved]] = CellType.FIRST_RESP.value
+        self.first_resp_pos[rows[moved], first_resps[moved]] = move[moved]
+        self.first_resp_due[rows, first_resps] = self.now + 1
+
+    # is_move_valid_g(): a uniform choice among the moves the policy allows,
+    # -1 where there is none
+    def choose_moves(self, rows: np.ndarray, pos: np.ndarray, target: np.ndarray,
+                     survivor: bool, policy: np.ndarray) -> np.ndarray:
+        simulator = self.simulator
+        moves = simulator.moves_array[pos]
+        cells = np.maximum(moves, 0)
+        feasible = (moves >= 0) & (self.flat[rows[:, None], cells] == CellType.EMPTY.value)
+        if survivor:
+            feasible &= ~simulator.near_fire_array[cells]
+
+        distances = np.where(feasible, simulator.distance(cells, target[:, None]), simulator.far)
+        best = feasible & (distances == distances.min(axis=1, keepdims=True))
+        (random_policy, multi_policy, single_policy) = simulator.policies
+        allowed = np.where((policy == random_policy)[:, None], feasible,
+                           np.where(np.isin(policy, [multi_policy, single_policy])[:, None],
+                                    best, False))
+
+        keys = np.where(allowed, self.random.random(allowed.shape), -1)
+        choice = np.where(policy == single_policy, np.argmax(allowed, axis=1),
+                          np.argmax(keys, axis=1))
+        return np.where(allowed.any(axis=1), cells[np.arange(len(rows)), choice], -1)
@@ -0,0 +1,155 @@
+from typing import Callable, TextIO
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+import timeit
+import numpy as np
+import PySide6
+
+from components.Enums import CellType
+from components.MapState import MapState
+from components.Model import ModelLayout
+from components.Scenario import ScenarioTemplate
+from components.Trace import TraceIndexer
+
+
+# Timings of named cases with their parameters. Every sample runs the case
+# enough times to last at least min_time, like timeit does, and the results
+# keep the statistics of the per call times so that runs can be compared later.
+class Benchmark():
+    def __init__(self, repeat: int = 5, min_time: float = 0.2, verbose: bool = True):
+        self.repeat = repeat
+        self.min_time = min_time
+        self.verbose = verbose
+        self.results: list[dict] = []
+
+    def measure(self, name: str, params: dict, function: Callable[[], object],
+                setup: Callable[[], object] | None = None, repeat: int | None = None) -> dict:
+        if setup is None:
+            timer = timeit.Timer(function, timer=time.perf_counter)
+            number = self.loops(timer)
+            samples = [total / number for total in timer.repeat(repeat or self.repeat, number)]
+        else:
+            # The setup runs untimed before every call, e.g. to clear a cache
+            number = 1
+            samples = []
+            for _ in range(repeat or self.repeat):
+                setup()
+                start = time.perf_counter()
+                function()
+                samples.append(time.perf_counter() - start)
+
+        result = {"name": name, "params": params, "loops": number,
+                  "min": min(samples), "median": statistics.median(samples),
+                  "mean": statistics.fmean(samples),
+                  "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0}
+        self.results.append(result)
+        if self.verbose:
+            print(f"{name} {Benchmark.format_params(params)}: {Benchmark.format_time(result['median'])} "
+                  f"(min {Benchmark.format_time(result['min'])}, {number} loops)")
+        return result
+
+    # Calls per sample, growing by ten until a sample takes min_time
+    def loops(self, timer: timeit.Timer) -> int:
+        number = 1
+        while True:
+            if timer.timeit(number) >= self.min_time / self.repeat or number >= 1 << 20:
+                return number
+            number *= 10
+
+    def format_params(params: dict) -> str:
+        return " ".join(f"{name}={value}" for (name, value) in params.items())
+
+    def format_time(seconds: float) -> str:
+        for (unit, scale) in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+            if seconds >= scale:
+                return f"{seconds / scale:.3f} {unit}"
+        return f"{seconds / 1e-9:.1f} ns"
+
+    def environment() -> dict:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+                "python": platform.python_version(), "numpy": np.__version__,
+                "pyside6": PySide6.__version__, "platform": platform.platform(),
+                "processor": platform.processor()}
+
+    def save(self, output_file: str, options: dict) -> None:
+        with open(output_file, "w") as file:
+            json.dump({"environment": Benchmark.environment(), "options": options,
+                       "results": self.results}, file, indent=2)
+
+    # Previous and current median times of the cases measured in both runs
+    def compare(self, previous_file: str) -> list[tuple[str, str, float, float]]:
+        with open(previous_file) as file:
+            previous = {(result["name"], Benchmark.format_params(result["params"])): result["median"]
+                        for result in json.load(file)["results"]}
+        return [(result["name"], Benchmark.format_params(result["params"]),
+                 previous[key], result["median"])
+                for result in self.results
+                if (key := (result["name"], Benchmark.format_params(result["params"]))) in previous]
+
+
+# Random scenarios of any size for the benchmarks, reproducible from a seed:
+# a map with about the density of entities of the example maps, the model of
+# that map generated from a base model and traces of random walks over it
+class SyntheticScenario():
+    fire_density = 0.1
+    entity_cells = {CellType.SURVIVOR: 50, CellType.FIRST_RESP: 200, CellType.DRONE: 100}
+    exits = 2
+
+    def __init__(self, base_model_file: str, N_COLS: int, N_ROWS: int, seed: int = 0):
+        self.random = np.random.default_rng(seed)
+        self.map = self.random_map(N_COLS, N_ROWS)
+        self.model = ScenarioTemplate(base_model_file).generate(self.map)
+        self.layout = ModelLayout(self.model_file_object())
+
+    def model_file_object(self) -> TextIO:
+        return io.StringIO(self.model)
+
+    def random_map(self, N_COLS: int, N_ROWS: int) -> MapState:
+        cells = N_COLS * N_ROWS
+        map = MapState.empty(N_COLS, N_ROWS)
+
+        order = self.random.permutation(cells)
+        counts = [(CellType.EXIT, self.exits), (CellType.FIRE, int(cells * self.fire_density))]
+        counts += [(entity, max(1, cells // per_entity))
+                   for (entity, per_entity) in self.entity_cells.items() if entity != CellType.DRONE]
+        start = 0
+        for (entity, count) in counts:
+            map.cells.reshape(-1)[order[start:start + count]] = entity.value
+            start += count
+
+        drones = max(1, cells // self.entity_cells[CellType.DRONE])
+        map.drones.reshape(-1)[self.random.choice(cells, drones, replace=False)] = 1
+        return map
+
+    # States that start from the map and change a few cells at every step,
+    # written in the format read by XtrReader, without transitions
+    def write_trace(self, trace_file: str, steps: int, changes: int = 4) -> None:
+        indexer = TraceIndexer(self.map.N_COLS, self.map.N_ROWS, self.layout.variables)
+        values = np.zeros(len(self.layout.variables), dtype=np.int64)
+        values[indexer.cell_slots] = self.map.cells.reshape(-1)[indexer.cell_index]
+        values[indexer.drone_slots] = self.map.drones.reshape(-1)[indexer.drone_index]
+
+        locations = "0\n" * len(self.layout.processes) + ".\n.\n"
+        with open(trace_file, "w") as file:
+            for _ in range(steps):
+                file.write(locations)
+                file.write("\n".join(map(str, values.tolist())))
+                file.write("\n.\n")
+
+                slots = self.random.choice(indexer.cell_slots, changes)
+                values[slots] = self.random.choice(
+                    [CellType.EMPTY.value, CellType.SURVIVOR.value, CellType.IN_NEED.value], changes)
+            file.write(".\n")
+
+    def write_model(self, model_file: str) -> None:
+        with open(model_file, "w") as file:
+            file.write(self.model)
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+from components.Enums import CellType
+from components.MapState import MapState
+
+
+# Distance from every cell to the nearest target cell and which target that
+# is, so that nearest target queries are lookups. The "chebyshev" metric is
+# the direct path distance() of the model, that ignores obstacles, while the
+# "bfs" one counts the 8-connected moves through passable cells. Among equally
+# near targets the first one in the order of MapState.positions() is kept, as
+# find_nearest_exit() does for the exits of a generated model.
+#
+# Fields are computed as a wavefront over the whole grid, each step being a
+# vectorized relaxation from the 8 neighbours of the cells improved by the
+# previous one. Updates only restart the wavefront where targets appeared or
+# disappeared, unless the obstacles changed, and complete fields are cached
+# by content so that maps sharing targets share their fields.
+class DistanceField():
+    unreachable = np.iinfo(np.int32).max
+    cache: OrderedDict[bytes, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+    cache_size = 64
+
+    offsets = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1) if (i, j) != (0, 0)]
+
+    def __init__(self, targets: np.ndarray, passable: np.ndarray | None = None):
+        self.targets = np.asarray(targets, dtype=bool).copy()
+        self.passable = None if passable is None else np.asarray(passable, dtype=bool).copy()
+        self.compute()
+
+    @property
+    def N_COLS(self) -> int:
+        return self.targets.shape[0]
+
+    @property
+    def N_ROWS(self) -> int:
+        return self.targets.shape[1]
+
+    def key(self) -> bytes:
+        digest = hashlib.sha1(np.packbits(self.targets).tobytes())
+        digest.update(np.array(self.targets.shape).tobytes())
+        if self.passable is not None:
+            digest.update(np.packbits(self.passable).tobytes())
+        return digest.digest()
+
+    def compute(self) -> None:
+        key = self.key()
+        if key in DistanceField.cache:
+            DistanceField.cache.move_to_end(key)
+            (distance, nearest) = DistanceField.cache[key]
+            self.distance = distance.copy()
+            self.nearest = nearest.copy()
+            return
+
+        self.distance = np.where(self.targets, 0, self.unreachable).astype(np.int32)
+        self.nearest = np.where(self.targets, np.arange(self.targets.size).reshape(self.targets.shape),
+                                -1).astype(np.int32)
+        self.propagate(self.targets.copy())
+        self.store(key)
+
+    def store(self, key: bytes) -> None:
+        DistanceField.cache[key] = (self.distance.copy(), self.nearest.copy())
+        DistanceField.cache.move_to_end(key)
+        while len(DistanceField.cache) > self.cache_size:
+            DistanceField.cache.popitem(last=False)
+
+    # Relaxes the neighbours of the frontier until nothing improves, working
+    # on the bounding box of the frontier grown by one cell at each step
+    def propagate(self, frontier: np.ndarray) -> None:
+        (N_COLS, N_ROWS) = self.targets.shape
+        while frontier.any():
+            (xs, ys) = np.nonzero(frontier)
+            (x1, x2) = (max(xs.min() - 1, 0), min(xs.max() + 2, N_COLS))
+            (y1, y2) = (max(ys.min() - 1, 0), min(ys.max() + 2, N_ROWS))
+
+            # The box with a border of one cell, out of the map where missing
+            (px1, px2, py1, py2) = (x1 - 1, x2 + 1, y1 - 1, y2 + 1)
+            distance = np.full((px2 - px1, py2 - py1), self.unreachable, dtype=np.int64)
+            nearest = np.full(distance.shape, -1, dtype=np.int32)
+            sources = np.zeros(distance.shape, dtype=bool)
+            (sx1, sy1) = (max(px1, 0), max(py1, 0))
+            (sx2, sy2) = (min(px2, N_COLS), min(py2, N_ROWS))
+            inner = (slice(sx1 - px1, sx2 - px1), slice(sy1 - py1, sy2 - py1))
+            distance[inner] = self.distance[sx1:sx2, sy1:sy2]
+            nearest[inner] = self.nearest[sx1:sx2, sy1:sy2]
+            sources[inner] = frontier[sx1:sx2, sy1:sy2]
+
+            (width, height) = (x2 - x1, y2 - y1)
+            best_distance = np.full((width, height), self.unreachable, dtype=np.int64)
+            best_nearest = np.full((width, height), -1, dtype=np.int32)
+            for (i, j) in self.offsets:
+                window = (slice(1 + i, 1 + i + width), slice(1 + j, 1 + j + height))
+                candidate = np.where(sources[window], distance[window] + 1, self.unreachable)
+                label = nearest[window]
+                better = (candidate < best_distance) | \
+                    ((candidate == best_distance) & (label < best_nearest))
+                best_distance = np.where(better, candidate, best_distance)
+                best_nearest = np.where(better, label, best_nearest)
+
+            current = self.distance[x1:x2, y1:y2]
+            labels = self.nearest[x1:x2, y1:y2]
+            improved = (best_distance < current) | \
+                ((best_distance == current) & (best_nearest >= 0) & (best_nearest < labels))
+            if self.passable is not None:
+                improved &= self.passable[x1:x2, y1:y2]
+
+            current[improved] = best_distance[improved]
+            labels[improved] = best_nearest[improved]
+            frontier = np.zeros_like(frontier)
+            frontier[x1:x2, y1:y2] = improved
+
+    # Applies the new targets and passable cells of the given area
+    def update(self, targets: np.ndarray, passable: np.ndarray | None,
+               top_left: tuple[int, int], bottom_right: tuple[int, int]) -> None:
+        ((x1, y1), (x2, y2)) = top_left, bottom_right
+        area = (slice(x1, x2 + 1), slice(y1, y2 + 1))
+        targets = np.asarray(targets, dtype=bool)
+
+        if passable is not None and not np.array_equal(self.passable[area], passable):
+            # Paths may go around the new obstacles anywhere
+            self.targets[area] = targets
+            self.passable[area] = passable
+            self.compute()
+            return
+
+        removed = self.targets[area] & ~targets
+        added = targets & ~self.targets[area]
+        if not removed.any() and not added.any():
+            return
+        self.targets[area] = targets
+
+        # Undoing an edit usually goes back to known targets
+        key = self.key()
+        if key in DistanceField.cache:
+            self.compute()
+            return
+
+        # Cells that were nearest to a removed target are recomputed from
+        # their neighbours that are still valid
+        flat = np.arange(self.targets.size).reshape(self.targets.shape)
+        invalid = np.isin(self.nearest, flat[area][removed])
+        self.distance[invalid] = self.unreachable
+        self.nearest[invalid] = -1
+
+        frontier = np.zeros_like(self.targets)
+        if invalid.any():
+            border = np.zeros((self.N_COLS + 2, self.N_ROWS + 2), dtype=bool)
+            for (i, j) in self.offsets + [(0, 0)]:
+                border[1 + i:1 + i + self.N_COLS, 1 + j:1 + j + self.N_ROWS] |= invalid
+            frontier = border[1:-1, 1:-1] & ~invalid & (self.distance < self.unreachable)
+
+        self.distance[area][added] = 0
+        self.nearest[area][added] = flat[area][added]
+        frontier[area] |= added
+        self.propagate(frontier)
+        self.store(key)
+
+    def distance_at(self, pos: tuple[int, int]) -> int | None:
+        distance = int(self.distance[pos])
+        return None if distance == self.unreachable else distance
+
+    def nearest_at(self, pos: tuple[int, int]) -> tuple[int, int] | None:
+        nearest = int(self.nearest[pos])
+        return None if nearest < 0 else divmod(nearest, self.N_ROWS)
+
+
+# The distance fields of a map: exits, fires and survivors, whatever state
+# the survivors are in. With the "bfs" metric fires are the obstacles.
+class DistanceFields():
+    kinds = {
+        CellType.EXIT: [CellType.EXIT],
+        CellType.FIRE: [CellType.FIRE],
+        CellType.SURVIVOR: MapState.actor_states[CellType.SURVIVOR],
+    }
+    obstacles = [CellType.FIRE]
+
+    def __init__(self, map: MapState, metric: str = "chebyshev"):
+        if metric not in ["chebyshev", "bfs"]:
+            raise ValueError(f"Unknown metric {metric}")
+        self.metric = metric
+
+        passable = self.passable(map.cells)
+        self.fields = {kind: DistanceField(self.targets(map.cells, kind), passable)
+                       for kind in self.kinds}
+
+    def targets(self, cells: np.ndarray, kind: CellType) -> np.ndarray:
+        return np.isin(cells, [state.value for state in self.kinds[kind]])
+
+    def passable(self, cells: np.ndarray) -> np.ndarray | None:
+        if self.metric == "chebyshev":
+            return None
+        return ~np.isin(cells, [obstacle.value for obstacle in self.obstacles])
+
+    # Follows an edit of the given area of the map
+    def update(self, map: MapState, top_left: tuple[int, int], bottom_right: tuple[int, int]) -> None:
+        ((x1, y1), (x2, y2)) = top_left, bottom_right
+        cells = map.cells[x1:x2 + 1, y1:y2 + 1]
+        passable = self.passable(cells)
+        for (kind, field) in self.fields.items():
+            field.update(self.targets(cells, kind), passable, top_left, bottom_right)
+
+    def distance(self, kind: CellType, pos: tuple[int, int]) -> int | None:
+        return self.fields[kind].distance_at(pos)
+
+    def nearest(self, kind: CellType, pos: tuple[int, int]) -> tuple[int, int] | None:
+        return self.fields[kind].nearest_at(pos)
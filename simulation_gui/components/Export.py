@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from collections import deque
+from os import path
+from typing import Iterator, TextIO
+import os
+import subprocess
+import numpy as np
+from PySide6.QtWidgets import QApplication
+
+from components.Map import MapWidget
+from components.Model import ModelLayout
+from components.Trace import TraceIndexer
+from components.Xtr import XtrReader
+
+
+# Renders the states of traces to image files without showing any window.
+# Frames are drawn by a MapWidget in worker processes running the offscreen Qt
+# platform, so they are the same pixels the trace visualizer shows. Every
+# worker draws a chunk of consecutive steps with a single widget, which then
+# repaints only the cells that change from one step to the next, as in the GUI.
+class TraceExporter():
+    frame_name = "frame_%06d.png"
+
+    # Application and widgets of each worker process, by map size and cell size
+    application = None
+    widgets = {}
+
+    def __init__(self, model_file: str | TextIO, N_COLS: int, N_ROWS: int, PIXELS_PER_CELL: int = 50,
+                 workers: int | None = None, chunk_size: int = 64, every: int = 1):
+        self.layout = ModelLayout(model_file)
+        self.indexer = TraceIndexer(N_COLS, N_ROWS, self.layout.variables)
+        self.size = (N_COLS, N_ROWS, PIXELS_PER_CELL)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.every = every
+
+    # Writes the selected states of the trace as numbered PNG files in the
+    # directory and returns the number of frames
+    def export_frames(self, trace_file: TextIO, directory: str) -> int:
+        os.makedirs(directory, exist_ok=True)
+
+        frames = 0
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=TraceExporter.start_worker) as executor:
+            # A few chunks in flight per worker bound the decoded states in memory
+            pending: deque[Future] = deque()
+            for (first, states) in self.chunks(trace_file):
+                pending.append(executor.submit(
+                    TraceExporter.render_chunk, self.size, self.indexer, states,
+                    path.join(directory, self.frame_name), first))
+                if len(pending) >= self.workers * 2:
+                    frames += pending.popleft().result()
+            while pending:
+                frames += pending.popleft().result()
+        return frames
+
+    # Writes the trace as a GIF or MP4 file, depending on its extension,
+    # encoding the frames with ffmpeg
+    def export_video(self, trace_file: TextIO, output_file: str, fps: int = 10,
+                     ffmpeg: str = "ffmpeg") -> int:
+        directory = path.splitext(output_file)[0] + "_frames"
+        frames = self.export_frames(trace_file, directory)
+
+        command = [ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                   "-i", path.join(directory, self.frame_name)]
+        if output_file.endswith(".gif"):
+            # A palette computed from the frames keeps the colors exact
+            command += ["-filter_complex", "split[a][b];[a]palettegen=reserve_transparent=0[p];[b][p]paletteuse"]
+        else:
+            # H.264 requires even sizes, the widget is one pixel larger than the cells
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p"]
+        command.append(output_file)
+
+        try:
+            subprocess.run(command, check=True)
+        except FileNotFoundError:
+            raise RuntimeError(f"Unable to run {ffmpeg}, the frames are in {directory}")
+        return frames
+
+    # Consecutive selected states, with the index of the first one
+    def chunks(self, trace_file: TextIO) -> Iterator[tuple[int, np.ndarray]]:
+        (first, states) = (0, [])
+        for (step, state) in enumerate(XtrReader(trace_file, self.layout)):
+            if step % self.every:
+                continue
+            if not states:
+                first = step // self.every
+            states.append(state)
+            if len(states) == self.chunk_size:
+                yield (first, np.vstack(states))
+                states = []
+        if states:
+            yield (first, np.vstack(states))
+
+    def start_worker() -> None:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+        if QApplication.instance() is None:
+            TraceExporter.application = QApplication([])
+
+    def render_chunk(size: tuple[int, int, int], indexer: TraceIndexer, states: np.ndarray,
+                     name: str, first: int) -> int:
+        if size not in TraceExporter.widgets:
+            TraceExporter.widgets[size] = MapWidget(*size)
+        widget = TraceExporter.widgets[size]
+
+        widget.clear()
+        for (i, state) in enumerate(states):
+            widget.draw_map(indexer.gather(state))
+            if not widget.render_frame().save(name % (first + i)):
+                raise RuntimeError(f"Unable to write {name % (first + i)}")
+        return len(states)
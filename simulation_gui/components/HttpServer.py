@@ -1,32 +1,140 @@
-from typing import Any
-from PySide6.QtWidgets import QApplication
-from PySide6.QtHttpServer import QHttpServer, QHttpServerRequest, QHttpServerResponse, QHttpServerResponder
-from PySide6.QtNetwork import QHostAddress
-from PySide6.QtCore import Signal, Slot, QObject, QJsonDocument
-from PySide6.QtWidgets import QMainWindow
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlsplit
+from PySide6.QtCore import Signal, Slot, QObject, QJsonDocument, QTimer
 
+from components.MapState import MapState
+from components.Wire import StateDecoder, MissingBaseState
 
+
+# Latest-wins ingestion of the posted map states: the states are decoded when
+# received, so that a malformed body is answered with 400, and only the newest
+# one is drawn on each frame of the timer, dropping the states that were
+# superseded in between. Binary states have to be decoded in order anyway, as
+# deltas apply to the previous state, and JSON is kept for the other content
+# types. States are received from the threads of the server and drawn from the
+# Qt thread, hence the lock.
 class MapStateHandler():
     on_new_map_state: Slot = None
 
-    def __init__(self, on_new_map_state: Slot):
+    def __init__(self, on_new_map_state: Slot, fps: int = 30):
         self.on_new_map_state = on_new_map_state
+        self.pending: MapState | None = None
+        self.decoder = StateDecoder()
+        self.lock = Lock()
+
+        self.received = 0
+        self.dropped = 0
+        self.rendered = 0
+
+        self.timer = QTimer()
+        self.timer.setInterval(max(1, round(1000 / fps)))
+        self.timer.timeout.connect(self.render)
+
+    # Stores a posted body, separate from the request so that it can be fed
+    # without a server
+    def receive(self, content_type: str, body: bytes) -> HTTPStatus:
+        with self.lock:
+            return self.store(content_type, body)
+
+    def store(self, content_type: str, body: bytes) -> HTTPStatus:
+        if content_type.split(";")[0].strip() == StateDecoder.content_type:
+            try:
+                state = self.decoder.decode(body)
+            except MissingBaseState:
+                # Dropped until the next full state, which the sender also
+                # sends right away when it gets the conflict
+                self.received += 1
+                self.dropped += 1
+                return HTTPStatus.CONFLICT
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST
+        else:
+            try:
+                state = MapState.from_json(QJsonDocument.fromJson(body).object())
+            except (KeyError, ValueError, TypeError, OverflowError):
+                return HTTPStatus.BAD_REQUEST
+            if state.cells.ndim != 2 or state.drones.shape != state.cells.shape:
+                return HTTPStatus.BAD_REQUEST
+            # Deltas cannot follow a state that the decoder has not seen
+            self.decoder.reset()
+
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = state
+        self.received += 1
+        return HTTPStatus.OK
+
+    @Slot()
+    def render(self) -> None:
+        with self.lock:
+            state = self.pending
+            self.pending = None
+            if state is None:
+                return
+            # The decoder keeps updating its state with the next deltas
+            state = self.parse(state)
+        self.on_new_map_state(state)
+        self.rendered += 1
+
+    def parse(self, state: MapState) -> MapState:
+        return state.copy()
 
-    def __call__(self, request: QHttpServerRequest) -> QHttpServerResponse:
-        json = QJsonDocument.fromJson(request.body())
-        self.on_new_map_state(json.object())
-        return QHttpServerResponse(QHttpServerResponder.StatusCode.Ok)
+    def stats(self) -> str:
+        return f"{self.received} states received, {self.dropped} dropped, {self.rendered} rendered"
 
 
+# HTTP/1.1 requests of a connection kept alive by the sender, each state being
+# answered with the status of its decoding and an empty body
+class StateRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/state":
+            self.send_status(HTTPStatus.NOT_FOUND)
+            return
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.send_status(HTTPStatus.LENGTH_REQUIRED)
+            return
+
+        body = self.rfile.read(int(length))
+        self.send_status(self.server.handler.receive(self.headers.get("Content-Type", ""), body))
+
+    def send_status(self, status: HTTPStatus) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    # One line per state would flood the terminal
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+# The states are received on the threads of a standard library server rather
+# than through QHttpServer, whose Python route() sends every response with the
+# 200 status: the sender needs the 400 and 409 statuses to resync
 class HttpServer(QObject):
     server = None
 
     on_map_request = None
 
-    def __init__(self, on_new_map_state: Signal):
-        self.server = QHttpServer()
-        self.on_map_request = MapStateHandler(on_new_map_state)
+    def __init__(self, on_new_map_state: Signal, fps: int = 30, address: str = "", port: int = 5000):
+        self.address = address
+        self.port = port
+        self.on_map_request = MapStateHandler(on_new_map_state, fps)
 
     def start(self) -> None:
-        self.server.listen(QHostAddress.SpecialAddress.Any, 5000)
-        self.server.route("/state", self.on_map_request)
+        self.server = ThreadingHTTPServer((self.address, self.port), StateRequestHandler)
+        self.server.daemon_threads = True
+        self.server.handler = self.on_map_request
+        # The port chosen by the system when it was 0
+        self.port = self.server.server_address[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.on_map_request.timer.start()
+
+    def stop(self) -> None:
+        self.on_map_request.timer.stop()
+        self.server.shutdown()
+        self.server.server_close()
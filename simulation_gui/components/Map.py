@@ -1,15 +1,25 @@
-from PySide6.QtWidgets import QLabel
-from PySide6.QtGui import QPainter, QPixmap, QColorConstants, QGuiApplication, QMouseEvent
-from PySide6.QtCore import QRect, QSize, Qt, Slot, QJsonArray, QJsonDocument, QFile, QIODeviceBase, QDir
+from PySide6.QtWidgets import QWidget
+from PySide6.QtGui import QImage, QPainter, QPixmap, QColorConstants, QGuiApplication, QMouseEvent, QPaintEvent
+from PySide6.QtCore import QRect, QSize, Qt, Slot, QJsonDocument, QFile, QIODeviceBase, QDir
 
+from components.DistanceField import DistanceFields
 from components.Enums import CellType, CellColor
-from copy import deepcopy
+from components.MapState import MapState
+from components.Scenario import ScenarioTemplate
+import numpy as np
 
 from os import path
+from collections import deque
+from typing import TextIO
 
 
-class MapWidget(QLabel):
-    assets = {}
+# The map is drawn in three layers: a static background with the grid, cached
+# per map size, a transparent sprite layer holding the entities, and the widget
+# itself which composites the two only over the regions that changed. Sprites
+# are blitted from an atlas built once per cell size and shared by all widgets.
+class MapWidget(QWidget):
+    backgrounds: dict[tuple[int, int, int], QPixmap] = {}
+    atlases: dict[int, tuple[QPixmap, dict[CellType, QRect]]] = {}
 
     def __init__(self, N_COLS: int, N_ROWS: int, PIXELS_PER_CELL: int = 50):
         super().__init__()
@@ -23,127 +33,242 @@ class MapWidget(QLabel):
         window_size = QSize(N_COLS * PIXELS_PER_CELL + 1,
                             N_ROWS * PIXELS_PER_CELL + 1)
         self.setFixedSize(window_size)
-        canvas = QPixmap(window_size)
-        canvas.fill(QColorConstants.White)
-        self.setPixmap(canvas)
+        self.sprites = QPixmap(window_size)
 
         self.load_assets()
+        self.draw_grid()
         self.clear()
 
     def load_assets(self) -> None:
+        if self.PIXELS_PER_CELL in MapWidget.atlases:
+            (self.atlas, self.assets) = MapWidget.atlases[self.PIXELS_PER_CELL]
+            return
+
+        assets = {}
+
         asset = QPixmap(self.PIXELS_PER_CELL, self.PIXELS_PER_CELL)
         asset.fill(CellColor.FIRE.value)
-        self.assets[CellType.FIRE] = asset
+        assets[CellType.FIRE] = asset
 
         asset = QPixmap(self.PIXELS_PER_CELL, self.PIXELS_PER_CELL)
         asset.fill(CellColor.EXIT.value)
-        self.assets[CellType.EXIT] = asset
+        assets[CellType.EXIT] = asset
+
+        # Each image is read once, the labelled variants paint over copies
+        images = {}
 
-        asset = QPixmap("assets/first_responder_50.png")
-        self.assets[CellType.FIRST_RESP] = asset
+        def image(file_name: str) -> QPixmap:
+            if file_name not in images:
+                images[file_name] = QPixmap(file_name)
+            return images[file_name].copy()
 
-        asset = QPixmap("assets/first_responder_50.png")
+        asset = image("assets/first_responder_50.png")
+        assets[CellType.FIRST_RESP] = asset
+
+        asset = image("assets/first_responder_50.png")
         painter = QPainter(asset)
         text_rect = QRect(self.PIXELS_PER_CELL * 3/4, self.PIXELS_PER_CELL *
                           2/3, self.PIXELS_PER_CELL * 1/4, self.PIXELS_PER_CELL * 1/3)
         painter.drawText(text_rect, "A")
         painter.end()
-        self.assets[CellType.ASSISTING] = asset
+        assets[CellType.ASSISTING] = asset
 
-        asset = QPixmap("assets/survivor_50.png")
-        self.assets[CellType.SURVIVOR] = asset
+        asset = image("assets/survivor_50.png")
+        assets[CellType.SURVIVOR] = asset
 
-        asset = QPixmap("assets/survivor_50.png")
+        asset = image("assets/survivor_50.png")
         painter = QPainter(asset)
         text_rect = QRect(self.PIXELS_PER_CELL * 3/4, self.PIXELS_PER_CELL *
                           2/3, self.PIXELS_PER_CELL * 1/4, self.PIXELS_PER_CELL * 1/3)
         painter.drawText(text_rect, "Z")
         painter.end()
-        self.assets[CellType.ZERO_RESP] = asset
+        assets[CellType.ZERO_RESP] = asset
 
-        asset = QPixmap("assets/in_need_50.png")
-        self.assets[CellType.IN_NEED] = asset
+        asset = image("assets/in_need_50.png")
+        assets[CellType.IN_NEED] = asset
 
-        asset = QPixmap("assets/in_need_50.png")
+        asset = image("assets/in_need_50.png")
         painter = QPainter(asset)
         text_rect = QRect(self.PIXELS_PER_CELL * 3/4, self.PIXELS_PER_CELL *
                           2/3, self.PIXELS_PER_CELL * 1/4, self.PIXELS_PER_CELL * 1/3)
         painter.drawText(text_rect, "A")
         painter.end()
-        self.assets[CellType.ASSISTED] = asset
+        assets[CellType.ASSISTED] = asset
+
+        asset = image("assets/drone_50.png")
+        assets[CellType.DRONE] = asset
+
+        # Pack all the assets side by side in a single atlas
+        self.atlas = QPixmap(sum(asset.width() for asset in assets.values()),
+                             max(asset.height() for asset in assets.values()))
+        self.atlas.fill(Qt.GlobalColor.transparent)
+        self.assets = {}
+
+        painter = QPainter(self.atlas)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        x = 0
+        for (cell_type, asset) in assets.items():
+            painter.drawPixmap(x, 0, asset)
+            self.assets[cell_type] = QRect(x, 0, asset.width(), asset.height())
+            x += asset.width()
+        painter.end()
 
-        asset = QPixmap("assets/drone_50.png")
-        self.assets[CellType.DRONE] = asset
+        MapWidget.atlases[self.PIXELS_PER_CELL] = (self.atlas, self.assets)
 
     def draw_grid(self) -> None:
-        canvas = self.pixmap()
-        painter = QPainter(canvas)
+        key = (self.N_COLS, self.N_ROWS, self.PIXELS_PER_CELL)
+        if key not in MapWidget.backgrounds:
+            background = QPixmap(self.size())
+            background.fill(QColorConstants.White)
+            painter = QPainter(background)
 
-        for x in range(0, self.N_COLS+1):
-            for y in range(0, self.N_ROWS+1):
+            for x in range(0, self.N_COLS+1):
                 painter.drawLine(x * self.PIXELS_PER_CELL, 0, x *
                                  self.PIXELS_PER_CELL, self.N_ROWS * self.PIXELS_PER_CELL - 1)
+            for y in range(0, self.N_ROWS+1):
                 painter.drawLine(0, y * self.PIXELS_PER_CELL, self.N_COLS *
                                  self.PIXELS_PER_CELL - 1, y * self.PIXELS_PER_CELL)
 
-        painter.end()
-        self.setPixmap(canvas)
+            painter.end()
+            MapWidget.backgrounds[key] = background
+
+        self.background = MapWidget.backgrounds[key]
 
     def clear(self) -> None:
-        canvas = QPixmap(self.size())
-        canvas.fill(QColorConstants.White)
-        self.setPixmap(canvas)
-        self.draw_grid()
+        self.sprites.fill(Qt.GlobalColor.transparent)
+        self.update()
+
+        # What is currently drawn in each cell, used to repaint only the
+        # cells that change between two frames
+        self.drawn_cells = np.zeros((self.N_COLS, self.N_ROWS), dtype=np.uint8)
+        self.drawn_drones = np.zeros((self.N_COLS, self.N_ROWS), dtype=bool)
+        self.drawn_labels: dict[tuple[int, int], list[str]] = {}
+
+    def paintEvent(self, event: QPaintEvent) -> None:
+        painter = QPainter(self)
+        for rect in event.region():
+            painter.drawPixmap(rect, self.background, rect)
+            painter.drawPixmap(rect, self.sprites, rect)
+        painter.end()
+
+    # The widget content as painted, without going through the event loop
+    def render_frame(self) -> QImage:
+        frame = QImage(self.size(), QImage.Format.Format_RGB32)
+        painter = QPainter(frame)
+        painter.drawPixmap(0, 0, self.background)
+        painter.drawPixmap(0, 0, self.sprites)
+        painter.end()
+        return frame
+
+    def cell_rect(self, x: int, y: int) -> QRect:
+        return QRect(x * self.PIXELS_PER_CELL + 1, y * self.PIXELS_PER_CELL + 1,
+                     self.PIXELS_PER_CELL - 1, self.PIXELS_PER_CELL - 1)
 
-    def draw_cell(self, cell_type: CellType, x: int, y: int) -> None:
-        canvas = self.pixmap()
-        painter = QPainter(canvas)
+    def draw_cell(self, painter: QPainter, cell_type: CellType, x: int, y: int) -> None:
+        painter.drawPixmap(self.cell_rect(x, y), self.atlas,
+                           self.assets[cell_type])
 
-        target_rect = QRect(x * self.PIXELS_PER_CELL + 1, y * self.PIXELS_PER_CELL + 1,
-                            self.PIXELS_PER_CELL - 1, self.PIXELS_PER_CELL - 1)
-        painter.drawPixmap(target_rect, self.assets[cell_type].copy())
+    def draw_index(self, painter: QPainter, index: str, x: int, y: int) -> None:
+        target_rect = QRect(x * self.PIXELS_PER_CELL + 1 + self.PIXELS_PER_CELL * 3/4, y * self.PIXELS_PER_CELL + 1,
+                            self.PIXELS_PER_CELL * 1/4, self.PIXELS_PER_CELL * 1/3)
+        painter.drawText(target_rect, index)
+
+    def map_labels(self, map: MapState) -> dict[tuple[int, int], list[str]]:
+        labels = {}
+        for positions in [map.first_responders, map.survivors]:
+            for idx, (x, y) in enumerate(positions or []):
+                if 0 <= x < self.N_COLS and 0 <= y < self.N_ROWS:
+                    labels.setdefault((x, y), []).append(f"{idx}")
+        return labels
+
+    @Slot()
+    def draw_map(self, map: MapState) -> None:
+        self.draw_region(map.cells[:self.N_COLS, :self.N_ROWS],
+                         map.drones[:self.N_COLS, :self.N_ROWS],
+                         self.map_labels(map), (0, 0))
+
+    # Draws the given cells and drones with their top left corner at origin,
+    # repainting only the cells that differ from the last drawn frame
+    def draw_region(self, cells: np.ndarray, drones: np.ndarray, labels: dict[tuple[int, int], list[str]],
+                    origin: tuple[int, int]) -> None:
+        (x0, y0) = origin
+        (width, height) = cells.shape
+        drawn_cells = self.drawn_cells[x0:x0 + width, y0:y0 + height]
+        drawn_drones = self.drawn_drones[x0:x0 + width, y0:y0 + height]
+        drones = drones != 0
+
+        def in_region(pos: tuple[int, int]) -> bool:
+            return x0 <= pos[0] < x0 + width and y0 <= pos[1] < y0 + height
+
+        labels = {pos: label for (pos, label) in labels.items()
+                  if in_region(pos)}
+        drawn_labels = {pos: label for (pos, label) in self.drawn_labels.items()
+                        if in_region(pos)}
+
+        # Find the cells that differ from the last drawn frame
+        dirty = (cells != drawn_cells) | (drones != drawn_drones)
+        for pos in labels.keys() | drawn_labels.keys():
+            if labels.get(pos) != drawn_labels.get(pos):
+                dirty[pos[0] - x0, pos[1] - y0] = True
+
+        if not dirty.any():
+            return
+
+        painter = QPainter(self.sprites)
+
+        for (i, j) in np.argwhere(dirty).tolist():
+            (x, y) = (x0 + i, y0 + j)
+            painter.setCompositionMode(
+                QPainter.CompositionMode.CompositionMode_Source)
+            painter.fillRect(self.cell_rect(x, y), Qt.GlobalColor.transparent)
+            painter.setCompositionMode(
+                QPainter.CompositionMode.CompositionMode_SourceOver)
+            if cells[i, j] != CellType.EMPTY.value:
+                self.draw_cell(painter, CellType(int(cells[i, j])), x, y)
+            if drones[i, j]:
+                self.draw_cell(painter, CellType.DRONE, x, y)
+            for index in labels.get((x, y), []):
+                self.draw_index(painter, index, x, y)
+            self.update(self.cell_rect(x, y))
 
         painter.end()
-        self.setPixmap(canvas)
 
-    def draw_cells(self, cells: QJsonArray) -> None:
-        for x in range(self.N_COLS):
-            for y in range(self.N_ROWS):
-                if cells[x][y] != CellType.EMPTY.value:
-                    self.draw_cell(CellType(cells[x][y]), x, y)
+        drawn_cells[:] = cells
+        drawn_drones[:] = drones
+        for pos in drawn_labels:
+            del self.drawn_labels[pos]
+        self.drawn_labels.update(labels)
 
-    def draw_drones(self, drones: QJsonArray) -> None:
-        for x in range(self.N_COLS):
-            for y in range(self.N_ROWS):
-                if drones[x][y]:
-                    self.draw_cell(CellType.DRONE, x, y)
 
-    def draw_indexes(self, indexes: QJsonArray) -> None:
-        for idx, (x, y) in enumerate(indexes):
-            canvas = self.pixmap()
-            painter = QPainter(canvas)
+# An edit of the map, stored as the edited rectangle with the tool applied to it
+# and the previous content of the rectangle, so that it can be undone and redone
+class MapEdit():
+    def __init__(self, map: MapState, tool: CellType, top_left: tuple[int, int], bottom_right: tuple[int, int]):
+        self.tool = tool
+        self.top_left = top_left
+        self.bottom_right = bottom_right
 
-            target_rect = QRect(x * self.PIXELS_PER_CELL + 1 + self.PIXELS_PER_CELL * 3/4, y * self.PIXELS_PER_CELL + 1,
-                                self.PIXELS_PER_CELL * 1/4, self.PIXELS_PER_CELL * 1/3)
-            painter.drawText(target_rect, f"{idx}")
+        ((x1, y1), (x2, y2)) = (top_left, bottom_right)
+        self.cells = map.cells[x1:x2 + 1, y1:y2 + 1].copy()
+        self.drones = map.drones[x1:x2 + 1, y1:y2 + 1].copy()
 
-            painter.end()
-            self.setPixmap(canvas)
+    def changes(self, map: MapState) -> bool:
+        ((x1, y1), (x2, y2)) = (self.top_left, self.bottom_right)
+        return not (np.array_equal(self.cells, map.cells[x1:x2 + 1, y1:y2 + 1]) and
+                    np.array_equal(self.drones, map.drones[x1:x2 + 1, y1:y2 + 1]))
 
-    @Slot()
-    def draw_map(self, map: dict[str, QJsonArray]) -> None:
-        self.clear()
-        self.draw_cells(map["cells"])
-        self.draw_drones(map["drones"])
+    def undo(self, map: MapState) -> None:
+        ((x1, y1), (x2, y2)) = (self.top_left, self.bottom_right)
+        map.cells[x1:x2 + 1, y1:y2 + 1] = self.cells
+        map.drones[x1:x2 + 1, y1:y2 + 1] = self.drones
 
-        if "first_responders" in map.keys():
-            self.draw_indexes(map["first_responders"])
-        if "survivors" in map.keys():
-            self.draw_indexes(map["survivors"])
+    def redo(self, map: MapState) -> None:
+        MapEditorWidget.apply_tool(
+            map, self.tool, self.top_left, self.bottom_right)
 
 
 class MapEditorWidget(MapWidget):
-    map = {}
+    map = None
 
     tools = [CellType.FIRE, CellType.EXIT,
              CellType.FIRST_RESP, CellType.SURVIVOR]
@@ -153,26 +278,67 @@ class MapEditorWidget(MapWidget):
     last_cell_tool = tools[0]
     tool_active = False
 
+    # Pending edit (tool, top_left, bottom_right) shown while dragging, drawn
+    # on top of the committed map and applied only when the mouse is released
+    preview = None
+
+    # Distances to the nearest exit, fire and survivor of every cell, kept up
+    # to date with the edits and shown in the tooltip of the hovered cell
+    distances = None
+
     # The ownership of the action is not passed to the widget,
     # so the object must not be destroyed when the constructor ends
     save_action = None
 
-    def __init__(self, N_COLS: int, N_ROWS: int, PIXELS_PER_CELL: int = 50):
+    def __init__(self, N_COLS: int, N_ROWS: int, PIXELS_PER_CELL: int = 50, history_depth: int = 100,
+                 model_file: str | TextIO | None = None):
         super().__init__(N_COLS, N_ROWS, PIXELS_PER_CELL)
 
-        self.map = {
-            "cells": [[0 for _ in range(N_COLS)] for _ in range(N_ROWS)],
-            "drones": [[0 for _ in range(N_COLS)] for _ in range(N_ROWS)]
-        }
+        # Model the saved maps are patched into, only read on the first save
+        self.model_file = path.abspath(model_file) if isinstance(model_file, str) else model_file
+        self.scenario = None
+
+        # Oldest edits are dropped once the history is full
+        self.undo_history: deque[MapEdit] = deque(maxlen=history_depth)
+        self.redo_history: list[MapEdit] = []
+
+        self.map = MapState.empty(N_COLS, N_ROWS)
 
         self.draw_map(self.map)
         self.setMouseTracking(True)
 
     @Slot()
-    def draw_map(self, map: dict[str, QJsonArray]) -> None:
+    def draw_map(self, map: MapState) -> None:
         super().draw_map(map)
+
+        # The edit history does not apply to a different map
+        if map is not self.map:
+            self.undo_history.clear()
+            self.redo_history.clear()
+        if map is not self.map or self.distances is None:
+            self.distances = DistanceFields(map)
+        else:
+            self.distances.update(map, (0, 0), (map.N_COLS - 1, map.N_ROWS - 1))
         self.map = map
 
+    @Slot()
+    def undo(self) -> None:
+        if self.undo_history:
+            edit = self.undo_history.pop()
+            edit.undo(self.map)
+            self.distances.update(self.map, edit.top_left, edit.bottom_right)
+            self.redo_history.append(edit)
+            self.draw_area((edit.top_left, edit.bottom_right))
+
+    @Slot()
+    def redo(self) -> None:
+        if self.redo_history:
+            edit = self.redo_history.pop()
+            edit.redo(self.map)
+            self.distances.update(self.map, edit.top_left, edit.bottom_right)
+            self.undo_history.append(edit)
+            self.draw_area((edit.top_left, edit.bottom_right))
+
     @Slot()
     def save_map(self) -> None:
         i = 0
@@ -188,110 +354,25 @@ class MapEditorWidget(MapWidget):
         # Dump the map into a a json file
         json_map_file = QFile(f"map_{i}/map.json")
         if json_map_file.open(QIODeviceBase.OpenModeFlag.WriteOnly):
-            json = QJsonDocument(self.map)
+            json = QJsonDocument(self.map.to_json())
             json_map_file.write(json.toJson())
         else:
             raise RuntimeError(f"Unable to open map_{i}/map.json")
 
-        # Count numbers and positions of entities
-        (drones, drones_pos) = self.count_entity(CellType.DRONE)
-        (survivors, survivors_pos) = self.count_entity(CellType.SURVIVOR)
-        (first_responders, first_responders_pos) = self.count_entity(
-            CellType.FIRST_RESP)
-
-        # Generate the code for constants
-        constants_template_file = QFile("templates/constants.txt")
-        constants_template_file.open(QIODeviceBase.OpenModeFlag.ReadOnly)
-        constants_template = constants_template_file.readAll().toStdString()
-
-        constants_code = constants_template.format(
-            self.N_COLS,
-            self.N_ROWS,
-            drones,
-            ", ".join(drones_pos),
-            ", ".join(["1" for _ in range(drones)]),
-            ", ".join(["2" for _ in range(drones)]),
-            survivors,
-            ", ".join(survivors_pos),
-            ", ".join(["8" for _ in range(survivors)]),
-            ", ".join(["15" for _ in range(survivors)]),
-            ", ".join(["POLICY_DIRECT" for _ in range(survivors)]),
-            first_responders,
-            ", ".join(first_responders_pos),
-            ", ".join(["5" for _ in range(first_responders)]),
-            ", ".join(["POLICY_DIRECT" for _ in range(first_responders)])
-        )
-
-        constants_code_file = QFile(f"map_{i}/constants.txt")
-        if constants_code_file.open(QIODeviceBase.OpenModeFlag.WriteOnly):
-            constants_code_file.write(constants_code.encode())
-        else:
-            raise RuntimeError(f"Unable to open map_{i}/constants.txt")
-
-        # Generate the code for the map
-        map_template_file = QFile("templates/map.txt")
-        map_template_file.open(QIODeviceBase.OpenModeFlag.ReadOnly)
-        map_template = map_template_file.readAll().toStdString()
-
-        map_code = ""
-        for x in range(self.N_COLS):
-            for y in range(self.N_ROWS):
-                if self.map["cells"][x][y] != CellType.EMPTY.value:
-                    value = self.map["cells"][x][y]
-                    map_code += map_template.format(
-                        x, y, value, CellType(self.map["cells"][x][y]).name)
-
-        map_code_file = QFile(f"map_{i}/map.txt")
-        if map_code_file.open(QIODeviceBase.OpenModeFlag.WriteOnly):
-            map_code_file.write(map_code.encode())
+        # Generate the model of the scenario
+        if self.model_file and self.scenario is None:
+            self.scenario = ScenarioTemplate(self.model_file)
+        if self.scenario is not None:
+            model_file = QFile(f"map_{i}/model.xml")
+            if model_file.open(QIODeviceBase.OpenModeFlag.WriteOnly):
+                model_file.write(self.scenario.generate(self.map).encode())
+            else:
+                raise RuntimeError(f"Unable to open map_{i}/model.xml")
         else:
-            raise RuntimeError(f"Unable to open map_{i}/map.txt")
+            print(f"Warning: no model to generate the scenario from, only map_{i}/map.json is saved")
 
         print(f"Current map seved in map_{i}/")
 
-    def count_entity(self, entity: CellType) -> tuple[int, list[str]]:
-        if entity == CellType.DRONE:
-            map = self.map["drones"]
-            value = 1
-        else:
-            map = self.map["cells"]
-            value = entity.value
-
-        count = 0
-        positions = []
-        for x in range(self.N_COLS):
-            for y in range(self.N_ROWS):
-                if map[x][y] == value:
-                    count += 1
-                    positions.append(f"{{{x}, {y}}}")
-
-        return (count, positions)
-
-    def set_cell(map, cell_type, pos) -> None:
-        map["cells"][pos[0]][pos[1]] = cell_type.value
-
-    def set_cell_rect(map, cell_type, pos1, pos2) -> None:
-        (x1, y1) = pos1
-        (x2, y2) = pos2
-
-        for x in range(x1, x2 + 1):
-            for y in range(y1, y2 + 1):
-                MapEditorWidget.set_cell(map, cell_type, (x, y))
-
-    def set_drone(map, cell_type, pos) -> None:
-        if cell_type == CellType.EMPTY:
-            map["drones"][pos[0]][pos[1]] = 0
-        elif cell_type == CellType.DRONE:
-            map["drones"][pos[0]][pos[1]] = 1
-
-    def set_map_drone_rect(map, cell_type, pos1, pos2) -> None:
-        (x1, y1) = pos1
-        (x2, y2) = pos2
-
-        for x in range(x1, x2 + 1):
-            for y in range(y1, y2 + 1):
-                MapEditorWidget.set_drone(map, cell_type, (x, y))
-
     def map_position_from_pixel(self, pos: tuple[int, int]) -> tuple[int, int]:
         x = int(pos.x() // self.PIXELS_PER_CELL)
         y = int(pos.y() // self.PIXELS_PER_CELL)
@@ -318,17 +399,17 @@ class MapEditorWidget(MapWidget):
 
         # If shift is pressed, draw drones
         if QGuiApplication.keyboardModifiers() == Qt.KeyboardModifier.ShiftModifier:
-            if self.map["drones"][x][y] == CellType.EMPTY.value:
+            if self.map.drones[x, y] == CellType.EMPTY.value:
                 return CellType.DRONE
             else:
                 return CellType.EMPTY
 
         # In other cases we change the cells
         # If this is a drag operation, we do not change the tool
-        if self.press_position != release_pos or CellType(self.map["cells"][x][y]) not in self.tools:
+        if self.press_position != release_pos or CellType(int(self.map.cells[x, y])) not in self.tools:
             return self.last_cell_tool
         else:
-            idx = self.tools.index(CellType(self.map["cells"][x][y]))
+            idx = self.tools.index(CellType(int(self.map.cells[x, y])))
             if button == Qt.MouseButton.LeftButton:
                 # Next tool
                 return self.tools[(idx + 1) % len(self.tools)]
@@ -352,28 +433,27 @@ class MapEditorWidget(MapWidget):
         next_cell_tool = self.choose_next_tool(
             self.press_position, release_pos, event.button())
 
-        # Update the target area
+        # Update the target area, recording the edit in the history
+        edit = MapEdit(self.map, next_cell_tool, top_left, bottom_right)
+        MapEditorWidget.apply_tool(
+            self.map, next_cell_tool, top_left, bottom_right)
+        if edit.changes(self.map):
+            self.undo_history.append(edit)
+            self.redo_history.clear()
+            self.distances.update(self.map, top_left, bottom_right)
         if next_cell_tool == CellType.EMPTY:
-            # If the tool is EMPTY, we clear out both cells and drones
-            MapEditorWidget.set_cell_rect(self.map, next_cell_tool,
-                                          top_left, bottom_right)
-            MapEditorWidget.set_map_drone_rect(self.map, next_cell_tool,
-                                               top_left, bottom_right)
-
             # In this case we reset the last tool used to FIRE
             self.last_cell_tool = self.tools[0]
-        elif next_cell_tool == CellType.DRONE:
-            MapEditorWidget.set_map_drone_rect(self.map, CellType.DRONE,
-                                               top_left, bottom_right)
-        else:
-            MapEditorWidget.set_cell_rect(self.map, next_cell_tool,
-                                          top_left, bottom_right)
-
+        elif next_cell_tool != CellType.DRONE:
             # Update the last cell tool
             self.last_cell_tool = next_cell_tool
 
-        # Redraw the map
-        self.draw_map(self.map)
+        # Redraw the edited area, including what the preview covered
+        area = (top_left, bottom_right)
+        if self.preview is not None:
+            area = self.bounding_area(area, self.preview[1:])
+        self.preview = None
+        self.draw_area(area)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
         current_pos = self.map_position_from_pixel(event.position())
@@ -382,34 +462,59 @@ class MapEditorWidget(MapWidget):
             (top_left, bottom_right) = self.fix_positions_order(
                 self.press_position, current_pos)
 
-            map_copy = deepcopy(self.map)
-
             # Determine what to put in the cells
             next_cell_tool = self.choose_next_tool(
                 self.press_position, current_pos, event.button())
 
-            # Update the target area
-            if next_cell_tool == CellType.EMPTY:
-                # If the tool is EMPTY, we clear out both cells and drones
-                MapEditorWidget.set_cell_rect(
-                    map_copy, next_cell_tool, top_left, bottom_right)
-                MapEditorWidget.set_map_drone_rect(
-                    map_copy, next_cell_tool, top_left, bottom_right)
-
-                # In this case we reset the last tool used to FIRE
-                self.last_cell_tool = self.tools[0]
-            elif next_cell_tool == CellType.DRONE:
-                MapEditorWidget.set_map_drone_rect(
-                    map_copy, CellType.DRONE, top_left, bottom_right)
-            else:
-                MapEditorWidget.set_cell_rect(
-                    map_copy, next_cell_tool, top_left, bottom_right)
-
-                # Update the last cell tool
-                self.last_cell_tool = next_cell_tool
-
-            # Redraw the map
-            self.draw_map(map_copy)
+            # Redraw both the area of the previous preview and the new one
+            area = (top_left, bottom_right)
+            if self.preview is not None:
+                area = self.bounding_area(area, self.preview[1:])
+            self.preview = (next_cell_tool, top_left, bottom_right)
+            self.draw_area(area)
+        elif current_pos != self.last_move_position:
+            self.setToolTip(self.distances_text(current_pos))
+        self.last_move_position = current_pos
+
+    def distances_text(self, pos: tuple[int, int]) -> str:
+        lines = []
+        for (kind, name) in [(CellType.EXIT, "exit"), (CellType.FIRE, "fire"),
+                             (CellType.SURVIVOR, "survivor")]:
+            distance = self.distances.distance(kind, pos)
+            if distance is not None:
+                lines.append(f"Nearest {name}: {self.distances.nearest(kind, pos)} at {distance}")
+        return "\n".join(lines)
+
+    def apply_tool(map: MapState, tool: CellType, top_left: tuple[int, int], bottom_right: tuple[int, int]) -> None:
+        if tool == CellType.EMPTY:
+            # If the tool is EMPTY, we clear out both cells and drones
+            map.set_cell_rect(tool, top_left, bottom_right)
+            map.set_drone_rect(tool, top_left, bottom_right)
+        elif tool == CellType.DRONE:
+            map.set_drone_rect(CellType.DRONE, top_left, bottom_right)
+        else:
+            map.set_cell_rect(tool, top_left, bottom_right)
+
+    # Redraws an area of the committed map, with the preview applied on top
+    def draw_area(self, area: tuple[tuple[int, int], tuple[int, int]]) -> None:
+        ((x1, y1), (x2, y2)) = area
+        region = MapState(self.map.cells[x1:x2 + 1, y1:y2 + 1],
+                          self.map.drones[x1:x2 + 1, y1:y2 + 1])
+
+        if self.preview is not None:
+            # Only the area being redrawn is copied, never the whole map
+            (tool, (px1, py1), (px2, py2)) = self.preview
+            region = region.copy()
+            MapEditorWidget.apply_tool(region, tool, (px1 - x1, py1 - y1),
+                                       (px2 - x1, py2 - y1))
+
+        self.draw_region(region.cells, region.drones,
+                         self.map_labels(self.map), (x1, y1))
+
+    def bounding_area(self, area1: tuple[tuple[int, int], tuple[int, int]],
+                      area2: tuple[tuple[int, int], tuple[int, int]]) -> tuple[tuple[int, int], tuple[int, int]]:
+        return ((min(area1[0][0], area2[0][0]), min(area1[0][1], area2[0][1])),
+                (max(area1[1][0], area2[1][0]), max(area1[1][1], area2[1][1])))
 
     # Fixes the positions in order to have the press_pos alwayb be on the top left and release_pos on the bottom right
     def fix_positions_order(self, press_pos: tuple[int, int], release_pos: tuple[int, int]):
@@ -0,0 +1,123 @@
+import numpy as np
+
+from components.Enums import CellType
+
+
+# Map state shared by the editor, the visualizers and the traces. Cells and
+# drones are (N_COLS, N_ROWS) uint8 arrays indexed as [x, y], like the map in
+# the model, while the optional first responders and survivors lists hold the
+# position of each actor by index.
+class MapState():
+    # States in which each kind of actor can be found on the map
+    actor_states = {
+        CellType.FIRST_RESP: [CellType.FIRST_RESP, CellType.ASSISTING],
+        CellType.SURVIVOR: [CellType.SURVIVOR, CellType.IN_NEED, CellType.ASSISTED],
+    }
+    # Largest value of a cell, every cell being the value of a CellType
+    max_cell = max(cell.value for cell in CellType)
+
+    def __init__(self, cells: np.ndarray, drones: np.ndarray,
+                 first_responders: list[tuple[int, int]] | None = None,
+                 survivors: list[tuple[int, int]] | None = None):
+        self.cells = np.asarray(cells, dtype=np.uint8)
+        self.drones = np.asarray(drones, dtype=np.uint8)
+        self.first_responders = first_responders
+        self.survivors = survivors
+
+    @property
+    def N_COLS(self) -> int:
+        return self.cells.shape[0]
+
+    @property
+    def N_ROWS(self) -> int:
+        return self.cells.shape[1]
+
+    def empty(N_COLS: int, N_ROWS: int) -> "MapState":
+        return MapState(np.zeros((N_COLS, N_ROWS), dtype=np.uint8),
+                        np.zeros((N_COLS, N_ROWS), dtype=np.uint8))
+
+    # Raises ValueError unless the cells are CellType values and the drones 0
+    # or 1, as a state that is drawn has to be
+    def check_values(cells: np.ndarray, drones: np.ndarray) -> None:
+        if cells.size and cells.max() > MapState.max_cell:
+            raise ValueError(f"Cell value {cells.max()} is not a CellType")
+        if drones.size and drones.max() > 1:
+            raise ValueError(f"Drone value {drones.max()} is not 0 or 1")
+
+    # Integer array of JSON values, checked before it is narrowed to uint8
+    def json_array(values: list, largest: int) -> np.ndarray:
+        array = np.asarray(values)
+        if array.dtype == np.bool_:
+            return array.astype(np.uint8)
+        if array.size and not np.issubdtype(array.dtype, np.integer):
+            raise ValueError(f"Map values of type {array.dtype} instead of integers")
+        if array.size and (array.min() < 0 or array.max() > largest):
+            raise ValueError(f"Map values out of 0..{largest}")
+        return array.astype(np.uint8)
+
+    def from_json(map: dict) -> "MapState":
+        cells = MapState.json_array(map["cells"], MapState.max_cell)
+        if "drones" in map:
+            drones = MapState.json_array(map["drones"], 1)
+        else:
+            drones = np.zeros_like(cells)
+
+        first_responders = None
+        survivors = None
+        if "first_responders" in map:
+            first_responders = [(int(x), int(y))
+                                for (x, y) in map["first_responders"]]
+        if "survivors" in map:
+            survivors = [(int(x), int(y)) for (x, y) in map["survivors"]]
+
+        return MapState(cells, drones, first_responders, survivors)
+
+    def to_json(self) -> dict:
+        map = {
+            "cells": self.cells.tolist(),
+            "drones": self.drones.tolist()
+        }
+        if self.first_responders is not None:
+            map["first_responders"] = [list(pos)
+                                       for pos in self.first_responders]
+        if self.survivors is not None:
+            map["survivors"] = [list(pos) for pos in self.survivors]
+        return map
+
+    def copy(self) -> "MapState":
+        return MapState(self.cells.copy(), self.drones.copy(),
+                        None if self.first_responders is None else list(
+                            self.first_responders),
+                        None if self.survivors is None else list(self.survivors))
+
+    def entity_mask(self, entity: CellType) -> np.ndarray:
+        if entity == CellType.DRONE:
+            return self.drones == 1
+        return self.cells == entity.value
+
+    # Positions of the given entity ordered by x and then by y
+    def positions(self, entity: CellType) -> np.ndarray:
+        return np.argwhere(self.entity_mask(entity))
+
+    def count_entity(self, entity: CellType) -> int:
+        return int(np.count_nonzero(self.entity_mask(entity)))
+
+    # Counts the actors of the given kind whatever state they are in
+    def count_actors(self, entity: CellType) -> int:
+        states = [state.value for state in self.actor_states.get(
+            entity, [entity])]
+        counts = np.bincount(self.cells.ravel(), minlength=len(CellType))
+        return int(counts[states].sum())
+
+    def set_cell_rect(self, cell_type: CellType, pos1: tuple[int, int], pos2: tuple[int, int]) -> None:
+        (x1, y1) = pos1
+        (x2, y2) = pos2
+        self.cells[x1:x2 + 1, y1:y2 + 1] = cell_type.value
+
+    def set_drone_rect(self, cell_type: CellType, pos1: tuple[int, int], pos2: tuple[int, int]) -> None:
+        (x1, y1) = pos1
+        (x2, y2) = pos2
+        if cell_type == CellType.EMPTY:
+            self.drones[x1:x2 + 1, y1:y2 + 1] = 0
+        elif cell_type == CellType.DRONE:
+            self.drones[x1:x2 + 1, y1:y2 + 1] = 1
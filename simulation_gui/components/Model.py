@@ -0,0 +1,330 @@
+from xml.etree import ElementTree
+from itertools import product
+from typing import TextIO
+import ast
+import operator
+import re
+
+
+# Names of the state variables of an UPPAAL model, in the order in which they
+# appear in the state vector: global declarations, system declarations and then
+# the local declarations of every process instance, in the system order.
+# Clocks and channels are not part of the vector and are skipped, constants are
+# evaluated as far as needed to compute array sizes and template instances.
+class ModelLayout():
+    skipped_types = ["clock", "chan"]
+    qualifiers = ["meta", "urgent", "broadcast", "hybrid"]
+    skipped_blocks = ["before_update", "after_update", "progress"]
+
+    declarator_pattern = re.compile(r'(\w+)\s*((?:\[[^\]]*\]\s*)*)(?:=.*)?$')
+    dim_pattern = re.compile(r'\[([^\]]*)\]')
+
+    # Operators of the integer expressions of UPPAAL, once translated to Python
+    binary_operators = {
+        ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+        ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+        ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+        ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+    }
+    unary_operators = {ast.USub: operator.neg, ast.UAdd: operator.pos,
+                       ast.Not: operator.not_, ast.Invert: operator.invert}
+    comparisons = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+                   ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge}
+
+    def __init__(self, model_file: str | TextIO):
+        root = ElementTree.parse(model_file).getroot()
+
+        self.constants = {"true": 1, "false": 0}
+        self.types = {}
+        self.variables: list[str] = []
+        self.processes: list[str] = []
+
+        self.parse_declaration(root.findtext("declaration", ""), "")
+
+        templates = {}
+        for template in root.iter("template"):
+            templates[template.findtext("name").strip()] = (
+                template.findtext("parameter", ""),
+                template.findtext("declaration", ""))
+
+        # The system block holds both declarations and the process list
+        system = ModelLayout.strip_comments(root.findtext("system", ""))
+        system_line = re.search(r'\bsystem\b([^;]*);', system)
+        if system_line is None:
+            raise ValueError("The model has no system declaration")
+
+        instances = {}
+        for statement in ModelLayout.statements(system[:system_line.start()]):
+            assignment = re.match(r'(\w+)\s*=\s*(\w+)\s*\(.*\)$', statement)
+            if assignment:
+                instances[assignment.group(1)] = assignment.group(2)
+            else:
+                self.parse_statement(statement, "")
+
+        for name in re.split(r'[,<]', system_line.group(1)):
+            name = name.strip()
+            if name in instances:
+                self.add_process(name, "", templates[instances[name]][1])
+            elif name in templates:
+                (parameter, declaration) = templates[name]
+                for args in self.instances(parameter):
+                    process = f"{name}({', '.join(args)})" if args else name
+                    self.add_process(process, parameter, declaration, args)
+            else:
+                raise ValueError(f"Unknown process {name} in system line")
+
+    def index(self, variable: str) -> int:
+        return self.variables.index(variable)
+
+    def add_process(self, process: str, parameter: str, declaration: str, args: tuple = ()) -> None:
+        self.processes.append(process)
+
+        # Bind the parameters so that local constants can refer to them
+        constants = dict(self.constants)
+        for (param, arg) in zip(self.parameters(parameter), args):
+            self.constants[param[1]] = int(arg)
+
+        self.parse_declaration(declaration, process + ".")
+        self.constants = constants
+
+    def parameters(self, parameter: str) -> list[tuple[str, str]]:
+        params = []
+        for param in ModelLayout.split_top_level(parameter, ","):
+            match = re.match(r'(?:const\s+)?(.*?)\s*&?\s*(\w+)$', param.strip())
+            if match:
+                params.append(match.groups())
+        return params
+
+    # Every combination of the template parameters, which must be bounded
+    # integer types, gives a process instance
+    def instances(self, parameter: str) -> list[tuple[str, ...]]:
+        ranges = []
+        for (param_type, name) in self.parameters(parameter):
+            bounds = self.range_of(param_type)
+            if bounds is None:
+                raise ValueError(
+                    f"Unable to instantiate parameter {name} of type {param_type}")
+            ranges.append([str(i) for i in range(bounds[0], bounds[1] + 1)])
+        return list(product(*ranges))
+
+    def range_of(self, type_name: str) -> tuple[int, int] | None:
+        type_name = type_name.strip()
+        match = re.match(r'int\s*\[(.*)\]$', type_name)
+        if match:
+            (low, high) = ModelLayout.split_top_level(match.group(1), ",")
+            return (self.evaluate(low), self.evaluate(high))
+        if type_name == "bool":
+            return (0, 1)
+        if type_name in self.types and self.types[type_name][0] == "range":
+            return self.range_of(self.types[type_name][1])
+        return None
+
+    def parse_declaration(self, declaration: str, prefix: str) -> None:
+        for statement in ModelLayout.statements(ModelLayout.strip_comments(declaration)):
+            self.parse_statement(statement, prefix)
+
+    def parse_statement(self, statement: str, prefix: str) -> None:
+        words = statement.split()
+        if not words or words[0] in ["import", "system"]:
+            return
+
+        if words[0] == "typedef":
+            self.parse_typedef(statement[len("typedef"):].strip())
+            return
+
+        is_const = False
+        while words and (words[0] in self.qualifiers or words[0] == "const"):
+            is_const |= words[0] == "const"
+            statement = statement.split(None, 1)[1]
+            words = words[1:]
+
+        (type_name, rest) = self.split_type(statement)
+        if type_name in self.skipped_types:
+            return
+
+        for declarator in ModelLayout.split_top_level(rest, ","):
+            match = self.declarator_pattern.match(declarator.strip())
+            if match is None:
+                continue
+            (name, dims) = match.groups()
+
+            if is_const:
+                if not dims and "=" in declarator:
+                    try:
+                        self.constants[name] = self.evaluate(
+                            declarator.split("=", 1)[1])
+                    except (NameError, SyntaxError, TypeError, ValueError, ZeroDivisionError):
+                        # Constants depending on arrays or functions are not
+                        # needed to compute the layout
+                        pass
+                continue
+
+            sizes = [self.size_of(dim)
+                     for dim in self.dim_pattern.findall(dims)]
+            self.variables += self.flatten(prefix + name, type_name, sizes)
+
+    def parse_typedef(self, statement: str) -> None:
+        (type_name, rest) = self.split_type(statement)
+        name = rest.strip()
+        if type_name.startswith("struct"):
+            fields = []
+            body = type_name[type_name.index("{") + 1:type_name.rindex("}")]
+            for field in body.split(";"):
+                if field.strip():
+                    (field_type, field_names) = self.split_type(field.strip())
+                    for field_name in ModelLayout.split_top_level(field_names, ","):
+                        match = self.declarator_pattern.match(
+                            field_name.strip())
+                        sizes = [self.size_of(dim)
+                                 for dim in self.dim_pattern.findall(match.group(2))]
+                        fields.append((match.group(1), field_type, sizes))
+            self.types[name] = ("struct", fields)
+        else:
+            self.types[name] = ("range", type_name)
+
+    # Splits a declaration into its type and the declarators that follow it
+    def split_type(self, statement: str) -> tuple[str, str]:
+        statement = statement.strip()
+        if statement.startswith("struct"):
+            end = ModelLayout.matching_brace(statement, statement.index("{"))
+            return (statement[:end + 1], statement[end + 1:])
+
+        match = re.match(r'(\w+)\s*(\[[^\]]*\])?\s*(.*)$', statement, re.S)
+        (name, bounds, rest) = match.groups()
+        return (name + (bounds or ""), rest)
+
+    def size_of(self, dim: str) -> int:
+        bounds = self.range_of(dim)
+        if bounds is not None and not re.match(r'^\s*-?\d+\s*$', dim):
+            return bounds[1] - bounds[0] + 1
+        return self.evaluate(dim)
+
+    def flatten(self, name: str, type_name: str, sizes: list[int]) -> list[str]:
+        if sizes:
+            names = []
+            for i in range(sizes[0]):
+                names += self.flatten(f"{name}[{i}]", type_name, sizes[1:])
+            return names
+
+        if type_name.startswith("struct"):
+            self.parse_typedef(type_name + " __anonymous")
+            type_name = "__anonymous"
+        if type_name in self.types and self.types[type_name][0] == "struct":
+            names = []
+            for (field, field_type, field_sizes) in self.types[type_name][1]:
+                names += self.flatten(f"{name}.{field}",
+                                      field_type, field_sizes)
+            return names
+
+        return [name]
+
+    # Values, when given, are looked up instead of the constants
+    def evaluate(self, expression: str, values: dict | None = None) -> int:
+        expression = expression.strip()
+
+        # Conditional expressions are rewritten from the outermost one
+        ternary = re.match(r'^(.*?)\?(.*):(.*)$', expression, re.S)
+        if ternary:
+            (condition, then, otherwise) = ternary.groups()
+            if self.evaluate(condition, values):
+                return self.evaluate(then, values)
+            return self.evaluate(otherwise, values)
+
+        expression = expression.replace("&&", " and ").replace("||", " or ")
+        expression = re.sub(r'!(?!=)', " not ", expression)
+        expression = re.sub(r'(?<![/])/(?![/])', "//", expression)
+        tree = ast.parse(expression.strip(), mode="eval")
+        return int(ModelLayout.evaluate_node(tree.body, self.constants if values is None else values))
+
+    # Walks the syntax tree of an expression rather than running it, as the
+    # text comes from the model file: only integer literals, names and the
+    # operators above are allowed, anything else raises a SyntaxError
+    def evaluate_node(node: ast.AST, values: dict) -> int:
+        if isinstance(node, ast.Constant) and type(node.value) in [int, bool]:
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in values:
+                raise NameError(f"Unknown constant {node.id}")
+            return values[node.id]
+        if isinstance(node, ast.UnaryOp) and type(node.op) in ModelLayout.unary_operators:
+            return ModelLayout.unary_operators[type(node.op)](ModelLayout.evaluate_node(node.operand, values))
+        if isinstance(node, ast.BinOp) and type(node.op) in ModelLayout.binary_operators:
+            return ModelLayout.binary_operators[type(node.op)](
+                ModelLayout.evaluate_node(node.left, values), ModelLayout.evaluate_node(node.right, values))
+        if isinstance(node, ast.BoolOp):
+            # Short-circuited, like && and ||
+            value = ModelLayout.evaluate_node(node.values[0], values)
+            for operand in node.values[1:]:
+                if bool(value) == isinstance(node.op, ast.Or):
+                    break
+                value = ModelLayout.evaluate_node(operand, values)
+            return value
+        if isinstance(node, ast.Compare) and all(type(op) in ModelLayout.comparisons for op in node.ops):
+            left = ModelLayout.evaluate_node(node.left, values)
+            for (op, operand) in zip(node.ops, node.comparators):
+                right = ModelLayout.evaluate_node(operand, values)
+                if not ModelLayout.comparisons[type(op)](left, right):
+                    return False
+                left = right
+            return True
+        raise SyntaxError(f"Unsupported expression {ast.unparse(node)}")
+
+    def strip_comments(text: str) -> str:
+        text = re.sub(r'/\*.*?\*/', " ", text, flags=re.S)
+        return re.sub(r'//[^\n]*', " ", text)
+
+    # Splits a declaration block into top level statements, dropping the
+    # bodies of functions and of the other blocks that hold no variables
+    def statements(text: str) -> list[str]:
+        statements = []
+        current = ""
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == "{":
+                head = current.strip()
+                if head.endswith(")") or head in ModelLayout.skipped_blocks:
+                    i = ModelLayout.matching_brace(text, i) + 1
+                    current = ""
+                    continue
+                end = ModelLayout.matching_brace(text, i)
+                current += text[i:end + 1]
+                i = end + 1
+                continue
+            if char == ";":
+                if current.strip():
+                    statements.append(" ".join(current.split()))
+                current = ""
+            else:
+                current += char
+            i += 1
+        return statements
+
+    def matching_brace(text: str, start: int) -> int:
+        depth = 0
+        for i in range(start, len(text)):
+            if text[i] == "{":
+                depth += 1
+            elif text[i] == "}":
+                depth -= 1
+                if depth == 0:
+                    return i
+        raise ValueError("Unbalanced braces in declaration")
+
+    def split_top_level(text: str, separator: str) -> list[str]:
+        parts = []
+        depth = 0
+        current = ""
+        for char in text:
+            if char in "{[(":
+                depth += 1
+            elif char in "}])":
+                depth -= 1
+            if char == separator and depth == 0:
+                parts.append(current)
+                current = ""
+            else:
+                current += char
+        if current.strip():
+            parts.append(current)
+        return parts
@@ -0,0 +1,127 @@
+from PySide6.QtWidgets import QApplication, QLabel, QWidget
+from PySide6.QtCore import QEvent, QObject, QTimer, Qt
+from collections import deque
+from functools import wraps
+from time import perf_counter
+from typing import Callable
+import json
+import numpy as np
+
+
+# Durations of the stages of the visualizer, kept as the last samples of each
+# stage. Nothing is timed unless the profiler is attached: the stages are
+# methods replaced on the instances being profiled and the frames are timed
+# by a ProfiledApplication, so that the code paths are untouched otherwise.
+class Profiler():
+    frame_stage = "frame"
+
+    def __init__(self, samples: int = 100000):
+        self.samples = samples
+        self.stages: dict[str, deque[float]] = {}
+        # End times of the frames, for the frame rate
+        self.frame_ends: deque[float] = deque(maxlen=samples)
+
+    def record(self, stage: str, seconds: float) -> None:
+        durations = self.stages.get(stage)
+        if durations is None:
+            durations = self.stages.setdefault(stage, deque(maxlen=self.samples))
+        durations.append(seconds)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, perf_counter() - start)
+        return timed
+
+    # Times the given method of the object from now on
+    def instrument(self, object: object, method: str, stage: str) -> None:
+        setattr(object, method, self.wrap(stage, getattr(object, method)))
+
+    def frame(self, seconds: float) -> None:
+        self.record(self.frame_stage, seconds)
+        self.frame_ends.append(perf_counter())
+
+    def fps(self, window: float = 1.0) -> float:
+        now = perf_counter()
+        return sum(1 for end in reversed(self.frame_ends) if end > now - window) / window
+
+    # Count, total, mean, median, 99th percentile and maximum of a stage, in
+    # seconds, over its last samples or the given number of them
+    def stats(self, stage: str, last: int | None = None) -> dict:
+        durations = np.array(self.stages.get(stage, ()), dtype=float)
+        if last is not None:
+            durations = durations[-last:]
+        if not len(durations):
+            return {"count": 0}
+        (p50, p99) = np.percentile(durations, [50, 99])
+        return {"count": len(durations), "total": float(durations.sum()),
+                "mean": float(durations.mean()), "p50": float(p50), "p99": float(p99),
+                "max": float(durations.max())}
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<24} {'count':>8} {'total':>10} {'mean':>10} {'p50':>10} {'p99':>10} {'max':>10}"]
+        for stage in sorted(self.stages):
+            stats = self.stats(stage)
+            lines.append(f"{stage:<24} {stats['count']:>8} {stats['total'] * 1e3:>8.1f}ms" + "".join(
+                f" {stats[name] * 1e3:>8.3f}ms" for name in ["mean", "p50", "p99", "max"]))
+        return "\n".join(lines)
+
+    def save(self, output_file: str) -> None:
+        with open(output_file, "w") as file:
+            json.dump({stage: self.stats(stage) for stage in sorted(self.stages)}, file, indent=2)
+
+
+# Application timing the dispatch of every event: the paint events of the
+# given widget class are the frames, the other ones are grouped by type
+class ProfiledApplication(QApplication):
+    def __init__(self, profiler: Profiler, frame_widget: type, args: list[str]):
+        super().__init__(args)
+        self.profiler = profiler
+        self.frame_widget = frame_widget
+
+    def notify(self, receiver: QObject, event: QEvent) -> bool:
+        event_type = event.type()
+        start = perf_counter()
+        result = super().notify(receiver, event)
+        elapsed = perf_counter() - start
+
+        if event_type == QEvent.Type.Paint and isinstance(receiver, self.frame_widget):
+            self.profiler.frame(elapsed)
+        elif event_type in (QEvent.Type.Timer, QEvent.Type.MetaCall, QEvent.Type.Paint,
+                            QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease,
+                            QEvent.Type.MouseMove, QEvent.Type.KeyPress):
+            self.profiler.record(f"event {event_type.name}", elapsed)
+        return result
+
+
+# Frame rate and frame times of the last frames, drawn over a widget
+class ProfilerHud(QLabel):
+    frames = 120
+
+    def __init__(self, profiler: Profiler, parent: QWidget, interval: int = 500):
+        super().__init__(parent)
+        self.profiler = profiler
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setAutoFillBackground(True)
+        # Opaque, so that refreshing it does not repaint the widget below
+        self.setStyleSheet("background-color: black; color: white; padding: 2px;")
+        self.move(2, 2)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.refresh()
+
+    def refresh(self) -> None:
+        stats = self.profiler.stats(Profiler.frame_stage, self.frames)
+        text = f"{self.profiler.fps():.0f} FPS"
+        if stats["count"]:
+            text += f"  p50 {stats['p50'] * 1e3:.2f} ms  p99 {stats['p99'] * 1e3:.2f} ms"
+        self.setText(text)
+        self.adjustSize()
+        self.raise_()
@@ -0,0 +1,167 @@
+from typing import TextIO
+import numpy as np
+import re
+
+from components.Enums import CellType
+from components.MapState import MapState
+from components.Model import ModelLayout
+
+
+# Generator of model variants from a base model. The base is split once into
+# the fixed text and the patchable parts, that are the initializers of the
+# global constants and the map specific part of init_map(), so that each
+# variant is a join of strings and everything else is kept byte for byte.
+# Arrays indexed by an entity type follow the number of entities: a scalar
+# override is repeated for each of them and arrays that are not overridden are
+# resized repeating their first value.
+class ScenarioTemplate():
+    # Constants set from the entities on the map
+    entity_constants = {
+        CellType.DRONE: ("N_DRONES", "drones_starting_pos"),
+        CellType.SURVIVOR: ("N_SURVIVORS", "survivors_starting_pos"),
+        CellType.FIRST_RESP: ("N_FIRST_RESPONDERS", "first_responders_starting_pos"),
+        CellType.EXIT: ("N_EXIT_BLOCK", "exit_pos"),
+    }
+    map_region = "init_map"
+
+    constant_pattern = re.compile(
+        r'\bconst\s+\w+(?:\s*\[[^\]]*\])?\s+(\w+)\s*((?:\[[^\]]*\]\s*)*)=([^;]*);')
+    index_pattern = re.compile(
+        r'\btypedef\s+int\s*\[\s*0\s*,\s*(\w+)\s*-\s*1\s*\]\s*(\w+)\s*;')
+
+    def __init__(self, model_file: str | TextIO):
+        if isinstance(model_file, str):
+            with open(model_file) as file:
+                text = file.read()
+        else:
+            text = model_file.read()
+
+        # Comments are blanked so that offsets still match the text
+        masked = re.sub(r'/\*.*?\*/|//[^\n]*',
+                        lambda comment: re.sub(r'[^\n]', " ", comment.group()), text, flags=re.S)
+
+        start = masked.index("<declaration>")
+        end = masked.index("</declaration>", start)
+
+        # Count constant of every entity index type, e.g. drone_t -> N_DRONES
+        counts = {}
+        for match in self.index_pattern.finditer(masked, start, end):
+            counts[match.group(2)] = match.group(1)
+
+        # Initializer span, current value and count constant of each constant
+        spans = []
+        self.values = {}
+        self.indices = {}
+        for match in self.constant_pattern.finditer(masked, start, end):
+            (name, dims) = (match.group(1), match.group(2))
+            (value_start, value_end) = match.span(3)
+            spans.append((value_start, value_end, name))
+            self.values[name] = text[value_start:value_end].strip()
+            dim = re.findall(r'\[\s*(\w+)\s*\]', dims)
+            if len(dim) == 1 and dim[0] in counts:
+                self.indices[name] = counts[dim[0]]
+
+        region = ScenarioTemplate.find_map_region(masked)
+        if region is not None:
+            spans.append(region + (self.map_region,))
+            self.indent = text[text.rfind("\n", 0, region[0]) + 1:region[0]]
+
+        self.parts = []
+        self.keys = []
+        self.originals = []
+        position = 0
+        for (span_start, span_end, name) in sorted(spans):
+            self.parts.append(text[position:span_start])
+            self.keys.append(name)
+            self.originals.append(text[span_start:span_end])
+            position = span_end
+        self.parts.append(text[position:])
+
+    # The "if (map_id == ...) { ... } else if ..." chain of init_map()
+    def find_map_region(masked: str) -> tuple[int, int] | None:
+        function = re.search(r'\bvoid\s+init_map\s*\(\s*\)\s*{', masked)
+        if function is None:
+            return None
+        body_end = ModelLayout.matching_brace(masked, function.end() - 1)
+
+        chain = re.compile(r'\bif\s*\(\s*map_id\b').search(
+            masked, function.end(), body_end)
+        if chain is None:
+            return None
+
+        end = chain.start()
+        while True:
+            end = ModelLayout.matching_brace(
+                masked, masked.index("{", end)) + 1
+            following = re.compile(r'\s*else\b').match(masked, end)
+            if following is None:
+                return (chain.start(), end)
+            end = following.end()
+
+    def generate(self, map: MapState | None = None, **overrides) -> str:
+        values = {}
+        if map is not None:
+            values.update(self.map_values(map))
+        for (name, value) in overrides.items():
+            if name not in self.values:
+                raise ValueError(f"The model has no constant {name}")
+            values[name] = value
+
+        # Entity arrays follow the number of entities
+        for (name, count_name) in self.indices.items():
+            # Tuples are structs, e.g. a position, and are repeated too
+            value = values.get(name)
+            if isinstance(value, (list, np.ndarray)):
+                continue
+            if value is None and count_name not in values:
+                continue
+            count = int(values.get(count_name, self.values[count_name]))
+            if value is None:
+                body = self.values[name].strip()[1:-1]
+                value = ModelLayout.split_top_level(body, ",")[0].strip()
+            values[name] = [value] * count
+
+        formatted = {name: " " + ScenarioTemplate.format_value(value)
+                     for (name, value) in values.items()}
+        if self.map_region in values:
+            formatted[self.map_region] = values[self.map_region]
+
+        text = [self.parts[0]]
+        for (key, original, part) in zip(self.keys, self.originals, self.parts[1:]):
+            text.append(formatted.get(key, original))
+            text.append(part)
+        return "".join(text)
+
+    def write(self, model_file: str, map: MapState | None = None, **overrides) -> None:
+        with open(model_file, "w") as file:
+            file.write(self.generate(map, **overrides))
+
+    def map_values(self, map: MapState) -> dict:
+        if self.map_region not in self.keys:
+            raise ValueError("The model has no map initialization to replace")
+
+        values = {"N_COLS": map.N_COLS, "N_ROWS": map.N_ROWS}
+        for (entity, (count_name, positions_name)) in self.entity_constants.items():
+            positions = [tuple(pos) for pos in map.positions(entity).tolist()]
+            if count_name in self.values:
+                values[count_name] = len(positions)
+            if positions_name in self.values:
+                values[positions_name] = positions
+
+        # Exits are set from exit_pos in the models that have it
+        code = ["// Fires"] + [f"map[{x}][{y}] = CELL_FIRE;"
+                               for (x, y) in map.positions(CellType.FIRE).tolist()]
+        if "exit_pos" not in self.values:
+            code += ["// Exits"] + [f"map[{x}][{y}] = CELL_EXIT;"
+                                    for (x, y) in map.positions(CellType.EXIT).tolist()]
+        values[self.map_region] = f"\n{self.indent}".join(code)
+        return values
+
+    def format_value(value) -> str:
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (list, tuple)):
+            return "{" + ", ".join(ScenarioTemplate.format_value(item) for item in value) + "}"
+        return str(value)
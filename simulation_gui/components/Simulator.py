@@ -0,0 +1,666 @@
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+from typing import TextIO
+import io
+import math
+import random
+import re
+import numpy as np
+
+from components.Enums import CellType
+from components.MapState import MapState
+from components.Model import ModelLayout
+from components.Scenario import ScenarioTemplate
+
+
+# Parameters of a scenario of the faster models, read from the model the same
+# way verifyta would see them: the constants, with the given map and overrides
+# applied, the cells set by init_map() for the selected map_id and the weights
+# of the probabilistic branch of the drones.
+class SimulationScenario():
+    array_constants = ["drones_starting_pos", "N_v", "N_r",
+                       "survivors_starting_pos", "survivors_policies",
+                       "first_responders_starting_pos", "first_resp_policies", "exit_pos"]
+    scalar_constants = ["N_COLS", "N_ROWS", "T_zr", "T_fr", "T_v",
+                        "POLICY_RANDOM", "POLICY_DIRECT_MULTI", "POLICY_DIRECT_SINGLE"]
+
+    branch_pattern = re.compile(r'\bif\s*\(\s*map_id\s*==\s*(\w+)\s*\)\s*{')
+    assignment_pattern = re.compile(
+        r'\bmap\s*\[\s*(\w+)\s*\]\s*\[\s*(\w+)\s*\]\s*=\s*(\w+)\s*;')
+
+    def __init__(self, model_file: str | TextIO, map: MapState | None = None, **overrides):
+        text = ScenarioTemplate(model_file).generate(map, **overrides)
+        template = ScenarioTemplate(io.StringIO(text))
+        self.layout = ModelLayout(io.StringIO(text))
+
+        for name in self.scalar_constants:
+            if name not in self.layout.constants:
+                raise ValueError(f"The model has no constant {name}")
+        for name in self.array_constants:
+            if name not in template.values:
+                raise ValueError(f"The model has no constant {name}")
+
+        self.constants = self.layout.constants
+        self.arrays = {name: np.array(self.array_value(template.values[name]), dtype=np.int64)
+                       for name in self.array_constants}
+
+        (self.N_COLS, self.N_ROWS) = (self.constants["N_COLS"], self.constants["N_ROWS"])
+        self.cells = np.zeros((self.N_COLS, self.N_ROWS), dtype=np.uint8)
+        if template.map_region in template.keys:
+            self.init_cells(template.originals[template.keys.index(template.map_region)])
+        for (x, y) in self.arrays["exit_pos"].reshape(-1, 2):
+            self.cells[x, y] = CellType.EXIT.value
+
+        root = ElementTree.fromstring(text)
+        self.locations = {}
+        for element in root.iter("template"):
+            self.locations[element.findtext("name").strip()] = SimulationScenario.location_indices(element)
+        self.p_listen = self.branch_probability(root)
+
+    def array_value(self, text: str):
+        text = text.strip()
+        if text.startswith("{"):
+            return [self.array_value(item)
+                    for item in ModelLayout.split_top_level(text[1:-1], ",")]
+        return self.layout.evaluate(text)
+
+    # Cells assigned in the map specific part of init_map(), in the branch of
+    # the selected map_id when there is a branch per map
+    def init_cells(self, region: str) -> None:
+        region = ModelLayout.strip_comments(region)
+        branches = list(self.branch_pattern.finditer(region))
+        if branches:
+            for branch in branches:
+                if self.layout.evaluate(branch.group(1)) == self.constants.get("map_id"):
+                    end = ModelLayout.matching_brace(region, branch.end() - 1)
+                    region = region[branch.end():end]
+                    break
+            else:
+                region = ""
+
+        for (x, y, value) in self.assignment_pattern.findall(region):
+            self.cells[self.layout.evaluate(x), self.layout.evaluate(y)] = self.layout.evaluate(value)
+
+    # Index of each location by name, the one location that is neither named
+    # nor committed being the idle one of the template
+    def location_indices(template: ElementTree.Element) -> dict[str | None, int]:
+        indices = {}
+        for (i, location) in enumerate(template.findall("location")):
+            name = location.findtext("name")
+            if name:
+                indices[name.strip()] = i
+            elif location.find("committed") is None:
+                indices.setdefault(None, i)
+        return indices
+
+    # Probability that a drone instruction is followed, 1 without a branch
+    def branch_probability(self, root: ElementTree.Element) -> float:
+        for template in root.iter("template"):
+            if template.findtext("name").strip() != "Drone":
+                continue
+            names = {location.get("id"): location.findtext("name")
+                     for location in template.iter("location")}
+            branchpoints = {branchpoint.get("id") for branchpoint in template.iter("branchpoint")}
+
+            (success, total) = (0, 0)
+            for transition in template.iter("transition"):
+                if transition.find("source").get("ref") not in branchpoints:
+                    continue
+                weight = 1
+                for label in transition.findall("label"):
+                    if label.get("kind") == "probability":
+                        weight = self.layout.evaluate(label.text)
+                total += weight
+                if names.get(transition.find("target").get("ref")) == "SurvivorAndInNeedSelected":
+                    success += weight
+            if total > 0:
+                return success / total
+        return 1.0
+
+    def initial_map(self) -> MapState:
+        return MapState(self.cells.copy(), np.zeros_like(self.cells))
+
+
+# Discrete time surrogate of the Drone, Survivor, FirstResponder and
+# Initializer templates. Every process of the model waits exactly one time
+# unit between its moves, so time advances in steps of one and, at each step,
+# the processes that are due act once in a random order, as the races of the
+# simultaneous edges are resolved by verifyta. The moving policies, the fire
+# and exit cells and the T_zr, T_fr and T_v timers follow the model functions
+# of the same name. The differences with the timed automata are that the
+# first responders act on the step instead of at a random time within it and
+# that a survivor with no valid move stays put where the model would timelock.
+# Episodes are simulated one at a time by Episode, in plain Python: this is
+# the scalar reference engine, BatchSimulator is the NumPy one used by default
+# by simulate.py and checked against it.
+class Simulator():
+    counters = ["safe_survivors", "dead_survivors", "available_fr"]
+
+    # Survivor and first responder states, named as the template locations
+    MOVING = 0
+    ASSISTING_DIRECTLY = 1
+    SUFFERING = 2
+    BEING_ASSISTED = 3
+    SAFE = 4
+    DEAD = 5
+    AVAILABLE = 6
+    ASSISTING = 7
+    DONE = 8
+
+    survivor_locations = {MOVING: "Moving", ASSISTING_DIRECTLY: "AssistingDirectly",
+                          SUFFERING: "Suffering", BEING_ASSISTED: "BeingAssisted",
+                          SAFE: "Safe", DEAD: "Dead"}
+    first_resp_locations = {AVAILABLE: "Available", ASSISTING: "Assisting", DONE: None}
+
+    def __init__(self, scenario: SimulationScenario, horizon: int):
+        self.scenario = scenario
+        self.horizon = horizon
+
+        constants = scenario.constants
+        (N_COLS, N_ROWS) = (scenario.N_COLS, scenario.N_ROWS)
+        self.N_COLS = N_COLS
+        self.N_ROWS = N_ROWS
+        self.far = N_COLS + N_ROWS
+        self.T_zr = constants["T_zr"]
+        self.T_fr = constants["T_fr"]
+        self.T_v = constants["T_v"]
+        self.policies = (constants["POLICY_RANDOM"], constants["POLICY_DIRECT_MULTI"],
+                         constants["POLICY_DIRECT_SINGLE"])
+
+        # Cells are flat indices x * N_ROWS + y, as in MapState.cells.ravel()
+        flat = lambda positions: (positions[:, 0] * N_ROWS + positions[:, 1]).tolist()
+        arrays = scenario.arrays
+        self.drones_start = flat(arrays["drones_starting_pos"].reshape(-1, 2))
+        self.N_v = arrays["N_v"].tolist()
+        self.N_r = arrays["N_r"].tolist()
+        self.survivors_start = flat(arrays["survivors_starting_pos"].reshape(-1, 2))
+        self.survivors_policies = arrays["survivors_policies"].tolist()
+        self.first_resp_start = flat(arrays["first_responders_starting_pos"].reshape(-1, 2))
+        self.first_resp_policies = arrays["first_resp_policies"].tolist()
+        self.exits = flat(arrays["exit_pos"].reshape(-1, 2))
+
+        (xs, ys) = np.divmod(np.arange(N_COLS * N_ROWS), N_ROWS)
+        self.xs = xs.tolist()
+        self.ys = ys.tolist()
+
+        # Fires and exits never change, so the checks on them are tables
+        fire = np.pad(scenario.cells == CellType.FIRE.value, 1)
+        exit = np.pad(scenario.cells == CellType.EXIT.value, 1)
+        near_fire = np.zeros((N_COLS, N_ROWS), dtype=bool)
+        near_exit = np.zeros((N_COLS, N_ROWS), dtype=bool)
+        for i in range(3):
+            for j in range(3):
+                near_fire |= fire[i:i + N_COLS, j:j + N_ROWS]
+                near_exit |= exit[i:i + N_COLS, j:j + N_ROWS]
+        self.near_fire = near_fire.ravel().tolist()
+        self.near_exit = near_exit.ravel().tolist()
+
+        # find_nearest_exit(), the first exit at the minimum distance
+        if self.exits:
+            exit_xy = arrays["exit_pos"].reshape(-1, 2)
+            distances = np.maximum(np.abs(xs[:, None] - exit_xy[None, :, 0]),
+                                   np.abs(ys[:, None] - exit_xy[None, :, 1]))
+            self.nearest_exit = np.array(self.exits)[np.argmin(distances, axis=1)].tolist()
+        else:
+            self.nearest_exit = [0] * (N_COLS * N_ROWS)
+
+        # Neighbours in the order of the i, j loops of the model, with and
+        # without the cell itself
+        self.radius = []
+        self.moves = []
+        for (x, y) in zip(self.xs, self.ys):
+            cells = [(x + i) * N_ROWS + y + j for i in (-1, 0, 1) for j in (-1, 0, 1)
+                     if 0 <= x + i < N_COLS and 0 <= y + j < N_ROWS]
+            self.radius.append(cells)
+            self.moves.append([cell for cell in cells if cell != x * N_ROWS + y])
+
+        self.initial_cells = scenario.cells.ravel().tolist()
+        self.p_listen = scenario.p_listen
+
+        self.trace_slots = None
+
+    def distance(self, cell1: int, cell2: int) -> int:
+        return max(abs(self.xs[cell1] - self.xs[cell2]), abs(self.ys[cell1] - self.ys[cell2]))
+
+    # Runs the given number of episodes and returns the value of the counters
+    # at each step, shaped (runs, horizon + 1, counters)
+    def run(self, runs: int, seed: int | np.random.SeedSequence | None = None) -> np.ndarray:
+        generator = Simulator.generator(seed)
+        counters = np.zeros((runs, self.horizon + 1, len(self.counters)), dtype=np.int16)
+        for run in range(runs):
+            counters[run] = self.run_episode(generator)
+        return counters
+
+    # Share of the episodes ending with each value of the given counter
+    def distribution(counters: np.ndarray, counter: str) -> np.ndarray:
+        final = counters[:, -1, Simulator.counters.index(counter)]
+        return np.bincount(final) / max(len(final), 1)
+
+    # Scalar draws are much faster from the random module than from NumPy
+    def generator(seed: int | np.random.SeedSequence | None = None) -> random.Random:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        return random.Random(int(seed.generate_state(1)[0]))
+
+    def run_all(self, runs: int, workers: int | None = None, seed: int | None = None) -> np.ndarray:
+        workers = workers or 1
+        if workers == 1:
+            return self.run(runs, seed)
+
+        # A few chunks per worker balance the load, each with its own stream
+        chunks = min(runs, workers * 4)
+        sizes = [runs // chunks + (i < runs % chunks) for i in range(chunks)]
+        seeds = np.random.SeedSequence(seed).spawn(chunks)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(self.run, sizes, seeds))
+        return np.concatenate(results)
+
+    def run_episode(self, generator: random.Random, trace: TextIO | None = None) -> np.ndarray:
+        episode = Episode(self, generator)
+        counters = np.zeros((self.horizon + 1, len(self.counters)), dtype=np.int16)
+        counters[0] = episode.counters()
+        if trace is not None:
+            self.write_state(trace, episode)
+
+        for now in range(1, self.horizon + 1):
+            if episode.finished():
+                counters[now:] = counters[now - 1]
+                break
+            episode.step(now)
+            counters[now] = episode.counters()
+            if trace is not None:
+                self.write_state(trace, episode)
+
+        if trace is not None:
+            trace.write(".\n")
+        return counters
+
+    # States in the .xtr format read by XtrReader, without clock constraints
+    # and without the transitions between them
+    def write_state(self, trace: TextIO, episode: "Episode") -> None:
+        if self.trace_slots is None:
+            self.trace_slots = self.resolve_slots()
+        (indices, cell_slots, drone_slots) = self.trace_slots
+        locations = self.scenario.locations
+
+        lines = []
+        for process in self.scenario.layout.processes:
+            (template, _, i) = process.partition("(")
+            i = int(i[:-1]) if i else 0
+            if template == "Drone":
+                lines.append(locations["Drone"]["Moving"])
+            elif template == "Survivor":
+                lines.append(locations["Survivor"][
+                    self.survivor_locations[episode.survivor_state[i]]])
+            elif template == "FirstResponder":
+                lines.append(locations["FirstResponder"][
+                    self.first_resp_locations[episode.first_resp_state[i]]])
+            else:
+                lines.append(locations[template].get(None, 0))
+        lines += [".", "."]
+
+        values = np.zeros(len(self.scenario.layout.variables), dtype=np.int64)
+        values[cell_slots[0]] = np.array(episode.cells)[cell_slots[1]]
+        values[drone_slots[0]] = np.array(episode.drones)[drone_slots[1]]
+        for (name, value) in episode.variables():
+            slot = indices.get(name)
+            if slot is not None:
+                values[slot] = value
+        lines += values.astype(str).tolist()
+        lines.append(".")
+        trace.write("\n".join(str(line) for line in lines) + "\n")
+
+    def resolve_slots(self) -> tuple[dict[str, int], tuple[list, list], tuple[list, list]]:
+        indices = {}
+        cells = ([], [])
+        drones = ([], [])
+        for (slot, name) in enumerate(self.scenario.layout.variables):
+            indices[name] = slot
+            match = re.match(r'(map|drone_map)\[(\d+)\]\[(\d+)\]$', name)
+            if match:
+                target = cells if match.group(1) == "map" else drones
+                target[0].append(slot)
+                target[1].append(int(match.group(2)) * self.N_ROWS + int(match.group(3)))
+        return (indices, cells, drones)
+
+
+# State of one simulated episode. Positions are flat cell indices and, as in
+# the model, the actors that left the map are at cell 0. The processes act one
+# by one with scalar draws from random.Random, which is faster than NumPy for
+# a single episode, BatchSimulator vectorizing the same steps over episodes.
+class Episode():
+    def __init__(self, simulator: Simulator, generator: random.Random):
+        self.simulator = simulator
+        self.random = generator
+        self.now = 0
+
+        self.cells = list(simulator.initial_cells)
+        self.drones = [0] * len(self.cells)
+        self.available_fr = 0
+        self.safe_survivors = 0
+        self.dead_survivors = 0
+        self.timeout = 0
+        self.target_in_need = 0
+
+        # init_done is received in the order of the system line
+        self.drone_pos = list(simulator.drones_start)
+        self.drone_step = [0] * len(self.drone_pos)
+        for pos in self.drone_pos:
+            self.drones[pos] = 1
+
+        count = len(simulator.survivors_start)
+        self.survivor_pos = list(simulator.survivors_start)
+        self.survivor_state = [Simulator.MOVING] * count
+        self.survivor_due = [1] * count
+        self.survivor_wait = [0] * count
+        self.survivor_outcome = [Simulator.SAFE] * count
+        for (i, pos) in enumerate(self.survivor_pos):
+            if simulator.near_fire[pos]:
+                self.survivor_state[i] = Simulator.SUFFERING
+                self.survivor_due[i] = simulator.T_v
+                self.cells[pos] = CellType.IN_NEED.value
+            else:
+                self.cells[pos] = CellType.SURVIVOR.value
+
+        count = len(simulator.first_resp_start)
+        self.first_resp_pos = list(simulator.first_resp_start)
+        self.first_resp_state = [Simulator.AVAILABLE] * count
+        self.first_resp_due = [1] * count
+        self.first_resp_wait = [0] * count
+        self.first_resp_target = [0] * count
+        for pos in self.first_resp_pos:
+            self.cells[pos] = CellType.FIRST_RESP.value
+            self.available_fr += 1
+
+        self.processes = [(self.drone_act, i) for i in range(len(self.drone_pos))] + \
+            [(self.survivor_act, i) for i in range(len(self.survivor_pos))] + \
+            [(self.first_resp_act, i) for i in range(len(self.first_resp_pos))]
+
+    def counters(self) -> tuple[int, int, int]:
+        return (self.safe_survivors, self.dead_survivors, self.available_fr)
+
+    def finished(self) -> bool:
+        return self.safe_survivors + self.dead_survivors == len(self.survivor_pos)
+
+    def step(self, now: int) -> None:
+        self.now = now
+        self.random.shuffle(self.processes)
+        for (act, i) in self.processes:
+            act(i)
+
+    def variables(self) -> list[tuple[str, int]]:
+        xs = self.simulator.xs
+        ys = self.simulator.ys
+        variables = [("timeout", self.timeout), ("available_fr", self.available_fr),
+                     ("safe_survivors", self.safe_survivors),
+                     ("dead_survivors", self.dead_survivors),
+                     ("target_in_need.x", xs[self.target_in_need]),
+                     ("target_in_need.y", ys[self.target_in_need])]
+        for (i, pos) in enumerate(self.survivor_pos):
+            variables += [(f"survivor_pos[{i}].x", xs[pos]), (f"survivor_pos[{i}].y", ys[pos]),
+                          (f"Survivor({i}).pos.x", xs[pos]), (f"Survivor({i}).pos.y", ys[pos]),
+                          (f"Survivor({i}).wait", self.survivor_wait[i])]
+        for (i, pos) in enumerate(self.first_resp_pos):
+            target = self.first_resp_target[i]
+            variables += [(f"first_resp_pos[{i}].x", xs[pos]), (f"first_resp_pos[{i}].y", ys[pos]),
+                          (f"FirstResponder({i}).pos.x", xs[pos]),
+                          (f"FirstResponder({i}).pos.y", ys[pos]),
+                          (f"FirstResponder({i}).wait", self.first_resp_wait[i]),
+                          (f"FirstResponder({i}).target.x", xs[target]),
+                          (f"FirstResponder({i}).target.y", ys[target])]
+        for (i, pos) in enumerate(self.drone_pos):
+            variables += [(f"Drone({i}).pos.x", xs[pos]), (f"Drone({i}).pos.y", ys[pos]),
+                          (f"Drone({i}).move_policy_next_move_idx", self.drone_step[i])]
+        return variables
+
+    # Drone: instructs a survivor in range to assist an in need one, again at
+    # the same instant when the instruction is followed, or flies its square
+    def drone_act(self, i: int) -> None:
+        simulator = self.simulator
+        pos = self.drone_pos[i]
+        while (self.actor_in_range(pos, CellType.IN_NEED.value, simulator.N_v[i]) and
+               self.actor_in_range(pos, CellType.SURVIVOR.value, simulator.N_v[i])):
+            if self.random.random() >= simulator.p_listen:
+                return
+            self.instruct(pos)
+
+        # N_r steps right, up, left and down, skipping the ones out of the map
+        length = simulator.N_r[i]
+        step = self.drone_step[i]
+        (x, y) = (simulator.xs[pos], simulator.ys[pos])
+        if step < length:
+            x += 1
+        elif step < 2 * length:
+            y -= 1
+        elif step < 3 * length:
+            x -= 1
+        else:
+            y += 1
+        self.drone_step[i] = (step + 1) % (4 * length)
+        if 0 <= x < simulator.N_COLS and 0 <= y < simulator.N_ROWS:
+            self.drones[pos] = 0
+            self.drone_pos[i] = x * simulator.N_ROWS + y
+            self.drones[self.drone_pos[i]] = 1
+
+    def instruct(self, pos: int) -> None:
+        simulator = self.simulator
+        in_need = self.nearest_survivor(pos, CellType.IN_NEED.value)
+        self.cells[in_need] = CellType.ASSISTED.value
+        zero_resp = self.nearest_survivor(pos, CellType.SURVIVOR.value)
+        self.cells[zero_resp] = CellType.ZERO_RESP.value
+
+        if self.available_fr > 0:
+            first_resp = self.nearest_first_resp(pos)
+            self.cells[first_resp] = CellType.ASSISTING.value
+            self.timeout = simulator.distance(zero_resp, first_resp) + \
+                simulator.distance(first_resp, in_need) + simulator.T_fr
+            self.target_in_need = in_need
+            self.set_timeout(first_resp)
+        else:
+            self.timeout = simulator.distance(in_need, zero_resp) + simulator.T_zr
+        self.set_timeout(zero_resp)
+        self.set_timeout(in_need)
+
+    def actor_in_range(self, pos: int, value: int, range: int) -> bool:
+        distance = self.simulator.distance
+        for survivor in self.survivor_pos:
+            if self.cells[survivor] == value and distance(pos, survivor) <= range:
+                return True
+        return False
+
+    # find_nearest_actor(), cell 0 when there is none
+    def nearest_survivor(self, pos: int, value: int) -> int:
+        return self.nearest(pos, value, self.survivor_pos)
+
+    def nearest_first_resp(self, pos: int) -> int:
+        return self.nearest(pos, CellType.FIRST_RESP.value, self.first_resp_pos)
+
+    def nearest(self, pos: int, value: int, actors: list[int]) -> int:
+        distance = self.simulator.distance
+        (best, best_distance) = (0, self.simulator.far)
+        for actor in actors:
+            if self.cells[actor] == value:
+                actor_distance = distance(pos, actor)
+                if actor_distance < best_distance:
+                    (best, best_distance) = (actor, actor_distance)
+        return best
+
+    # Broadcast on set_timeout[x][y] to the processes at the cell
+    def set_timeout(self, cell: int) -> None:
+        (now, timeout) = (self.now, self.timeout)
+        for (i, pos) in enumerate(self.survivor_pos):
+            if pos != cell:
+                continue
+            state = self.survivor_state[i]
+            if state == Simulator.MOVING:
+                self.survivor_state[i] = Simulator.ASSISTING_DIRECTLY
+                self.survivor_wait[i] = timeout
+                self.survivor_due[i] = now + timeout
+            elif state == Simulator.SUFFERING:
+                # The clock of a suffering survivor started at the init
+                self.survivor_state[i] = Simulator.BEING_ASSISTED
+                if now + timeout < self.simulator.T_v:
+                    self.survivor_wait[i] = timeout
+                    self.survivor_due[i] = now + timeout
+                    self.survivor_outcome[i] = Simulator.SAFE
+                else:
+                    self.survivor_wait[i] = self.simulator.T_v
+                    self.survivor_due[i] = self.simulator.T_v
+                    self.survivor_outcome[i] = Simulator.DEAD
+
+        for (i, pos) in enumerate(self.first_resp_pos):
+            if pos == cell and self.first_resp_state[i] == Simulator.AVAILABLE:
+                self.first_resp_state[i] = Simulator.ASSISTING
+                self.first_resp_wait[i] = timeout
+                self.first_resp_due[i] = now + timeout
+                self.first_resp_target[i] = self.target_in_need
+                self.available_fr -= 1
+
+    def survivor_act(self, i: int) -> None:
+        if self.survivor_due[i] > self.now:
+            return
+        state = self.survivor_state[i]
+        pos = self.survivor_pos[i]
+        simulator = self.simulator
+
+        if state == Simulator.MOVING:
+            if simulator.near_exit[pos]:
+                self.leave(i, Simulator.SAFE)
+                return
+            move = self.choose_move(pos, simulator.nearest_exit[pos], True,
+                                    simulator.survivors_policies[i])
+            if move is not None:
+                self.cells[pos] = CellType.EMPTY.value
+                self.cells[move] = CellType.SURVIVOR.value
+                self.survivor_pos[i] = move
+            self.survivor_due[i] = self.now + 1
+        elif state == Simulator.ASSISTING_DIRECTLY:
+            self.leave(i, Simulator.SAFE)
+        elif state == Simulator.SUFFERING:
+            self.leave(i, Simulator.DEAD)
+        elif state == Simulator.BEING_ASSISTED:
+            self.leave(i, self.survivor_outcome[i])
+
+    def leave(self, i: int, outcome: int) -> None:
+        pos = self.survivor_pos[i]
+        if self.cells[pos] != CellType.FIRST_RESP.value:
+            self.cells[pos] = CellType.EMPTY.value
+        if outcome == Simulator.SAFE:
+            self.safe_survivors += 1
+        else:
+            self.dead_survivors += 1
+        self.survivor_state[i] = outcome
+        self.survivor_pos[i] = 0
+        self.survivor_wait[i] = 0
+        self.survivor_due[i] = math.inf
+
+    def first_resp_act(self, i: int) -> None:
+        if self.first_resp_due[i] > self.now:
+            return
+        state = self.first_resp_state[i]
+        pos = self.first_resp_pos[i]
+        simulator = self.simulator
+
+        if state == Simulator.ASSISTING:
+            # Takes the place of the assisted survivor
+            target = self.first_resp_target[i]
+            self.cells[pos] = CellType.EMPTY.value
+            self.cells[target] = CellType.FIRST_RESP.value
+            self.first_resp_pos[i] = target
+            self.first_resp_state[i] = Simulator.AVAILABLE
+            self.first_resp_wait[i] = 0
+            self.first_resp_target[i] = 0
+            self.first_resp_due[i] = self.now + 1
+            self.available_fr += 1
+        elif state == Simulator.AVAILABLE:
+            if self.finished():
+                self.first_resp_state[i] = Simulator.DONE
+                self.first_resp_pos[i] = 0
+                self.first_resp_due[i] = math.inf
+                return
+
+            in_need = CellType.IN_NEED.value
+            for cell in simulator.radius[pos]:
+                if self.cells[cell] == in_need:
+                    self.cells[cell] = CellType.ASSISTED.value
+                    self.cells[pos] = CellType.ASSISTING.value
+                    self.available_fr -= 1
+                    self.timeout = simulator.T_fr
+                    self.first_resp_target[i] = cell
+                    self.set_timeout(cell)
+                    self.first_resp_state[i] = Simulator.ASSISTING
+                    self.first_resp_wait[i] = simulator.T_fr
+                    self.first_resp_due[i] = self.now + simulator.T_fr
+                    return
+
+            move = self.choose_move(pos, self.nearest_survivor(pos, in_need), False,
+                                    simulator.first_resp_policies[i])
+            if move is not None:
+                self.cells[pos] = CellType.EMPTY.value
+                self.cells[move] = CellType.FIRST_RESP.value
+                self.first_resp_pos[i] = move
+            self.first_resp_due[i] = self.now + 1
+
+    # is_move_valid_g(): a uniform choice among the moves the policy allows
+    def choose_move(self, pos: int, target: int, survivor: bool, policy: int) -> int | None:
+        simulator = self.simulator
+        empty = CellType.EMPTY.value
+        feasible = [move for move in simulator.moves[pos] if self.cells[move] == empty and
+                    not (survivor and simulator.near_fire[move])]
+        if not feasible:
+            return None
+
+        (random_policy, multi_policy, single_policy) = simulator.policies
+        if policy == random_policy:
+            return self.random.choice(feasible)
+
+        distances = [simulator.distance(move, target) for move in feasible]
+        best = min(distances)
+        if policy == single_policy:
+            return feasible[distances.index(best)]
+        if policy == multi_policy:
+            return self.random.choice([move for (move, distance) in zip(feasible, distances)
+                                       if distance == best])
+        return None
+
+
+# Estimate of a "Pr [<=bound] (<> condition)" or "Pr [<=bound] ([] condition)"
+# query over the global counters of simulated episodes. The number of runs
+# follows the Chernoff-Hoeffding bound for the interval width and
+# confidence, as in the probability estimation of verifyta.
+class ProbabilityQuery():
+    pattern = re.compile(
+        r'^\s*Pr\s*\[\s*(?:\w+\s*)?<=\s*(.+?)\s*\]\s*\(\s*(<>|\[\])\s*(.+)\)\s*$', re.S)
+
+    def __init__(self, formula: str, layout: ModelLayout):
+        match = self.pattern.match(formula)
+        if match is None:
+            raise ValueError(f"Unsupported query {formula}")
+        self.formula = " ".join(formula.split())
+        self.layout = layout
+        self.bound = layout.evaluate(match.group(1))
+        self.eventually = match.group(2) == "<>"
+        self.condition = match.group(3)
+
+    def runs(epsilon: float = 0.05, alpha: float = 0.05) -> int:
+        return math.ceil(math.log(2 / alpha) / (2 * epsilon ** 2))
+
+    # Checks the condition once per distinct value of the counters
+    def holds(self, counters: np.ndarray) -> np.ndarray:
+        steps = counters[:, :self.bound + 1]
+        (values, inverse) = np.unique(steps.reshape(-1, steps.shape[-1]), axis=0,
+                                      return_inverse=True)
+        truth = np.array([bool(self.layout.evaluate(
+            self.condition, dict(self.layout.constants, **dict(zip(Simulator.counters, row)))))
+            for row in values.tolist()])
+        truth = truth[inverse.ravel()].reshape(steps.shape[:2])
+        return truth.any(axis=1) if self.eventually else truth.all(axis=1)
+
+    def estimate(self, counters: np.ndarray, alpha: float = 0.05) -> dict:
+        if not len(counters):
+            return {"formula": self.formula, "runs": 0, "value": math.nan,
+                    "ci_low": 0.0, "ci_high": 1.0}
+        epsilon = math.sqrt(math.log(2 / alpha) / (2 * len(counters)))
+        value = float(self.holds(counters).mean())
+        return {"formula": self.formula, "runs": len(counters), "value": value,
+                "ci_low": max(0.0, value - epsilon), "ci_high": min(1.0, value + epsilon)}
@@ -0,0 +1,163 @@
+from os import path
+from typing import Callable
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+from components.MapState import MapState
+from components.Scenario import ScenarioTemplate
+from components.Verifier import Verifier, VerificationJob
+
+
+# Adaptive sweep of an SMC query over a grid of scenario constants. A few
+# points spread over the grid are verified first, then every round verifies the
+# unexplored points whose nearest verified neighbours disagree the most, so
+# that the runs concentrate where the probability changes steeply. The sweep
+# stops once no neighbourhood differs by more than the requested interval
+# width, which is also the width asked to verifyta for each estimate, or when
+# the budget of runs is spent. Without two estimates to compare, e.g. when
+# every run failed, the sweep stops with no usable estimates instead.
+class Sweep():
+    neighbours = 4
+    pool = 256
+
+    CONVERGED = "converged"
+    EXHAUSTED = "budget exhausted"
+    NO_ESTIMATES = "no usable estimates"
+
+    def __init__(self, template: ScenarioTemplate, verifier: Verifier, formula: str,
+                 parameters: dict[str, list], map: MapState | None = None,
+                 width: float = 0.05, budget: int = 200, batch: int | None = None,
+                 directory: str | None = None, seed: int = 0):
+        self.template = template
+        self.verifier = verifier
+        self.formula = formula
+        self.names = list(parameters)
+        self.domains = [list(values) for values in parameters.values()]
+        self.map = map
+        self.width = width
+        self.budget = budget
+        self.batch = batch or os.cpu_count() or 1
+        # Directory of the generated models, a temporary one removed after the
+        # run by default
+        self.directory = directory
+        self.random = np.random.default_rng(seed)
+
+        self.shape = np.array([len(values) for values in self.domains])
+        # Grid indices and results of the verified points
+        self.points: list[tuple[int, ...]] = []
+        self.results: list[dict] = []
+        # One of CONVERGED, EXHAUSTED and NO_ESTIMATES once run
+        self.status: str | None = None
+
+    def run(self, on_result: Callable[[dict], None] | None = None) -> list[dict]:
+        if self.directory is not None:
+            return self.sweep(on_result)
+        with tempfile.TemporaryDirectory(prefix="sweep_") as directory:
+            self.directory = directory
+            try:
+                return self.sweep(on_result)
+            finally:
+                self.directory = None
+
+    def sweep(self, on_result: Callable[[dict], None] | None = None) -> list[dict]:
+        batch = self.initial_points()
+        while batch and len(self.points) < self.budget:
+            batch = batch[:self.budget - len(self.points)]
+            jobs = [self.job(point) for point in batch]
+            for (point, result) in zip(batch, self.verifier.run_all(jobs, self.batch)):
+                result.update(zip(self.names, self.values(point)))
+                self.points.append(point)
+                self.results.append(result)
+                if on_result is not None:
+                    on_result(result)
+            batch = self.next_points()
+
+        if self.estimated() < min(2, int(np.prod(self.shape))):
+            self.status = Sweep.NO_ESTIMATES
+        else:
+            self.status = Sweep.EXHAUSTED if batch else Sweep.CONVERGED
+        return self.results
+
+    # Number of runs that gave an estimate, the others failed or timed out
+    def estimated(self) -> int:
+        return sum(result["value"] is not None for result in self.results)
+
+    def values(self, point: tuple[int, ...]) -> list:
+        return [domain[i] for (domain, i) in zip(self.domains, point)]
+
+    def job(self, point: tuple[int, ...]) -> VerificationJob:
+        model = self.template.generate(
+            self.map, **dict(zip(self.names, self.values(point))))
+
+        # Files are named by content, so that the cache recognises reruns
+        model_file = path.join(self.directory,
+                               hashlib.sha256(model.encode()).hexdigest()[:16] + ".xml")
+        if not path.exists(model_file):
+            with open(model_file, "w") as file:
+                file.write(model)
+
+        scenario = ",".join(f"{name}={value}" for (name, value)
+                            in zip(self.names, self.values(point)))
+        return VerificationJob(model_file, "sweep", scenario, 0, self.formula,
+                               ["-E", str(self.width / 2)])
+
+    # The two opposite corners of the grid and random points up to a batch
+    def initial_points(self) -> list[tuple[int, ...]]:
+        points = {tuple([0] * len(self.shape)), tuple(self.shape - 1)}
+        while len(points) < min(self.batch, int(np.prod(self.shape))):
+            points.add(tuple(int(i) for i in self.random.integers(0, self.shape)))
+        return sorted(points)
+
+    def next_points(self) -> list[tuple[int, ...]]:
+        verified = np.array(self.points)
+        estimates = np.array([np.nan if result["value"] is None else result["value"]
+                              for result in self.results], dtype=float)
+        known = ~np.isnan(estimates)
+        if known.sum() < 2:
+            return []
+        (verified, estimates) = (verified[known], estimates[known])
+
+        # Candidates are random unexplored points and the midpoints between
+        # verified points that are far apart in value
+        candidates = set()
+        total = int(np.prod(self.shape))
+        for index in self.random.integers(0, total, min(self.pool, total)):
+            candidates.add(tuple(int(i) for i in np.unravel_index(index, self.shape)))
+        scale = np.maximum(self.shape - 1, 1)
+        normalized = verified / scale
+        distances = np.linalg.norm(
+            normalized[:, None, :] - normalized[None, :, :], axis=2)
+        for i in range(len(verified)):
+            for j in np.argsort(distances[i])[1:self.neighbours + 1]:
+                if abs(estimates[i] - estimates[j]) > self.width:
+                    candidates.add(tuple(int(k) for k in
+                                         (verified[i] + verified[j]) // 2))
+        candidates -= set(self.points)
+        if not candidates:
+            return []
+
+        # Score a candidate by the spread of its nearest verified neighbours
+        candidates = np.array(sorted(candidates))
+        distances = np.linalg.norm(
+            (candidates / scale)[:, None, :] - normalized[None, :, :], axis=2)
+        nearest = np.argsort(distances, axis=1)[:, :self.neighbours]
+        spread = np.ptp(estimates[nearest], axis=1)
+        closest = distances[np.arange(len(candidates)), nearest[:, 0]]
+
+        steep = spread > self.width
+        if not steep.any():
+            return []
+        order = np.lexsort((-closest[steep], -spread[steep]))
+        return [tuple(int(i) for i in point) for point in candidates[steep][order][:self.batch]]
+
+    def range_values(text: str) -> list:
+        if ":" in text:
+            bounds = [int(bound) for bound in text.split(":")]
+            return list(range(bounds[0], bounds[1] + 1, bounds[2] if len(bounds) > 2 else 1))
+        values = []
+        for value in text.split(","):
+            value = value.strip()
+            values.append(int(value) if value.lstrip("-").isdigit() else value)
+        return values
@@ -1,25 +1,320 @@
-from PySide6.QtWidgets import QWidget, QPushButton, QHBoxLayout
-from PySide6.QtGui import QKeySequence
-from PySide6.QtCore import Slot, QJsonArray, Qt
+from PySide6.QtWidgets import QWidget, QPushButton, QHBoxLayout, QVBoxLayout, QComboBox, QLabel, QSlider
+from PySide6.QtCore import Slot, Qt, QThreadPool, QTimer
 
 from components.Enums import CellType
-from pyuppaal import set_verifyta_path, UModel
-from io import TextIOWrapper
+from components.MapState import MapState
+from components.Model import ModelLayout
+from components.Xtr import XtrReader
+from threading import Lock
+from typing import Callable, TextIO
 import re
+import numpy as np
 
-set_verifyta_path('~/opt/uppaal-5.1.0-beta5-linux64/bin/verifyta')
 
+# Every state of a trace has the same variables in the same order, so the names
+# are resolved to map slots once and each state is then decoded by array gathers
+class TraceIndexer():
+    cell_pattern = re.compile(r'map\[(\d+)\]\[(\d+)\]$')
+    drone_pattern = re.compile(r'drone_map\[(\d+)\]\[(\d+)\]$')
+    entity_pattern = re.compile(
+        r'(FirstResponder|Survivor)\((\d+)\)\.pos\.([xy])$')
 
+    def __init__(self, N_COLS: int, N_ROWS: int, variables_name: list[str]):
+        self.N_COLS = N_COLS
+        self.N_ROWS = N_ROWS
+
+        cells = ([], [])
+        drones = ([], [])
+        entities = {"FirstResponder": {}, "Survivor": {}}
+
+        for slot, var in enumerate(variables_name):
+            result = self.cell_pattern.match(var)
+            if result:
+                self.add_slot(cells, slot, result.groups())
+                continue
+            result = self.drone_pattern.match(var)
+            if result:
+                self.add_slot(drones, slot, result.groups())
+                continue
+            result = self.entity_pattern.match(var)
+            if result:
+                (name, i, axis) = result.groups()
+                entities[name].setdefault(int(i), {})[axis] = slot
+
+        (self.cell_slots, self.cell_index) = self.to_arrays(cells)
+        (self.drone_slots, self.drone_index) = self.to_arrays(drones)
+        self.first_resp_slots = self.entity_slots(entities["FirstResponder"])
+        self.survivor_slots = self.entity_slots(entities["Survivor"])
+
+    def add_slot(self, slots: tuple[list, list], slot: int, pos: tuple[str, str]) -> None:
+        (x, y) = (int(pos[0]), int(pos[1]))
+        if x < self.N_COLS and y < self.N_ROWS:
+            slots[0].append(slot)
+            slots[1].append(x * self.N_ROWS + y)
+
+    def to_arrays(self, slots: tuple[list, list]) -> tuple[np.ndarray, np.ndarray]:
+        return (np.array(slots[0], dtype=np.intp), np.array(slots[1], dtype=np.intp))
+
+    def entity_slots(self, entities: dict[int, dict[str, int]]) -> np.ndarray:
+        # Entities whose position is not in the trace are read from slot -1,
+        # which is always the zero appended by gather
+        count = max(entities.keys(), default=-1) + 1
+        slots = np.full((count, 2), -1, dtype=np.intp)
+        for i, axes in entities.items():
+            slots[i] = (axes.get("x", -1), axes.get("y", -1))
+        return slots
+
+    def gather(self, variables_value: np.ndarray) -> MapState:
+        values = np.zeros(len(variables_value) + 1, dtype=np.int64)
+        values[:-1] = variables_value
+
+        cells = np.zeros(self.N_COLS * self.N_ROWS, dtype=np.uint8)
+        cells[self.cell_index] = values[self.cell_slots]
+        drones = np.zeros(self.N_COLS * self.N_ROWS, dtype=np.uint8)
+        drones[self.drone_index] = values[self.drone_slots]
+
+        map = MapState(cells.reshape(self.N_COLS, self.N_ROWS),
+                       drones.reshape(self.N_COLS, self.N_ROWS))
+        map.first_responders = self.positions(
+            values, self.first_resp_slots, map.count_actors(CellType.FIRST_RESP))
+        map.survivors = self.positions(
+            values, self.survivor_slots, map.count_actors(CellType.SURVIVOR))
+
+        return map
+
+    # Cells and drones of many states at once, as (states, N_COLS * N_ROWS)
+    def gather_all(self, states: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        cells = np.zeros((len(states), self.N_COLS * self.N_ROWS), dtype=np.uint8)
+        cells[:, self.cell_index] = states[:, self.cell_slots]
+        drones = np.zeros((len(states), self.N_COLS * self.N_ROWS), dtype=np.uint8)
+        drones[:, self.drone_index] = states[:, self.drone_slots]
+        return (cells, drones)
+
+    # Positions of the entities in many states at once, as (states, entities, 2)
+    def gather_positions(self, states: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        values = np.zeros((len(states), states.shape[1] + 1), dtype=np.int16)
+        values[:, :-1] = states
+        return values[:, slots]
+
+    def positions(self, values: np.ndarray, slots: np.ndarray, count: int) -> list[tuple[int, int]]:
+        positions = [(0, 0) for _ in range(count)]
+        found = min(count, len(slots))
+        positions[:found] = [tuple(pos)
+                             for pos in values[slots[:found]].tolist()]
+        return positions
+
+
+# Decoded trace held as a keyframe of the whole map every keyframe_interval
+# steps and, for every step, the cells that changed since the previous one. A
+# step is rebuilt from its keyframe, or from the last step rebuilt when that
+# is closer, so seeking anywhere applies at most keyframe_interval deltas and
+# playing the trace forward applies a single one per step. The changes of all
+# the steps are packed in flat arrays indexed by delta_offsets, grown as the
+# states are appended. The trace can be filled in background by load(), the
+# steps decoded so far being available while the rest is read.
+class TraceStore():
+    complete = False
+    cancelled = False
+    error = None
+
+    def __init__(self, indexer: TraceIndexer, keyframe_interval: int = 64):
+        self.indexer = indexer
+        self.keyframe_interval = keyframe_interval
+        self.steps = 0
+        self.changes = 0
+        self.lock = Lock()
+
+        self.keyframes: list[tuple[np.ndarray, np.ndarray]] = []
+        self.delta_offsets = np.zeros(1, dtype=np.int64)
+        self.delta_index = np.zeros(0, dtype=np.uint32)
+        self.delta_cells = np.zeros(0, dtype=np.uint8)
+        self.delta_drones = np.zeros(0, dtype=np.uint8)
+        self.first_responders = np.zeros((0, len(indexer.first_resp_slots), 2), dtype=np.int16)
+        self.survivors = np.zeros((0, len(indexer.survivor_slots), 2), dtype=np.int16)
+
+        # Last state appended and last step rebuilt
+        self.last = None
+        self.cursor = None
+
+    def read(trace_file: TextIO, layout: ModelLayout, indexer: TraceIndexer,
+             keyframe_interval: int = 64, chunk_size: int = 4096) -> "TraceStore":
+        store = TraceStore(indexer, keyframe_interval)
+        store.fill(trace_file, layout, chunk_size)
+        if store.error is not None:
+            raise store.error
+        return store
+
+    # Fills the store in background, from a thread of the global pool. The
+    # states can also be written by a writer like TraceCacheWriter, committed
+    # once the whole trace is read and aborted otherwise.
+    def load(self, trace_file: str, layout: ModelLayout, chunk_size: int = 1024, writer=None) -> None:
+        def fill() -> None:
+            try:
+                with open(trace_file) as file:
+                    self.fill(file, layout, chunk_size, writer and writer.append)
+            except Exception as error:
+                self.error = error
+            finally:
+                if writer is not None:
+                    if self.error is None and not self.cancelled:
+                        writer.commit()
+                    else:
+                        writer.abort()
+                self.complete = True
+        QThreadPool.globalInstance().start(fill)
+
+    # Appends the states of the trace a chunk at a time, the chunks being also
+    # handed to on_chunk. A malformed trace keeps the steps read before the
+    # error, which is kept in error.
+    def fill(self, trace_file: TextIO, layout: ModelLayout, chunk_size: int = 4096,
+             on_chunk: Callable[[np.ndarray], None] | None = None) -> None:
+        states = []
+        # Small chunks first, so that the first steps are soon available
+        size = min(16, chunk_size)
+        try:
+            for state in XtrReader(trace_file, layout):
+                states.append(state)
+                if len(states) == size:
+                    self.append(np.vstack(states), on_chunk)
+                    states = []
+                    size = min(2 * size, chunk_size)
+                    if self.cancelled:
+                        return
+            if states:
+                self.append(np.vstack(states), on_chunk)
+        except ValueError as error:
+            self.error = error
+        self.pack()
+        self.complete = True
+
+    # Stops loading at the next chunk, e.g. when the application quits
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    # Adds consecutive states, decoded all at once
+    def append(self, states: np.ndarray, on_chunk: Callable[[np.ndarray], None] | None = None) -> None:
+        if on_chunk is not None:
+            on_chunk(states)
+        (cells, drones) = self.indexer.gather_all(states)
+        first_responders = self.indexer.gather_positions(states, self.indexer.first_resp_slots)
+        survivors = self.indexer.gather_positions(states, self.indexer.survivor_slots)
+
+        keyframes = [(cells[step - self.steps].copy(), drones[step - self.steps].copy())
+                     for step in range(self.steps, self.steps + len(states))
+                     if step % self.keyframe_interval == 0]
+
+        # Changes from the previous state, the first one of the trace being a
+        # keyframe with no changes
+        previous_cells = np.vstack([cells[:1] if self.last is None else self.last[0][None], cells[:-1]])
+        previous_drones = np.vstack([drones[:1] if self.last is None else self.last[1][None], drones[:-1]])
+        (rows, index) = np.nonzero((cells != previous_cells) | (drones != previous_drones))
+        offsets = self.changes + np.cumsum(np.bincount(rows, minlength=len(states)))
+        self.last = (cells[-1].copy(), drones[-1].copy())
+
+        # Only the growth of the arrays and the counts are done with the lock,
+        # the readers never look past the counts
+        (steps, changes) = (self.steps + len(states), self.changes + len(index))
+        with self.lock:
+            self.delta_offsets = TraceStore.grow(self.delta_offsets, steps + 1)
+            self.delta_index = TraceStore.grow(self.delta_index, changes)
+            self.delta_cells = TraceStore.grow(self.delta_cells, changes)
+            self.delta_drones = TraceStore.grow(self.delta_drones, changes)
+            self.first_responders = TraceStore.grow(self.first_responders, steps)
+            self.survivors = TraceStore.grow(self.survivors, steps)
+        self.delta_offsets[self.steps + 1:steps + 1] = offsets
+        self.delta_index[self.changes:changes] = index
+        self.delta_cells[self.changes:changes] = cells[rows, index]
+        self.delta_drones[self.changes:changes] = drones[rows, index]
+        self.first_responders[self.steps:steps] = first_responders
+        self.survivors[self.steps:steps] = survivors
+        with self.lock:
+            self.keyframes += keyframes
+            (self.steps, self.changes) = (steps, changes)
+
+    # Array with room for at least size rows, doubling its capacity
+    def grow(array: np.ndarray, size: int) -> np.ndarray:
+        if size <= len(array):
+            return array
+        grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    # Drops the room left for more states
+    def pack(self) -> None:
+        with self.lock:
+            self.delta_offsets = self.delta_offsets[:self.steps + 1].copy()
+            self.delta_index = self.delta_index[:self.changes].copy()
+            self.delta_cells = self.delta_cells[:self.changes].copy()
+            self.delta_drones = self.delta_drones[:self.changes].copy()
+            self.first_responders = self.first_responders[:self.steps].copy()
+            self.survivors = self.survivors[:self.steps].copy()
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [array for keyframe in self.keyframes for array in keyframe]
+        arrays += [self.delta_offsets, self.delta_index, self.delta_cells, self.delta_drones,
+                   self.first_responders, self.survivors]
+        return sum(array.nbytes for array in arrays)
+
+    def get(self, step: int) -> MapState:
+        with self.lock:
+            if not 0 <= step < self.steps:
+                raise IndexError(f"Step {step} out of a trace of {self.steps} steps")
+
+            keyframe = step // self.keyframe_interval * self.keyframe_interval
+            if self.cursor is not None and keyframe <= self.cursor[0] <= step:
+                (first, cells, drones) = self.cursor
+            else:
+                (cells, drones) = self.keyframes[keyframe // self.keyframe_interval]
+                (cells, drones) = (cells.copy(), drones.copy())
+                first = keyframe
+            self.apply(cells, drones, first, step)
+            self.cursor = (step, cells, drones)
+            # Copied before the next get() changes the cursor
+            (cells, drones) = (cells.copy(), drones.copy())
+            (first_responders, survivors) = (self.first_responders[step], self.survivors[step])
+
+        map = MapState(cells.reshape(self.indexer.N_COLS, self.indexer.N_ROWS),
+                       drones.reshape(self.indexer.N_COLS, self.indexer.N_ROWS))
+        map.first_responders = TraceStore.positions(first_responders, map.count_actors(CellType.FIRST_RESP))
+        map.survivors = TraceStore.positions(survivors, map.count_actors(CellType.SURVIVOR))
+        return map
+
+    # Applies the changes of the steps after first up to step
+    def apply(self, cells: np.ndarray, drones: np.ndarray, first: int, step: int) -> None:
+        (start, end) = (self.delta_offsets[first + 1], self.delta_offsets[step + 1])
+        if start == end:
+            return
+        index = self.delta_index[start:end]
+        # The last change of a cell wins
+        (index, last) = np.unique(index[::-1], return_index=True)
+        last = end - 1 - last
+        cells[index] = self.delta_cells[last]
+        drones[index] = self.delta_drones[last]
+
+    # First count positions of an entity array, padded like TraceIndexer.positions
+    def positions(positions: np.ndarray, count: int) -> list[tuple[int, int]]:
+        found = min(count, len(positions))
+        return [tuple(pos) for pos in positions[:found].tolist()] + [(0, 0)] * (count - found)
+
+
+# Steps of a trace shown one at a time, the trace being anything with a number
+# of steps, the map of each of them and whether it is complete: a TraceStore
+# or a CachedTrace. The steps of a trace still being loaded are added to the
+# timeline as they arrive.
 class TraceWidget(QWidget):
-    current_step = 0
+    current_step = -1
+    speeds = [1, 2, 5, 10, 20, 50, 100]
+    # Milliseconds between two looks at the steps of a trace being loaded
+    loading_interval = 100
 
-    def __init__(self, N_COLS: int, N_ROWS: int, model_file: TextIOWrapper, trace_file: TextIOWrapper, draw_map: Slot):
+    def __init__(self, trace: TraceStore, draw_map: Slot):
         super().__init__()
 
         # Initialize variables
-        self.N_COLS = N_COLS
-        self.N_ROWS = N_ROWS
+        self.trace = trace
         self.draw_map = draw_map
+        self.steps = 0
 
         self.prev_button = QPushButton("Previous")
         self.prev_button.clicked.connect(self.show_previous_step)
@@ -27,95 +322,111 @@ class TraceWidget(QWidget):
         self.next_button = QPushButton("Next")
         self.next_button.clicked.connect(self.show_next_step)
         self.next_button.setShortcut(Qt.Key.Key_Right)
+        self.play_button = QPushButton("Play")
+        self.play_button.setCheckable(True)
+        self.play_button.toggled.connect(self.set_playing)
+        self.play_button.setShortcut(Qt.Key.Key_Space)
 
-        layout = QHBoxLayout()
-        layout.addWidget(self.prev_button)
-        layout.addWidget(self.next_button)
+        # Steps per second while playing
+        self.speed = QComboBox()
+        for speed in self.speeds:
+            self.speed.addItem(f"{speed} steps/s", speed)
+        self.speed.setCurrentIndex(self.speeds.index(5))
+        self.speed.currentIndexChanged.connect(self.set_speed)
+
+        self.timeline = QSlider(Qt.Orientation.Horizontal)
+        self.timeline.setRange(0, 0)
+        self.timeline.valueChanged.connect(self.show_step)
+        self.step_label = QLabel()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.play_step)
+        self.set_speed()
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.prev_button)
+        buttons.addWidget(self.play_button)
+        buttons.addWidget(self.next_button)
+        buttons.addWidget(self.speed)
+        timeline = QHBoxLayout()
+        timeline.addWidget(self.timeline)
+        timeline.addWidget(self.step_label)
+        layout = QVBoxLayout()
+        layout.addLayout(timeline)
+        layout.addLayout(buttons)
         self.setLayout(layout)
 
-        umodel = UModel(model_file.name)
-        self.trace = umodel.load_xtr_trace(trace_file.name)
-        self.maps = [self.parse_map(vars)
-                     for vars in self.trace.global_variables]
-
-    def parse_map(self, trace):
-        map: dict[str, QJsonArray] = {}
-        map["cells"] = [[0 for _ in range(self.N_ROWS)]
-                        for _ in range(self.N_COLS)]
-        map["drones"] = [[0 for _ in range(10)] for _ in range(10)]
-
-        cell_pattern = re.compile(r'map\[(\d)\]\[(\d)\]')
-        drone_pattern = re.compile(r'drone_map\[(\d)\]\[(\d)\]')
-
-        for var, value in zip(trace.variables_name, trace.variables_value):
-            cell_result = cell_pattern.match(var)
-            if cell_result:
-                (x, y) = cell_result.groups()
-                (x, y) = (int(x), int(y))
-                map["cells"][x][y] = int(value)
-            drone_result = drone_pattern.match(var)
-            if drone_result:
-                (x, y) = drone_result.groups()
-                (x, y) = (int(x), int(y))
-                map["drones"][x][y] = int(value)
-
-        first_responders = TraceWidget.count_entity(
-            map["cells"], CellType.FIRST_RESP)
-        survivors = TraceWidget.count_entity(map["cells"], CellType.SURVIVOR)
-
-        first_resp_pos = []
-        map["first_responders"] = [(0, 0) for _ in range(first_responders)]
-        for i in range(first_responders):
-            pattern_x = re.compile(r'FirstResponder\({}\).pos.x'.format(i))
-            pattern_y = re.compile(r'FirstResponder\({}\).pos.y'.format(i))
-
-            for var, value in zip(trace.variables_name, trace.variables_value):
-                x_result = pattern_x.match(var)
-                if x_result:
-                    x = int(value)
-                y_result = pattern_y.match(var)
-                if y_result:
-                    y = int(value)
-
-            map["first_responders"][i] = (x, y)
-
-        survivors_pos = []
-        map["survivors"] = [(0, 0) for _ in range(survivors)]
-        for i in range(survivors):
-            pattern_x = re.compile(r'Survivor\({}\).pos.x'.format(i))
-            pattern_y = re.compile(r'Survivor\({}\).pos.y'.format(i))
-
-            for var, value in zip(trace.variables_name, trace.variables_value):
-                x_result = pattern_x.match(var)
-                if x_result:
-                    x = int(value)
-                y_result = pattern_y.match(var)
-                if y_result:
-                    y = int(value)
-
-            map["survivors"][i] = (x, y)
+        self.loading = QTimer(self)
+        self.loading.setInterval(self.loading_interval)
+        self.loading.timeout.connect(self.add_steps)
+        self.add_steps()
+        if not trace.complete:
+            self.loading.start()
 
-        return map
+    @Slot()
+    def add_steps(self) -> None:
+        complete = self.trace.complete
+        steps = self.trace.steps
+        if complete:
+            self.loading.stop()
+            if self.trace.error is not None:
+                print(f"Trace read up to step {steps}: {self.trace.error}")
+        if steps == self.steps and not complete:
+            return
+
+        self.steps = steps
+        self.timeline.setRange(0, max(steps - 1, 0))
+        if self.current_step < 0 and steps:
+            self.show_step(0)
+        else:
+            self.update_label()
+
+    def get_map(self, step: int) -> MapState:
+        return self.trace.get(step)
 
-    def count_entity(map: QJsonArray, entity: CellType) -> int:
-        count = 0
-        for row in map:
-            for cell in row:
-                if ((entity == CellType.FIRST_RESP and (cell == CellType.FIRST_RESP.value or cell == CellType.ASSISTING.value)) or
-                        (entity == CellType.SURVIVOR and (cell == CellType.SURVIVOR.value or cell ==
-                         CellType.IN_NEED.value or cell == CellType.ASSISTED.value))
-                        or cell == entity.value):
-                    count += 1
-        return count
+    @Slot(int)
+    def show_step(self, step: int) -> None:
+        self.current_step = step
+        self.draw_map(self.get_map(step))
+        self.update_label()
+        if self.timeline.value() != step:
+            # Moves the slider without drawing the step again
+            self.timeline.blockSignals(True)
+            self.timeline.setValue(step)
+            self.timeline.blockSignals(False)
+
+    def update_label(self) -> None:
+        loading = "" if self.trace.complete else "+"
+        self.step_label.setText(f"{max(self.current_step, 0)} / {max(self.steps - 1, 0)}{loading}")
 
     @Slot()
     def show_previous_step(self):
         if self.current_step > 0:
-            self.current_step -= 1
-            self.draw_map(self.maps[self.current_step])
+            self.show_step(self.current_step - 1)
 
     @Slot()
     def show_next_step(self):
-        if self.current_step < len(self.maps) - 1:
-            self.current_step += 1
-            self.draw_map(self.maps[self.current_step])
+        if self.current_step < self.steps - 1:
+            self.show_step(self.current_step + 1)
+
+    @Slot(bool)
+    def set_playing(self, playing: bool) -> None:
+        if playing and self.trace.complete and self.current_step >= self.steps - 1:
+            # Playing again from the start once the end is reached
+            self.show_step(0)
+        if playing:
+            self.timer.start()
+        else:
+            self.timer.stop()
+        self.play_button.setText("Pause" if playing else "Play")
+
+    @Slot()
+    def set_speed(self) -> None:
+        self.timer.setInterval(max(1, round(1000 / self.speed.currentData())))
+
+    @Slot()
+    def play_step(self) -> None:
+        self.show_next_step()
+        # Waiting for the next steps while the trace is loaded
+        if self.trace.complete and self.current_step >= self.steps - 1:
+            self.play_button.setChecked(False)
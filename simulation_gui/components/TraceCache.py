@@ -0,0 +1,225 @@
+from glob import glob, escape
+from os import path
+from typing import TextIO
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+from components.Enums import CellType
+from components.MapState import MapState
+from components.Model import ModelLayout
+from components.Trace import TraceIndexer, TraceStore
+from components.Xtr import XtrReader
+
+
+# Decoded trace in a binary file, memory mapped so that it is reopened without
+# parsing the model or the trace again. The file is a JSON header describing
+# the record of a step, padded to the alignment, and then one fixed width
+# record per step:
+#   - cells and drones: uint8 (N_COLS, N_ROWS), like MapState
+#   - first_responders and survivors: int16 (entities, 2) positions
+#   - values: int32 value of every other variable of the model, named in the
+#     header, e.g. the safe_survivors and dead_survivors counters
+class CachedTrace():
+    # Read all at once, unlike a TraceStore being loaded
+    complete = True
+    error = None
+
+    magic = b"XTRCACHE"
+    version = 1
+    alignment = 64
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        with open(cache_file, "rb") as file:
+            (self.header, offset) = CachedTrace.read_header(file)
+        self.N_COLS = self.header["N_COLS"]
+        self.N_ROWS = self.header["N_ROWS"]
+        self.variables: list[str] = self.header["variables"]
+
+        dtype = CachedTrace.record_dtype(self.header["record"])
+        (self.steps, rest) = divmod(path.getsize(cache_file) - offset, dtype.itemsize)
+        if rest:
+            raise ValueError(f"Truncated trace cache {cache_file}")
+        if self.steps:
+            self.records = np.memmap(cache_file, dtype, mode="r", offset=offset, shape=(self.steps,))
+        else:
+            # An empty file region cannot be mapped
+            self.records = np.zeros(0, dtype)
+
+    def read_header(file) -> tuple[dict, int]:
+        if file.read(len(CachedTrace.magic)) != CachedTrace.magic:
+            raise ValueError("Not a trace cache")
+        length = int.from_bytes(file.read(4), "little")
+        header = json.loads(file.read(length))
+        if header["version"] != CachedTrace.version:
+            raise ValueError(f"Trace cache version {header['version']} instead of {CachedTrace.version}")
+        return (header, len(CachedTrace.magic) + 4 + length)
+
+    def header_bytes(header: dict) -> bytes:
+        text = json.dumps(header).encode()
+        # Records start aligned, the padding being spaces at the end of the JSON
+        start = len(CachedTrace.magic) + 4
+        length = -(-(start + len(text)) // CachedTrace.alignment) * CachedTrace.alignment - start
+        return CachedTrace.magic + length.to_bytes(4, "little") + text.ljust(length)
+
+    def record_fields(N_COLS: int, N_ROWS: int, first_responders: int, survivors: int,
+                      values: int) -> list:
+        return [["cells", "u1", [N_COLS, N_ROWS]], ["drones", "u1", [N_COLS, N_ROWS]],
+                ["first_responders", "<i2", [first_responders, 2]], ["survivors", "<i2", [survivors, 2]],
+                ["values", "<i4", [values]]]
+
+    def record_dtype(fields: list) -> np.dtype:
+        return np.dtype([(name, dtype, tuple(shape)) for (name, dtype, shape) in fields])
+
+    # Values of a variable at every step
+    def values(self, variable: str) -> np.ndarray:
+        return self.records["values"][:, self.variables.index(variable)]
+
+    def get(self, step: int) -> MapState:
+        if not 0 <= step < self.steps:
+            raise IndexError(f"Step {step} out of a trace of {self.steps} steps")
+        record = self.records[step]
+        map = MapState(np.array(record["cells"]), np.array(record["drones"]))
+        map.first_responders = TraceStore.positions(
+            record["first_responders"], map.count_actors(CellType.FIRST_RESP))
+        map.survivors = TraceStore.positions(record["survivors"], map.count_actors(CellType.SURVIVOR))
+        return map
+
+
+# Directory of cached traces, one file per model, trace and map size. The file
+# name is derived from the hashes of the model and trace contents, so a changed
+# file gets a new cache, and the caches of the previous contents of a trace
+# with the same model and size are removed when the new one is written.
+class TraceCache():
+    extension = ".xtc"
+    chunk_size = 4096
+
+    def __init__(self, directory: str = "trace_cache"):
+        self.directory = directory
+
+    def file_hash(file_name: str) -> str:
+        digest = hashlib.sha1()
+        with open(file_name, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def cache_file(self, trace_file: str, model_hash: str, trace_hash: str, N_COLS: int, N_ROWS: int) -> str:
+        key = hashlib.sha1(f"{CachedTrace.version} {model_hash} {trace_hash} {N_COLS}x{N_ROWS}".encode())
+        stem = path.splitext(path.basename(trace_file))[0]
+        return path.join(self.directory, f"{stem}_{key.hexdigest()[:16]}{self.extension}")
+
+    # Cache file of the trace and header identifying the contents it holds
+    def entry(self, model_file: str, trace_file: str, N_COLS: int, N_ROWS: int) -> tuple[str, dict]:
+        (model_hash, trace_hash) = (TraceCache.file_hash(model_file), TraceCache.file_hash(trace_file))
+        header = {"version": CachedTrace.version, "model_hash": model_hash, "trace_hash": trace_hash,
+                  "trace_file": path.abspath(trace_file), "N_COLS": N_COLS, "N_ROWS": N_ROWS}
+        return (self.cache_file(trace_file, model_hash, trace_hash, N_COLS, N_ROWS), header)
+
+    # The cached trace of the entry, None if it was not written yet
+    def find(self, cache_file: str, header: dict) -> CachedTrace | None:
+        try:
+            trace = CachedTrace(cache_file)
+        except (OSError, ValueError, KeyError):
+            return None
+        if (trace.header.get("model_hash"), trace.header.get("trace_hash")) != \
+                (header["model_hash"], header["trace_hash"]):
+            return None
+        return trace
+
+    # The cached trace, written first if the model or the trace changed. The
+    # layout of the model can be given to not parse it again when writing.
+    def open(self, model_file: str, trace_file: str, N_COLS: int, N_ROWS: int,
+             layout: ModelLayout | None = None) -> CachedTrace:
+        (cache_file, header) = self.entry(model_file, trace_file, N_COLS, N_ROWS)
+        trace = self.find(cache_file, header)
+        if trace is not None:
+            return trace
+
+        writer = TraceCacheWriter(self, cache_file, header, layout or ModelLayout(model_file))
+        try:
+            with open(trace_file) as file:
+                for states in TraceCache.chunks(file, writer.layout):
+                    writer.append(states)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+        return CachedTrace(cache_file)
+
+    def chunks(trace_file: TextIO, layout: ModelLayout):
+        states = []
+        for state in XtrReader(trace_file, layout):
+            states.append(state)
+            if len(states) == TraceCache.chunk_size:
+                yield np.vstack(states)
+                states = []
+        if states:
+            yield np.vstack(states)
+
+    # Removes the caches of the previous contents of the trace, for the same
+    # model and map size: the caches of the other models and sizes stay valid
+    def remove_stale(self, cache_file: str, header: dict) -> None:
+        same = ["trace_file", "model_hash", "N_COLS", "N_ROWS"]
+        stem = path.basename(cache_file).rsplit("_", 1)[0]
+        for other in glob(path.join(escape(self.directory), f"{escape(stem)}_*{self.extension}")):
+            if path.samefile(other, cache_file):
+                continue
+            try:
+                with open(other, "rb") as file:
+                    (other_header, _) = CachedTrace.read_header(file)
+                if all(other_header.get(key) == header[key] for key in same) and \
+                        other_header.get("trace_hash") != header["trace_hash"]:
+                    os.remove(other)
+            except (OSError, ValueError, KeyError):
+                pass
+
+
+# Cache file of a trace written a chunk of states at a time, aside, and put in
+# place by commit() so that a cache file is always complete
+class TraceCacheWriter():
+    def __init__(self, cache: TraceCache, cache_file: str, header: dict, layout: ModelLayout):
+        self.cache = cache
+        self.cache_file = cache_file
+        self.layout = layout
+        (N_COLS, N_ROWS) = (header["N_COLS"], header["N_ROWS"])
+        self.indexer = TraceIndexer(N_COLS, N_ROWS, layout.variables)
+
+        indexer = self.indexer
+        used = np.concatenate([indexer.cell_slots, indexer.drone_slots,
+                               indexer.first_resp_slots.ravel(), indexer.survivor_slots.ravel()])
+        self.value_slots = np.setdiff1d(np.arange(len(layout.variables)), used)
+
+        fields = CachedTrace.record_fields(N_COLS, N_ROWS, len(indexer.first_resp_slots),
+                                           len(indexer.survivor_slots), len(self.value_slots))
+        self.header = {**header, "record": fields,
+                       "variables": [layout.variables[slot] for slot in self.value_slots]}
+        self.dtype = CachedTrace.record_dtype(fields)
+
+        os.makedirs(cache.directory, exist_ok=True)
+        (descriptor, self.part_file) = tempfile.mkstemp(suffix=".part", dir=cache.directory)
+        self.file = os.fdopen(descriptor, "wb")
+        self.file.write(CachedTrace.header_bytes(self.header))
+
+    def append(self, states: np.ndarray) -> None:
+        indexer = self.indexer
+        records = np.zeros(len(states), self.dtype)
+        (cells, drones) = indexer.gather_all(states)
+        records["cells"] = cells.reshape(-1, indexer.N_COLS, indexer.N_ROWS)
+        records["drones"] = drones.reshape(-1, indexer.N_COLS, indexer.N_ROWS)
+        records["first_responders"] = indexer.gather_positions(states, indexer.first_resp_slots)
+        records["survivors"] = indexer.gather_positions(states, indexer.survivor_slots)
+        records["values"] = states[:, self.value_slots]
+        self.file.write(records.tobytes())
+
+    def commit(self) -> None:
+        self.file.close()
+        os.replace(self.part_file, self.cache_file)
+        self.cache.remove_stale(self.cache_file, self.header)
+
+    def abort(self) -> None:
+        self.file.close()
+        os.remove(self.part_file)
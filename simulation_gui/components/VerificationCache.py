@@ -0,0 +1,155 @@
+from xml.etree import ElementTree
+from os import path
+from threading import Lock
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from components.Model import ModelLayout
+
+
+# On disk cache of verification results, addressed by a hash of what decides
+# the result: the model without its layout, comments and saved queries, the
+# query formula, the verifyta options and the verifyta executable itself.
+# Editing the model, the scenario constants or the map gives a new key, so
+# stale entries are never hit and just age out. Each entry is a directory with
+# the result and the traces generated by the run, and the least recently used
+# entries are evicted once the cache grows over max_size bytes.
+class VerificationCache():
+    result_file = "result.json"
+
+    layout_attributes = ["x", "y", "color"]
+    layout_elements = ["nail"]
+
+    def __init__(self, directory: str, max_size: int = 1 << 30):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = Lock()
+
+        # Model hashes by (path, modification time, size)
+        self.model_hashes = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    # Shared with the processes of Verifier.run_all, each one with its own lock
+    def __getstate__(self) -> dict:
+        return {name: value for (name, value) in self.__dict__.items() if name != "lock"}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def key(self, model_file: str, formula: str, options: list[str], verifyta: str) -> str:
+        executable = shutil.which(verifyta) or verifyta
+        try:
+            stat = os.stat(executable)
+            verifier = f"{path.abspath(executable)}:{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            verifier = verifyta
+
+        digest = hashlib.sha256()
+        for part in [self.model_hash(model_file), " ".join(formula.split()),
+                     "\0".join(options), verifier]:
+            digest.update(part.encode())
+            digest.update(b"\0\0")
+        return digest.hexdigest()
+
+    def model_hash(self, model_file: str) -> str:
+        stat = os.stat(model_file)
+        identity = (path.abspath(model_file), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if identity in self.model_hashes:
+                return self.model_hashes[identity]
+
+        model = VerificationCache.normalize(model_file)
+        model_hash = hashlib.sha256(model.encode()).hexdigest()
+        with self.lock:
+            self.model_hashes[identity] = model_hash
+        return model_hash
+
+    # The model text that matters for verification: locations can be moved
+    # and queries saved with their results without invalidating the cache
+    def normalize(model_file: str) -> str:
+        root = ElementTree.parse(model_file).getroot()
+        for queries in root.findall("queries"):
+            root.remove(queries)
+
+        for element in root.iter():
+            for attribute in VerificationCache.layout_attributes:
+                element.attrib.pop(attribute, None)
+            for child in list(element):
+                if child.tag in VerificationCache.layout_elements:
+                    element.remove(child)
+            if element.text:
+                element.text = " ".join(
+                    ModelLayout.strip_comments(element.text).split())
+            element.tail = None
+
+        return ElementTree.tostring(root, encoding="unicode")
+
+    def entry(self, key: str) -> str:
+        return path.join(self.directory, key)
+
+    def get(self, key: str) -> dict | None:
+        result_file = path.join(self.entry(key), self.result_file)
+        try:
+            with open(result_file) as file:
+                result = json.load(file)
+            # Mark the entry as recently used
+            os.utime(result_file)
+        except (OSError, ValueError):
+            return None
+
+        result["traces"] = [path.join(self.entry(key), trace)
+                            for trace in result.get("traces", [])]
+        result["cached"] = True
+        return result
+
+    # Stores the result and moves the trace files into the entry, returning
+    # the result with the paths of the cached traces
+    def put(self, key: str, result: dict, traces: list[str] = []) -> dict:
+        staging = tempfile.mkdtemp(prefix=".", dir=self.directory)
+        names = []
+        for trace in traces:
+            names.append(path.basename(trace))
+            shutil.move(trace, path.join(staging, names[-1]))
+        with open(path.join(staging, self.result_file), "w") as file:
+            json.dump(dict(result, traces=names, cached=False), file)
+
+        with self.lock:
+            shutil.rmtree(self.entry(key), ignore_errors=True)
+            try:
+                os.replace(staging, self.entry(key))
+            except OSError:
+                # Stored at the same time by another process
+                shutil.rmtree(staging, ignore_errors=True)
+                return self.get(key) or dict(result, traces=[], cached=False)
+            self.evict()
+
+        return dict(result, traces=[path.join(self.entry(key), name) for name in names],
+                    cached=False)
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for key in os.listdir(self.directory):
+            entry = self.entry(key)
+            if key.startswith(".") or not re.match(r'^[0-9a-f]+$', key):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry))
+                used = os.stat(path.join(entry, self.result_file)).st_mtime
+            except OSError:
+                continue
+            entries.append((used, size, entry))
+            total += size
+
+        for (_, size, entry) in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
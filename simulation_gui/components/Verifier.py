@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
+from os import path
+from typing import Callable, Iterable
+import glob
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from components.VerificationCache import VerificationCache
+
+try:
+    import resource
+except ImportError:
+    # Memory limits are only enforced on POSIX systems
+    resource = None
+
+
+# A single verifyta run: one query of one model, the scenario being the
+# variant of the model the file describes
+class VerificationJob():
+    def __init__(self, model_file: str, model: str, scenario: str, query: int, formula: str,
+                 options: list[str] | None = None):
+        self.model_file = model_file
+        self.model = model
+        self.scenario = scenario
+        self.query = query
+        self.formula = formula
+        self.options = options or []
+
+    # Jobs for every query of the given model files, read from the files
+    # themselves or, if given, from a .q file shared by all of them
+    def expand(model_files: Iterable[str], queries_file: str | None = None,
+               selected: list[int] | None = None) -> list["VerificationJob"]:
+        shared = None
+        if queries_file is not None:
+            with open(queries_file) as file:
+                shared = [(formula, []) for formula in VerificationJob.read_q(file.read())]
+
+        jobs = []
+        for model_file in model_files:
+            (model, scenario) = VerificationJob.scenario_of(model_file)
+            queries = shared if shared is not None else VerificationJob.read_queries(model_file)
+            for (i, (formula, options)) in enumerate(queries):
+                if selected is None or i in selected:
+                    jobs.append(VerificationJob(
+                        model_file, model, scenario, i, formula, options))
+        return jobs
+
+    # Files in a "<model>_scenario" or "<model>_scenarios" directory are the
+    # scenarios of <model>, the other ones are the default scenario
+    def scenario_of(model_file: str) -> tuple[str, str]:
+        name = path.splitext(path.basename(model_file))[0]
+        directory = path.basename(path.dirname(path.abspath(model_file)))
+        match = re.match(r'(.+)_scenarios?$', directory)
+        if match and name.startswith(match.group(1) + "_"):
+            return (match.group(1), name[len(match.group(1)) + 1:])
+        return (name, "default")
+
+    def read_queries(model_file: str) -> list[tuple[str, list[str]]]:
+        root = ElementTree.parse(model_file).getroot()
+        queries = root.find("queries")
+        if queries is None:
+            return []
+
+        shared = VerificationJob.read_options(queries)
+        return [(query.findtext("formula", "").strip(), shared + VerificationJob.read_options(query))
+                for query in queries.findall("query")
+                if query.findtext("formula", "").strip()]
+
+    def read_options(element: ElementTree.Element) -> list[str]:
+        options = []
+        for option in element.findall("option"):
+            options += [option.get("key"), option.get("value")]
+        return options
+
+    # Queries of a .q file, separated by empty lines or by comments
+    def read_q(text: str) -> list[str]:
+        text = re.sub(r'/\*.*?\*/', "\n\n", text, flags=re.S)
+        text = re.sub(r'//[^\n]*', "", text)
+        return [" ".join(query.split()) for query in re.split(r'\n\s*\n', text) if query.strip()]
+
+
+# Runs verifyta jobs on as many cores as available, each one in its own
+# process with a wall clock timeout and an optional address space limit, and
+# collects the results as flat rows ready to be written as CSV or JSON. With a
+# cache, unchanged runs are answered from it and the traces verifyta generates
+# are kept in it.
+class Verifier():
+    columns = ["model", "scenario", "query", "formula", "outcome",
+               "value", "ci_low", "ci_high", "time", "returncode", "message",
+               "cached", "traces"]
+
+    satisfied_pattern = re.compile(r'Formula is (NOT |MAYBE )?satisfied')
+    probability_pattern = re.compile(
+        r'Pr\b.*?\[\s*([-+\d.eE]+)\s*,\s*([-+\d.eE]+)\s*\]')
+    expectation_pattern = re.compile(
+        r'=\s*([-+\d.eE]+)\s*(?:±|\+/-)\s*([-+\d.eE]+)')
+    bound_pattern = re.compile(r'\b(?:sup|inf)\b.*?:\s*([-+\d.eE]+)\s*$', re.M)
+
+    # Sets the address space limit of its own process and replaces itself with
+    # the command, so that the limit is set without running anything between
+    # fork and exec in the process starting verifyta
+    limiter = ("import os, resource, sys; limit = int(sys.argv[1]); "
+               "resource.setrlimit(resource.RLIMIT_AS, (limit, limit)); "
+               "os.execvp(sys.argv[2], sys.argv[2:])")
+
+    def __init__(self, verifyta: str = "verifyta", timeout: float | None = None,
+                 memory_limit: int | None = None, options: list[str] | None = None,
+                 cache: VerificationCache | None = None, traces: bool = False):
+        self.verifyta = verifyta
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.options = options or []
+        self.cache = cache
+        self.traces = traces
+
+    def run(self, job: VerificationJob) -> dict:
+        result = {
+            "model": job.model,
+            "scenario": job.scenario,
+            "query": job.query,
+            "formula": " ".join(job.formula.split()),
+            "outcome": None,
+            "value": None,
+            "ci_low": None,
+            "ci_high": None,
+            "time": None,
+            "returncode": None,
+            "message": "",
+            "cached": False,
+            "traces": [],
+        }
+
+        options = job.options + self.options
+        if self.traces and not any(option in ["-t", "--diagnostic"] for option in options):
+            options += ["-t", "0"]
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(job.model_file, job.formula,
+                                 options + (["-f"] if self.traces else []), self.verifyta)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return dict(cached, model=job.model, scenario=job.scenario, query=job.query)
+
+        with tempfile.TemporaryDirectory() as directory:
+            query_file = path.join(directory, "query.q")
+            with open(query_file, "w") as file:
+                file.write(result["formula"] + "\n")
+
+            trace_prefix = path.join(directory, "trace")
+            if self.traces:
+                options += ["-f", trace_prefix]
+
+            command = self.command(options + [path.abspath(job.model_file), query_file])
+            start = time.perf_counter()
+            try:
+                process = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                result["outcome"] = "timeout"
+                result["time"] = time.perf_counter() - start
+                return result
+            except OSError as error:
+                result["outcome"] = "error"
+                result["message"] = str(error)
+                return result
+            result["time"] = time.perf_counter() - start
+
+            result["returncode"] = process.returncode
+            if process.returncode != 0:
+                result["outcome"] = "error"
+                lines = (process.stderr or process.stdout).strip().splitlines()
+                result["message"] = lines[-1] if lines else f"verifyta exited with {process.returncode}"
+                return result
+
+            result.update(Verifier.parse_output(process.stdout))
+
+            # Traces only outlive the run in the cache
+            if key is not None:
+                result = self.cache.put(
+                    key, result, sorted(glob.glob(trace_prefix + "*.xtr")))
+        return result
+
+    def parse_output(output: str) -> dict:
+        result = {"outcome": "unknown", "message": ""}
+
+        messages = [line.strip()[2:].strip() for line in output.splitlines()
+                    if line.strip().startswith("--")]
+        result["message"] = " ".join(messages)
+
+        satisfied = Verifier.satisfied_pattern.search(output)
+        if satisfied:
+            result["outcome"] = {None: "satisfied", "NOT ": "not satisfied",
+                                 "MAYBE ": "maybe satisfied"}[satisfied.group(1)]
+
+        probability = Verifier.probability_pattern.search(output)
+        expectation = Verifier.expectation_pattern.search(output)
+        bound = Verifier.bound_pattern.search(output)
+        if probability:
+            (low, high) = (float(probability.group(1)), float(probability.group(2)))
+            result.update(value=(low + high) / 2, ci_low=low, ci_high=high)
+        elif expectation:
+            (value, error) = (float(expectation.group(1)), float(expectation.group(2)))
+            result.update(value=value, ci_low=value - error, ci_high=value + error)
+        elif bound:
+            result["value"] = float(bound.group(1))
+        return result
+
+    # verifyta with the given arguments, started through the limiter when the
+    # memory is limited
+    def command(self, arguments: list[str]) -> list[str]:
+        command = [self.verifyta] + arguments
+        if self.memory_limit is None or resource is None:
+            return command
+        return [sys.executable, "-S", "-c", Verifier.limiter, str(self.memory_limit)] + command
+
+    # Jobs are run by a pool of processes, each one waiting on one verifyta
+    # process at a time
+    def run_all(self, jobs: list[VerificationJob], workers: int | None = None,
+                on_result: Callable[[dict], None] | None = None) -> list[dict]:
+        workers = workers or os.cpu_count() or 1
+        results = [None] * len(jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.run, job): i for (i, job) in enumerate(jobs)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if on_result is not None:
+                    on_result(results[futures[future]])
+        return results
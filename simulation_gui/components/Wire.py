@@ -0,0 +1,85 @@
+import struct
+import numpy as np
+
+from components.MapState import MapState
+
+
+# Raised when a delta arrives before the full state it applies to, the sender
+# is expected to answer with a full state
+class MissingBaseState(ValueError):
+    pass
+
+
+# Decoder of the binary map states posted by the visualizer external function,
+# a little endian header followed by the raw arrays flattened as [x][y]:
+#   - header: "MAPS", version, kind, N_COLS, N_ROWS and count as "<4sBBHHI"
+#   - full state (kind 0): count = N_COLS * N_ROWS cells and as many drones
+#   - delta (kind 1): count uint32 cell indices, then their cells and drones,
+#     applied to the last state decoded
+# Cells have to be CellType values and drones 0 or 1, other values are
+# rejected with a ValueError like a malformed body.
+class StateDecoder():
+    content_type = "application/vnd.map-state"
+
+    header = struct.Struct("<4sBBHHI")
+    magic = b"MAPS"
+    version = 1
+
+    FULL = 0
+    DELTA = 1
+
+    def __init__(self):
+        self.state: MapState | None = None
+
+    def reset(self) -> None:
+        self.state = None
+
+    def decode(self, body: bytes) -> MapState:
+        if len(body) < self.header.size:
+            raise ValueError("Truncated map state header")
+        (magic, version, kind, n_cols, n_rows, count) = self.header.unpack_from(body)
+        if magic != self.magic or version != self.version:
+            raise ValueError("Unknown map state encoding")
+
+        size = self.header.size
+        if kind == self.FULL:
+            if count != n_cols * n_rows or len(body) != size + 2 * count:
+                raise ValueError("Malformed full map state")
+            data = np.frombuffer(body, dtype=np.uint8, offset=size).copy()
+            MapState.check_values(data[:count], data[count:])
+            self.state = MapState(data[:count].reshape(n_cols, n_rows),
+                                  data[count:].reshape(n_cols, n_rows))
+        elif kind == self.DELTA:
+            if self.state is None or self.state.cells.shape != (n_cols, n_rows):
+                raise MissingBaseState("No full map state to apply the delta to")
+            if len(body) != size + 6 * count:
+                raise ValueError("Malformed map state delta")
+            indices = np.frombuffer(body, dtype="<u4", count=count, offset=size)
+            if count and indices.max() >= n_cols * n_rows:
+                raise ValueError("Map state delta out of bounds")
+            values = np.frombuffer(body, dtype=np.uint8,
+                                   offset=size + 4 * count)
+            # Checked before the state is changed, so that it stays drawable
+            MapState.check_values(values[:count], values[count:])
+            self.state.cells.reshape(-1)[indices] = values[:count]
+            self.state.drones.reshape(-1)[indices] = values[count:]
+        else:
+            raise ValueError(f"Unknown map state kind {kind}")
+
+        return self.state
+
+    def encode(state: MapState, previous: MapState | None = None) -> bytes:
+        (n_cols, n_rows) = state.cells.shape
+        if previous is not None and previous.cells.shape == state.cells.shape:
+            changed = np.flatnonzero((state.cells != previous.cells) |
+                                     (state.drones != previous.drones))
+            if 6 * len(changed) < 2 * n_cols * n_rows:
+                return (StateDecoder.header.pack(StateDecoder.magic, StateDecoder.version,
+                                                 StateDecoder.DELTA, n_cols, n_rows, len(changed)) +
+                        changed.astype("<u4").tobytes() +
+                        state.cells.reshape(-1)[changed].tobytes() +
+                        state.drones.reshape(-1)[changed].tobytes())
+
+        return (StateDecoder.header.pack(StateDecoder.magic, StateDecoder.version,
+                                         StateDecoder.FULL, n_cols, n_rows, n_cols * n_rows) +
+                state.cells.tobytes() + state.drones.tobytes())
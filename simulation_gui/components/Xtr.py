@@ -0,0 +1,93 @@
+from typing import Iterator, TextIO
+import numpy as np
+
+from components.Model import ModelLayout
+
+
+# Streaming reader for the line oriented .xtr trace format. A trace is the
+# initial state followed by states and transitions, every block terminated by
+# a "." line and the whole trace by an empty block:
+#   - state: one location per process, the clock constraints ("i j bound"
+#     lines terminated by "." and an empty block), one value per variable
+#   - transition: "process edge [select values] ;" lines
+# Only the variable values are decoded, one NumPy row per state.
+class XtrReader():
+    def __init__(self, trace_file: TextIO, layout: ModelLayout, chunk_size: int = 1 << 20):
+        self.trace_file = trace_file
+        self.variables = len(layout.variables)
+        self.chunk_size = chunk_size
+
+        self.lines: list[str] = []
+        self.position = 0
+        self.tail = ""
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while True:
+            line = self.next_line()
+            if line is None or line == ".":
+                return
+            if line.endswith(";"):
+                # Transition, skip its edges
+                self.skip_block()
+                continue
+
+            # State: the line just read is the first location
+            self.skip_block()
+            line = self.next_line()
+            while line != ".":
+                if line is None:
+                    raise ValueError("Unexpected end of trace")
+                self.skip_block()
+                line = self.next_line()
+
+            values = self.take(self.variables + 1)
+            if values[-1] != ".":
+                raise ValueError(
+                    f"The trace does not match the model layout of {self.variables} variables")
+            yield np.array(values[:-1], dtype=np.int32)
+
+    def read_states(self) -> np.ndarray:
+        rows = list(self)
+        if not rows:
+            return np.zeros((0, self.variables), dtype=np.int32)
+        return np.vstack(rows)
+
+    def fill(self) -> bool:
+        chunk = self.trace_file.read(self.chunk_size)
+        if not chunk:
+            if self.tail:
+                self.lines = self.lines[self.position:] + [self.tail]
+                self.position = 0
+                self.tail = ""
+                return True
+            return False
+
+        lines = (self.tail + chunk).split("\n")
+        self.tail = lines.pop()
+        self.lines = self.lines[self.position:] + lines
+        self.position = 0
+        return True
+
+    def next_line(self) -> str | None:
+        while self.position >= len(self.lines):
+            if not self.fill():
+                return None
+        line = self.lines[self.position].strip()
+        self.position += 1
+        return line
+
+    def take(self, count: int) -> list[str]:
+        while len(self.lines) - self.position < count:
+            if not self.fill():
+                raise ValueError("Unexpected end of trace")
+        # Stripped like next_line does, for the traces with CRLF line endings
+        lines = [line.strip() for line in self.lines[self.position:self.position + count]]
+        self.position += count
+        return lines
+
+    def skip_block(self) -> None:
+        line = self.next_line()
+        while line != ".":
+            if line is None:
+                raise ValueError("Unexpected end of trace")
+            line = self.next_line()
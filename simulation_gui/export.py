@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import time
+from os import path
+
+from components.Export import TraceExporter
+
+parser = argparse.ArgumentParser(
+    description="Render the states of traces to PNG frames, GIF or MP4 files without any window")
+parser.add_argument("trace_files", nargs="+",
+                    help="Trace files to render, each one to its own frames or video")
+parser.add_argument("--model_file", required=True,
+                    help="Model the traces were generated from")
+parser.add_argument("--cols", type=int, default=10, help="Number of columns")
+parser.add_argument("--rows", type=int, default=10, help="Number of rows")
+parser.add_argument("--cell_size", type=int, default=50,
+                    help="Size, in pixels, of each cell")
+parser.add_argument("--format", choices=["png", "gif", "mp4"], default="png",
+                    help="PNG frames in a directory per trace, or a GIF or MP4 file per trace")
+parser.add_argument("--output_dir", default="frames",
+                    help="Directory the frames or videos are written to")
+parser.add_argument("--every", type=int, default=1,
+                    help="Render one state every this many")
+parser.add_argument("--fps", type=int, default=10,
+                    help="Frames per second of the videos")
+parser.add_argument("--jobs", type=int,
+                    help="Number of rendering processes, the number of cores by default")
+parser.add_argument("--chunk_size", type=int, default=64,
+                    help="Number of consecutive states rendered by a process at once")
+parser.add_argument("--ffmpeg", default="ffmpeg",
+                    help="Path of the ffmpeg executable, used for GIF and MP4 files")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    exporter = TraceExporter(args.model_file, args.cols, args.rows, args.cell_size,
+                             args.jobs, args.chunk_size, args.every)
+
+    for trace_file in args.trace_files:
+        name = path.join(args.output_dir, path.splitext(path.basename(trace_file))[0])
+        start = time.perf_counter()
+        with open(trace_file) as file:
+            if args.format == "png":
+                frames = exporter.export_frames(file, name)
+            else:
+                os.makedirs(args.output_dir, exist_ok=True)
+                name += "." + args.format
+                frames = exporter.export_video(file, name, args.fps, args.ffmpeg)
+        elapsed = time.perf_counter() - start
+        print(f"{trace_file}: {frames} frames in {name} ({frames / elapsed:.0f} frames/s)",
+              file=sys.stderr)
@@ -1,46 +1,140 @@
 #!/usr/bin/python3
 
+import time
+started = time.perf_counter()
+
 import argparse
 import sys
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton
-from PySide6.QtCore import QJsonDocument
-from PySide6.QtGui import QKeySequence
 
-from components.Map import MapWidget, MapEditorWidget
-from components.HttpServer import HttpServer
-from components.Trace import TraceWidget
+# Only what every mode needs is imported here, the components of each mode
+# (the HTTP server, the trace reader, the editor, the profiler) are imported
+# when the mode is started, and files are only opened by the modes using them
 
 parser = argparse.ArgumentParser(description='Optional app description')
 parser.add_argument("--mode", choices=["json_visualizer", "live_visualizer", "trace_visualizer", "editor"],
                     default="visualizer", required=True, help="Mode to run the application")
-parser.add_argument("--map_file", type=argparse.FileType("rb"),
+parser.add_argument("--map_file",
                     help="Map file to visualize or to open in editor mode")
-parser.add_argument("--cols", type=int, default=10, help="Number of columns")
-parser.add_argument("--rows", type=int, default=10, help="Number of rows")
+parser.add_argument("--cols", type=int,
+                    help="Number of columns, 10 or the one of the model of the trace by default")
+parser.add_argument("--rows", type=int,
+                    help="Number of rows, 10 or the one of the model of the trace by default")
 parser.add_argument("--cell_size", type=int, default=50,
                     help="Size, in pixels, of each cell")
-parser.add_argument("--model_file", type=argparse.FileType("r"),
-                    default="../model.xml", help="Model file")
-parser.add_argument("--trace_file", type=argparse.FileType("r"),
-                    default="examples/random_trace.xtr", help="Trace file to visualize")
+parser.add_argument("--model_file",
+                    help="Model file of the trace, and the base of the maps saved in editor mode, "
+                         "../faster_model.xml by default")
+parser.add_argument("--trace_file", default="examples/faster_model_trace.xtr",
+                    help="Trace file to visualize, by default an example simulated from ../faster_model.xml")
+parser.add_argument("--fps", type=int, default=30,
+                    help="Maximum number of frames per second drawn in live_visualizer mode")
+parser.add_argument("--history_depth", type=int, default=100,
+                    help="Number of edits that can be undone in editor mode")
+parser.add_argument("--keyframe_interval", type=int, default=64,
+                    help="Number of trace steps between two full maps kept in memory with --no_cache, the "
+                         "steps in between being kept as the cells they change")
+parser.add_argument("--cache_dir", default="trace_cache",
+                    help="Directory the decoded traces are cached in, to be reopened without parsing them")
+parser.add_argument("--no_cache", action="store_true",
+                    help="Decode the trace in memory without reading or writing its cache")
+parser.add_argument("--profile", action="store_true",
+                    help="Time the parsing, decoding and drawing stages and print a summary at exit")
+parser.add_argument("--profile_hud", action="store_true",
+                    help="Show the frame rate and frame times over the map, implies --profile")
+parser.add_argument("--profile_output",
+                    help="JSON file the profiling summary is also written to, implies --profile")
+parser.add_argument("--startup_time", action="store_true",
+                    help="Print the time taken to show the window and quit")
+
+
+def read_map(map_file: str) -> "MapState":
+    with open(map_file, "rb") as file:
+        return MapState.from_json(QJsonDocument.fromJson(file.read()).object())
+
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    app = QApplication([])
+    if args.mode in ["trace_visualizer", "editor"] and not args.model_file:
+        # The model the example trace was simulated from, and the base of the
+        # scenarios saved by the editor
+        args.model_file = "../faster_model.xml"
+    if args.mode == "trace_visualizer" and (args.cols is None or args.rows is None):
+        from components.Model import ModelLayout
+
+        constants = ModelLayout(args.model_file).constants
+        args.cols = args.cols or constants.get("N_COLS")
+        args.rows = args.rows or constants.get("N_ROWS")
+    args.cols = args.cols or 10
+    args.rows = args.rows or 10
+    if args.mode == "json_visualizer" and not args.map_file:
+        parser.error("json_visualizer mode requires --map_file")
+
+    from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton
+    from PySide6.QtCore import QJsonDocument, QTimer
+    from components.Map import MapWidget
+    from components.MapState import MapState
+
+    # Stages are only wrapped when profiling, the normal run is untouched
+    profiler = None
+    if args.profile or args.profile_hud or args.profile_output:
+        from components.Profiler import Profiler, ProfiledApplication, ProfilerHud
+        profiler = Profiler()
+        app = ProfiledApplication(profiler, MapWidget, [])
+    else:
+        app = QApplication([])
+
+    def instrument(object: object, method: str, stage: str) -> None:
+        if profiler is not None:
+            profiler.instrument(object, method, stage)
 
     if args.mode == "json_visualizer":
         map = MapWidget(args.cols, args.rows, args.cell_size)
-        map.draw_map(QJsonDocument.fromJson(args.map_file.read()).object())
-        map.show()
+        instrument(map, "draw_map", "draw")
+        map.draw_map(read_map(args.map_file))
+        window = map
     elif args.mode == "live_visualizer":
+        from components.HttpServer import HttpServer
+
         map = MapWidget(args.cols, args.rows, args.cell_size)
-        server = HttpServer(map.draw_map)
+        instrument(map, "draw_map", "draw")
+        server = HttpServer(map.draw_map, args.fps)
+        # Bodies are decoded when received, parse only copies the state drawn
+        instrument(server.on_map_request, "receive", "http receive")
         server.start()
-        map.show()
+        app.aboutToQuit.connect(server.stop)
+        app.aboutToQuit.connect(
+            lambda: print(server.on_map_request.stats()))
+        window = map
     elif args.mode == "trace_visualizer":
+        from components.Trace import TraceWidget
+
         map = MapWidget(args.cols, args.rows, args.cell_size)
-        trace = TraceWidget(args.cols, args.rows,
-                            args.model_file, args.trace_file, map.draw_map)
+        instrument(map, "draw_map", "draw")
+        from components.Model import ModelLayout
+        from components.Trace import TraceIndexer, TraceStore
+
+        steps = None
+        writer = None
+        if not args.no_cache:
+            from components.TraceCache import TraceCache, TraceCacheWriter
+
+            # Memory mapped from the cache if the trace was already read
+            cache = TraceCache(args.cache_dir)
+            (cache_file, header) = cache.entry(args.model_file, args.trace_file, args.cols, args.rows)
+            steps = cache.find(cache_file, header)
+        if steps is None:
+            # Decoded in background, the window showing the steps read so far
+            # and the cache being written along
+            layout = ModelLayout(args.model_file)
+            steps = TraceStore(TraceIndexer(args.cols, args.rows, layout.variables), args.keyframe_interval)
+            if not args.no_cache:
+                writer = TraceCacheWriter(cache, cache_file, header, layout)
+            steps.load(args.trace_file, layout, writer=writer)
+            app.aboutToQuit.connect(steps.cancel)
+        # A step is read from the cache, or rebuilt from its keyframe and the
+        # deltas after it
+        instrument(steps, "get", "trace seek")
+        trace = TraceWidget(steps, map.draw_map)
 
         layout = QVBoxLayout()
         layout.setSizeConstraint(QVBoxLayout.SizeConstraint.SetFixedSize)
@@ -49,22 +143,53 @@ if __name__ == "__main__":
 
         window = QWidget()
         window.setLayout(layout)
-        window.show()
     elif args.mode == "editor":
-        map = MapEditorWidget(args.cols, args.rows, args.cell_size)
+        from PySide6.QtGui import QKeySequence
+        from components.Map import MapEditorWidget
+
+        map = MapEditorWidget(args.cols, args.rows, args.cell_size,
+                              args.history_depth, args.model_file)
+        instrument(map, "draw_map", "draw")
+        instrument(map, "draw_area", "editor draw_area")
         if (args.map_file):
-            map.draw_map(QJsonDocument.fromJson(args.map_file.read()).object())
+            map.draw_map(read_map(args.map_file))
         save_button = QPushButton("Save")
         save_button.clicked.connect(map.save_map)
         save_button.setShortcut(QKeySequence.Save)
+        undo_button = QPushButton("Undo")
+        undo_button.clicked.connect(map.undo)
+        undo_button.setShortcut(QKeySequence.Undo)
+        redo_button = QPushButton("Redo")
+        redo_button.clicked.connect(map.redo)
+        redo_button.setShortcut(QKeySequence.Redo)
+
+        history_layout = QHBoxLayout()
+        history_layout.addWidget(undo_button)
+        history_layout.addWidget(redo_button)
 
         layout = QVBoxLayout()
         layout.setSizeConstraint(QVBoxLayout.SizeConstraint.SetFixedSize)
         layout.addWidget(map)
+        layout.addLayout(history_layout)
         layout.addWidget(save_button)
 
         window = QWidget()
         window.setLayout(layout)
-        window.show()
+
+    window.show()
+
+    if profiler is not None:
+        if args.profile_hud:
+            hud = ProfilerHud(profiler, map)
+        app.aboutToQuit.connect(lambda: print(profiler.summary()))
+        if args.profile_output:
+            app.aboutToQuit.connect(lambda: profiler.save(args.profile_output))
+
+    if args.startup_time:
+        # Timed once the events of the first show, painting included, are handled
+        def report() -> None:
+            print(f"{args.mode} started in {(time.perf_counter() - started) * 1000:.0f} ms")
+            app.quit()
+        QTimer.singleShot(0, report)
 
     sys.exit(app.exec())
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from components.MapState import MapState
+from components.Simulator import SimulationScenario, Simulator, ProbabilityQuery
+from components.BatchSimulator import BatchSimulator
+from components.Sweep import Sweep
+from components.Verifier import VerificationJob
+
+parser = argparse.ArgumentParser(
+    description="Estimate the SMC queries of a model with the discrete time simulator")
+parser.add_argument("--model_file", default="../faster_model_smc.xml",
+                    help="Model the scenario is read from")
+parser.add_argument("--map_file",
+                    help="Map of the scenario, the one of the model by default")
+parser.add_argument("--query", action="append",
+                    help="Query to estimate, the probability queries of the model by default")
+parser.add_argument("--param", action="append", default=[],
+                    help="Constant of the scenario as NAME=VALUE or NAME=VALUE,VALUE,...")
+parser.add_argument("--epsilon", type=float, default=0.05,
+                    help="Half width of the confidence intervals, as the -E option of verifyta")
+parser.add_argument("--alpha", type=float, default=0.05,
+                    help="Probability of the estimate being out of its interval, as the -a option of verifyta")
+parser.add_argument("--runs", type=int,
+                    help="Number of simulated episodes, computed from epsilon and alpha by default")
+parser.add_argument("--jobs", type=int,
+                    help="Number of simulation processes, the number of cores by default")
+parser.add_argument("--engine", choices=["batch", "episode"], default="batch",
+                    help="Simulate the episodes as stacked NumPy arrays or one at a time with the scalar "
+                         "reference engine")
+parser.add_argument("--batch_size", type=int, default=16384,
+                    help="Number of episodes simulated together by the batch engine")
+parser.add_argument("--seed", type=int,
+                    help="Seed of the simulations, random by default")
+parser.add_argument("--trace_file",
+                    help="Write the first episode as an .xtr trace readable by the trace visualizer")
+parser.add_argument("--output",
+                    help="Results file, written as JSON if it ends in .json and as CSV otherwise")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    overrides = {}
+    for param in args.param:
+        (name, values) = param.split("=", 1)
+        values = Sweep.range_values(values)
+        overrides[name.strip()] = values[0] if len(values) == 1 else values
+
+    map = None
+    if args.map_file:
+        with open(args.map_file) as file:
+            map = MapState.from_json(json.load(file))
+
+    scenario = SimulationScenario(args.model_file, map, **overrides)
+    formulas = args.query or [formula for (formula, _) in VerificationJob.read_queries(args.model_file)
+                              if ProbabilityQuery.pattern.match(formula)]
+    if not formulas:
+        parser.error("The model has no probability query, use --query")
+    queries = [ProbabilityQuery(formula, scenario.layout) for formula in formulas]
+
+    horizon = max(query.bound for query in queries)
+    if args.engine == "batch":
+        simulator = BatchSimulator(scenario, horizon, args.batch_size)
+    else:
+        simulator = Simulator(scenario, horizon)
+    runs = args.runs or ProbabilityQuery.runs(args.epsilon, args.alpha)
+
+    if args.trace_file:
+        with open(args.trace_file, "w") as file:
+            simulator.run_episode(Simulator.generator(args.seed), file)
+
+    start = time.perf_counter()
+    counters = simulator.run_all(runs, args.jobs or os.cpu_count(), args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"{runs} episodes in {elapsed:.2f} s, {runs / elapsed:.0f} episodes/s", file=sys.stderr)
+
+    results = []
+    for (i, query) in enumerate(queries):
+        result = query.estimate(counters, args.alpha)
+        result.update(query=i, time=elapsed)
+        results.append(result)
+        print(f"{result['formula']}: [{result['ci_low']:.4f}, {result['ci_high']:.4f}] "
+              f"({result['value']:.4f})")
+
+    distributions = {}
+    for counter in ["safe_survivors", "dead_survivors"]:
+        distributions[counter] = Simulator.distribution(counters, counter).tolist()
+        print(f"{counter} at {horizon}: " + ", ".join(
+            f"{value}: {share:.2%}" for (value, share) in enumerate(distributions[counter]) if share))
+
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            if args.output.endswith(".json"):
+                json.dump({"queries": results, "horizon": horizon,
+                           "distributions": distributions}, file, indent=2)
+            else:
+                writer = csv.DictWriter(file, fieldnames=["query", "formula", "runs", "value",
+                                                          "ci_low", "ci_high", "time"])
+                writer.writeheader()
+                writer.writerows(results)
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import json
+import sys
+
+from components.MapState import MapState
+from components.Scenario import ScenarioTemplate
+from components.Sweep import Sweep
+from components.Verifier import Verifier
+from components.VerificationCache import VerificationCache
+
+parser = argparse.ArgumentParser(
+    description="Adaptive sweep of an SMC query over scenario constants")
+parser.add_argument("--model_file", default="../faster_model_smc.xml",
+                    help="Model the scenarios are generated from")
+parser.add_argument("--map_file",
+                    help="Map of the scenarios, the one of the model by default")
+parser.add_argument("--query", default="Pr [<=T_scs] (<> safe_survivors >= N_SAFE)",
+                    help="Query estimated for every scenario")
+parser.add_argument("--param", action="append", default=[], required=True,
+                    help="Swept constant as NAME=FIRST:LAST[:STEP] or NAME=VALUE,VALUE,...")
+parser.add_argument("--width", type=float, default=0.05,
+                    help="Width of the confidence intervals and of the probability steps resolved")
+parser.add_argument("--budget", type=int, default=200,
+                    help="Maximum number of verifyta runs")
+parser.add_argument("--seed", type=int, default=0,
+                    help="Seed of the sampling of the grid")
+parser.add_argument("--verifyta", default="verifyta",
+                    help="Path of the verifyta executable")
+parser.add_argument("--jobs", type=int,
+                    help="Number of verifyta processes run at once, the number of cores by default")
+parser.add_argument("--timeout", type=float,
+                    help="Maximum time, in seconds, of each verifyta run")
+parser.add_argument("--memory_limit", type=int,
+                    help="Maximum memory, in MiB, of each verifyta run")
+parser.add_argument("--cache_dir",
+                    help="Directory of the verification cache, no cache is used by default")
+parser.add_argument("--cache_size", type=int, default=1024,
+                    help="Maximum size, in MiB, of the verification cache")
+parser.add_argument("--output", default="sweep.csv",
+                    help="Results file, written as JSON if it ends in .json and as CSV otherwise")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    parameters = {}
+    for param in args.param:
+        (name, values) = param.split("=", 1)
+        parameters[name.strip()] = Sweep.range_values(values)
+
+    map = None
+    if args.map_file:
+        with open(args.map_file) as file:
+            map = MapState.from_json(json.load(file))
+
+    cache = None
+    if args.cache_dir:
+        cache = VerificationCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    verifier = Verifier(args.verifyta, args.timeout,
+                        args.memory_limit and args.memory_limit * 1024 * 1024,
+                        cache=cache)
+
+    sweep = Sweep(ScenarioTemplate(args.model_file), verifier, args.query, parameters, map,
+                  args.width, args.budget, args.jobs, seed=args.seed)
+
+    def report(result: dict) -> None:
+        print(f"[{len(sweep.points)}/{args.budget}] {result['scenario']}: "
+              f"{result['outcome']} {result['value']}", file=sys.stderr)
+
+    results = sweep.run(report)
+    print(f"{len(results)} runs, {sweep.status}", file=sys.stderr)
+
+    columns = list(parameters) + Verifier.columns
+    with open(args.output, "w", newline="") as file:
+        if args.output.endswith(".json"):
+            json.dump(results, file, indent=2)
+        else:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows([dict(result, traces=";".join(result["traces"]))
+                              for result in results])
+
+    # The results are still written, their outcomes telling why the runs failed
+    if sweep.status == Sweep.NO_ESTIMATES:
+        sys.exit(1)
@@ -0,0 +1,31 @@
+import sys
+from os import path
+from types import SimpleNamespace
+
+import pytest
+
+SIMULATION_GUI = path.dirname(path.dirname(path.abspath(__file__)))
+
+# The components are imported like the scripts of simulation_gui import them
+sys.path.insert(0, SIMULATION_GUI)
+
+
+# Model and trace of a small non-square synthetic scenario, with the states of
+# the trace decoded directly as the reference of the trace stores
+@pytest.fixture(scope="session")
+def synthetic_trace(tmp_path_factory) -> SimpleNamespace:
+    from components.Benchmark import SyntheticScenario
+    from components.Trace import TraceIndexer
+    from components.Xtr import XtrReader
+
+    directory = tmp_path_factory.mktemp("synthetic")
+    scenario = SyntheticScenario(path.join(SIMULATION_GUI, "..", "faster_model_smc.xml"), 7, 5, seed=3)
+    (model_file, trace_file) = (str(directory / "model.xml"), str(directory / "trace.xtr"))
+    scenario.write_model(model_file)
+    scenario.write_trace(trace_file, 300)
+
+    indexer = TraceIndexer(7, 5, scenario.layout.variables)
+    with open(trace_file) as file:
+        states = XtrReader(file, scenario.layout).read_states()
+    return SimpleNamespace(model_file=model_file, trace_file=trace_file, layout=scenario.layout,
+                           indexer=indexer, maps=[indexer.gather(state) for state in states])
@@ -0,0 +1,94 @@
+import http.client
+import json
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from components.HttpServer import HttpServer
+from components.MapState import MapState
+from components.Wire import StateDecoder
+
+
+@pytest.fixture
+def server():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    states = []
+    server = HttpServer(states.append, address="127.0.0.1", port=0)
+    server.start()
+    server.states = states
+    yield server
+    server.stop()
+
+
+# Posts the bodies over one kept alive connection, like the external function
+def post(server: HttpServer, content_type: str, *bodies: bytes) -> list[int]:
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    statuses = []
+    for body in bodies:
+        connection.request("POST", "/state", body, {"Content-Type": content_type})
+        response = connection.getresponse()
+        response.read()
+        statuses.append(response.status)
+    connection.close()
+    return statuses
+
+
+def state(N_COLS: int = 3, N_ROWS: int = 2) -> MapState:
+    cells = np.arange(N_COLS * N_ROWS, dtype=np.uint8).reshape(N_COLS, N_ROWS) % 5
+    return MapState(cells, np.eye(N_COLS, N_ROWS, dtype=np.uint8))
+
+
+def test_binary_statuses(server):
+    (first, second) = (state(), state())
+    second.cells[1, 1] = 2
+    full = StateDecoder.encode(first)
+    delta = StateDecoder.encode(second, first)
+
+    # A delta before any full state is a conflict, then the sender resyncs
+    assert post(server, StateDecoder.content_type, delta, full, delta) == [409, 200, 200]
+    assert post(server, StateDecoder.content_type, full[:-1], b"garbage") == [400, 400]
+
+    server.on_map_request.render()
+    assert np.array_equal(server.states[-1].cells, second.cells)
+
+
+def test_binary_values_are_checked(server):
+    full = bytearray(StateDecoder.encode(state()))
+    assert post(server, StateDecoder.content_type, bytes(full)) == [200]
+
+    # Cells that are not a CellType, drones that are not 0 or 1
+    (cells, drones) = (full.copy(), full.copy())
+    cells[StateDecoder.header.size] = MapState.max_cell + 1
+    drones[-1] = 2
+    assert post(server, StateDecoder.content_type, bytes(cells), bytes(drones)) == [400, 400]
+
+    changed = state()
+    changed.cells[0, 0] = 1
+    delta = bytearray(StateDecoder.encode(changed, state()))
+    delta[-2] = 42
+    assert post(server, StateDecoder.content_type, bytes(delta)) == [400]
+
+    # The rejected delta left the last state untouched
+    server.on_map_request.render()
+    assert np.array_equal(server.states[-1].cells, state().cells)
+
+
+def test_json_statuses(server):
+    good = json.dumps(state().to_json()).encode()
+    bad = [b"{not json", b"{}", json.dumps({"cells": [[0, 300]]}).encode(),
+           json.dumps({"cells": [[0, -1]]}).encode(), json.dumps({"cells": [[0, 42]]}).encode(),
+           json.dumps({"cells": [[0, 1]], "drones": [[0, 2]]}).encode(),
+           json.dumps({"cells": [[0, 1]], "drones": [[0]]}).encode(),
+           json.dumps({"cells": [[0.5, 1]]}).encode()]
+    assert post(server, "application/json", good, *bad) == [200] + [400] * len(bad)
+
+    server.on_map_request.render()
+    assert len(server.states) == 1
+    assert np.array_equal(server.states[0].drones, state().drones)
+
+
+def test_unknown_path(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    connection.request("POST", "/other", b"")
+    assert connection.getresponse().status == 404
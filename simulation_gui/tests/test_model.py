@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from components.Model import ModelLayout
+
+MODEL = """<?xml version="1.0" encoding="utf-8"?>
+<nta>
+  <declaration>
+const int N_COLS = 6;
+const int N_ROWS = N_COLS / 4 + 1;
+const int N_CELLS = N_COLS * N_ROWS;
+const bool BIG = N_CELLS &gt; 10 &amp;&amp; !(N_ROWS == 0);
+int cells[N_COLS][N_ROWS];
+int[0, N_CELLS - 1] cursor;
+  </declaration>
+  <template>
+    <name>Process</name>
+    <declaration>int local;</declaration>
+  </template>
+  <system>system Process;</system>
+</nta>
+"""
+
+
+@pytest.fixture
+def layout() -> ModelLayout:
+    return ModelLayout(io.StringIO(MODEL))
+
+
+def test_constants(layout):
+    assert (layout.constants["N_COLS"], layout.constants["N_ROWS"]) == (6, 2)
+    assert layout.constants["N_CELLS"] == 12
+    assert layout.constants["BIG"] == 1
+    assert len(layout.variables) == 14
+
+
+@pytest.mark.parametrize("expression, value", [
+    ("1 + 2 * 3", 7), ("(1 + 2) * 3", 9), ("-7 / 2", -4), ("7 % 3", 1), ("N_COLS - N_ROWS * 2", 2),
+    ("N_COLS > 5 ? N_ROWS : 0", 2), ("N_COLS == 6 && N_ROWS != 2", 0), ("!BIG || N_COLS >= 6", 1),
+    ("1 << 3 | 1", 9), ("true + false", 1), ("0 < N_ROWS < N_COLS", 1),
+])
+def test_evaluate(layout, expression, value):
+    assert layout.evaluate(expression) == value
+
+
+def test_evaluate_values(layout):
+    assert layout.evaluate("safe_survivors >= N_SAFE", {"safe_survivors": 3, "N_SAFE": 2}) == 1
+    with pytest.raises(NameError):
+        layout.evaluate("N_COLS", {})
+
+
+# The expressions come from the model file, so nothing but arithmetic runs
+@pytest.mark.parametrize("expression", [
+    "__import__('os').system('true')", "().__class__", "N_COLS.real", "len(cells)", "cells[0]",
+    "'text'", "1.5", "[1, 2]", "(lambda: 1)()", "N_COLS if 1 else 2", "x := 1",
+])
+def test_evaluate_rejects_code(layout, expression):
+    with pytest.raises((SyntaxError, NameError)):
+        layout.evaluate(expression)
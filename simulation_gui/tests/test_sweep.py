@@ -0,0 +1,57 @@
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+from components.Scenario import ScenarioTemplate
+from components.Sweep import Sweep
+from components.Verifier import Verifier
+
+SIMULATION_GUI = path.dirname(path.dirname(path.abspath(__file__)))
+MODEL_FILE = path.join(SIMULATION_GUI, "..", "faster_model_smc.xml")
+
+# The same estimate for every scenario, so that the sweep converges at once
+STUB = f"""#!{sys.executable}
+print(" -- Pr(<> done) in [0.4,0.44] (95% CI)")
+print(" -- Formula is satisfied.")
+"""
+
+
+@pytest.fixture
+def stub(tmp_path) -> str:
+    verifyta = tmp_path / "verifyta"
+    verifyta.write_text(STUB)
+    verifyta.chmod(0o755)
+    return str(verifyta)
+
+
+def sweep(verifyta: str) -> Sweep:
+    return Sweep(ScenarioTemplate(MODEL_FILE), Verifier(verifyta), "Pr[<=10](<> true)",
+                 {"T_v": [1, 2, 3, 4, 5, 6]}, budget=10, batch=3)
+
+
+def test_converged(stub):
+    run = sweep(stub)
+    results = run.run()
+    assert run.status == Sweep.CONVERGED
+    assert len(results) == 3
+    assert all(result["value"] == pytest.approx(0.42) for result in results)
+
+
+def test_no_usable_estimates(tmp_path):
+    run = sweep(str(tmp_path / "missing"))
+    results = run.run()
+    assert run.status == Sweep.NO_ESTIMATES
+    assert results and all(result["outcome"] == "error" for result in results)
+
+
+def test_sweep_script_fails_without_estimates(tmp_path):
+    output_file = str(tmp_path / "sweep.csv")
+    process = subprocess.run([sys.executable, "sweep.py", "--model_file", MODEL_FILE, "--param", "T_v=1:6",
+                              "--verifyta", str(tmp_path / "missing"), "--budget", "4",
+                              "--output", output_file],
+                             cwd=SIMULATION_GUI, capture_output=True, text=True)
+    assert process.returncode == 1
+    assert Sweep.NO_ESTIMATES in process.stderr
+    assert path.exists(output_file)
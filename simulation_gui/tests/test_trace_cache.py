@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from components.TraceCache import TraceCache, TraceCacheWriter
+from components.Xtr import XtrReader
+
+
+@pytest.fixture
+def trace_file(tmp_path, synthetic_trace) -> str:
+    trace_file = str(tmp_path / "trace.xtr")
+    shutil.copy(synthetic_trace.trace_file, trace_file)
+    return trace_file
+
+
+def cache_files(cache: TraceCache) -> list[str]:
+    return sorted(os.listdir(cache.directory))
+
+
+def test_write_and_reopen(tmp_path, synthetic_trace, trace_file):
+    cache = TraceCache(str(tmp_path / "cache"))
+    trace = cache.open(synthetic_trace.model_file, trace_file, 7, 5)
+    assert trace.steps == len(synthetic_trace.maps)
+    for step in [0, 1, 150, trace.steps - 1]:
+        (map, expected) = (trace.get(step), synthetic_trace.maps[step])
+        assert np.array_equal(map.cells, expected.cells)
+        assert np.array_equal(map.drones, expected.drones)
+        assert map.first_responders == expected.first_responders
+        assert map.survivors == expected.survivors
+    with pytest.raises(IndexError):
+        trace.get(trace.steps)
+
+    # Other variables are kept by name
+    with open(trace_file) as file:
+        states = XtrReader(file, synthetic_trace.layout).read_states()
+    name = trace.variables[0]
+    assert np.array_equal(trace.values(name), states[:, synthetic_trace.layout.variables.index(name)])
+
+    # Reopened from the same file, without writing it again
+    [cache_file] = cache_files(cache)
+    modified = os.stat(trace.cache_file).st_mtime_ns
+    reopened = cache.open(synthetic_trace.model_file, trace_file, 7, 5)
+    assert reopened.cache_file == trace.cache_file
+    assert os.stat(reopened.cache_file).st_mtime_ns == modified
+    assert np.array_equal(reopened.records, trace.records)
+
+
+def test_stale_caches(tmp_path, synthetic_trace, trace_file):
+    cache = TraceCache(str(tmp_path / "cache"))
+    first = cache.open(synthetic_trace.model_file, trace_file, 7, 5).cache_file
+    # Another size of the same trace stays valid
+    other_size = cache.open(synthetic_trace.model_file, trace_file, 5, 7).cache_file
+
+    # New contents replace the cache of the previous ones, for this size only
+    with open(trace_file) as file:
+        lines = file.read().split("\n.\n")
+    with open(trace_file, "w") as file:
+        file.write("\n.\n".join(lines[:len(lines) // 2] + [".\n"]))
+    shorter = cache.open(synthetic_trace.model_file, trace_file, 7, 5)
+    assert shorter.steps < len(synthetic_trace.maps)
+    assert not os.path.exists(first)
+    assert cache_files(cache) == sorted(os.path.basename(file) for file in [shorter.cache_file, other_size])
+
+
+def test_truncated_cache_is_rewritten(tmp_path, synthetic_trace, trace_file):
+    cache = TraceCache(str(tmp_path / "cache"))
+    trace = cache.open(synthetic_trace.model_file, trace_file, 7, 5)
+    (cache_file, steps) = (trace.cache_file, trace.steps)
+    del trace
+    os.truncate(cache_file, os.path.getsize(cache_file) - 1)
+
+    (entry, header) = cache.entry(synthetic_trace.model_file, trace_file, 7, 5)
+    assert entry == cache_file and cache.find(entry, header) is None
+    assert cache.open(synthetic_trace.model_file, trace_file, 7, 5).steps == steps
+
+
+def test_writer_abort(tmp_path, synthetic_trace, trace_file):
+    cache = TraceCache(str(tmp_path / "cache"))
+    (cache_file, header) = cache.entry(synthetic_trace.model_file, trace_file, 7, 5)
+    writer = TraceCacheWriter(cache, cache_file, header, synthetic_trace.layout)
+    with open(trace_file) as file:
+        writer.append(XtrReader(file, synthetic_trace.layout).read_states()[:10])
+    writer.abort()
+    assert cache_files(cache) == []
+    assert cache.find(cache_file, header) is None
@@ -0,0 +1,120 @@
+import io
+import time
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QThreadPool
+
+from components.MapState import MapState
+from components.Trace import TraceStore
+from components.Xtr import XtrReader
+
+
+def assert_same(map: MapState, expected: MapState) -> None:
+    assert np.array_equal(map.cells, expected.cells)
+    assert np.array_equal(map.drones, expected.drones)
+    assert map.first_responders == expected.first_responders
+    assert map.survivors == expected.survivors
+
+
+# Steps on both sides of every keyframe, forwards, backwards and jumping, so
+# that they are rebuilt from a keyframe and from the last step rebuilt
+def seeks(steps: int, keyframe_interval: int, random: np.random.Generator) -> list[int]:
+    around = [step + offset for step in range(0, steps, keyframe_interval) for offset in [-1, 0, 1]]
+    around = [step for step in around if 0 <= step < steps]
+    return around + around[::-1] + random.integers(0, steps, 50).tolist()
+
+
+def test_read(synthetic_trace):
+    with open(synthetic_trace.trace_file) as file:
+        store = TraceStore.read(file, synthetic_trace.layout, synthetic_trace.indexer, 7, chunk_size=32)
+    assert store.complete and store.steps == len(synthetic_trace.maps)
+    for step in seeks(store.steps, 7, np.random.default_rng(0)):
+        assert_same(store.get(step), synthetic_trace.maps[step])
+    with pytest.raises(IndexError):
+        store.get(store.steps)
+
+
+# Chunks appended between the seeks, the last step rebuilt being before the
+# arrays grow and the steps asked for after
+def test_get_while_appending(synthetic_trace):
+    with open(synthetic_trace.trace_file) as file:
+        states = XtrReader(file, synthetic_trace.layout).read_states()
+    store = TraceStore(synthetic_trace.indexer, 5)
+    random = np.random.default_rng(1)
+    start = 0
+    for size in [1, 3, 4, 9, 17, 40, 100, 126]:
+        store.append(states[start:start + size])
+        start += size
+        assert store.steps == start
+        for step in seeks(store.steps, 5, random):
+            assert_same(store.get(step), synthetic_trace.maps[step])
+        with pytest.raises(IndexError):
+            store.get(store.steps)
+    store.pack()
+    assert_same(store.get(start - 1), synthetic_trace.maps[-1])
+
+
+# Writer of the chunks read in background, slow enough for the steps to be
+# read while the store grows
+class SlowWriter():
+    def __init__(self):
+        self.states = []
+        self.committed = None
+
+    def append(self, states: np.ndarray) -> None:
+        time.sleep(0.005)
+        self.states.append(states)
+
+    def commit(self) -> None:
+        self.committed = True
+
+    def abort(self) -> None:
+        self.committed = False
+
+
+def test_get_during_background_load(synthetic_trace):
+    store = TraceStore(synthetic_trace.indexer, 6)
+    writer = SlowWriter()
+    store.load(synthetic_trace.trace_file, synthetic_trace.layout, chunk_size=8, writer=writer)
+    random = np.random.default_rng(2)
+    seen = set()
+    while not store.complete:
+        steps = store.steps
+        if steps:
+            seen.add(steps)
+            for step in [steps - 1, 0] + random.integers(0, steps, 5).tolist():
+                assert_same(store.get(step), synthetic_trace.maps[step])
+    QThreadPool.globalInstance().waitForDone()
+
+    assert store.error is None
+    assert store.steps == len(synthetic_trace.maps)
+    assert len(seen) > 10
+    assert writer.committed and sum(len(states) for states in writer.states) == store.steps
+    for step in seeks(store.steps, 6, random):
+        assert_same(store.get(step), synthetic_trace.maps[step])
+
+
+def test_malformed_trace_keeps_the_steps_before(synthetic_trace):
+    with open(synthetic_trace.trace_file) as file:
+        text = file.read()
+    # Cut in the values of a state past the first chunks
+    end = text.index("\n.\n", len(text) // 2) - 1
+    store = TraceStore(synthetic_trace.indexer, 4)
+    store.fill(io.StringIO(text[:end]), synthetic_trace.layout, chunk_size=16)
+    assert store.complete and isinstance(store.error, ValueError)
+    assert 0 < store.steps < len(synthetic_trace.maps)
+    for step in seeks(store.steps, 4, np.random.default_rng(3)):
+        assert_same(store.get(step), synthetic_trace.maps[step])
+
+
+def test_cancelled_load_aborts_the_writer(synthetic_trace):
+    store = TraceStore(synthetic_trace.indexer, 6)
+    writer = SlowWriter()
+    store.load(synthetic_trace.trace_file, synthetic_trace.layout, chunk_size=8, writer=writer)
+    store.cancel()
+    QThreadPool.globalInstance().waitForDone()
+    assert store.complete and writer.committed is False
+    assert store.steps < len(synthetic_trace.maps)
+    for step in range(store.steps):
+        assert_same(store.get(step), synthetic_trace.maps[step])
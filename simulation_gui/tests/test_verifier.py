@@ -0,0 +1,131 @@
+import csv
+import json
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+from components.Verifier import Verifier, VerificationJob
+
+SIMULATION_GUI = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Answers like verifyta from the formula of the query file: sleeps or
+# allocates when asked to, and reports its address space limit
+STUB = f"""#!{sys.executable}
+import resource, sys, time
+formula = open(sys.argv[-1]).read()
+if "sleep" in formula:
+    time.sleep(30)
+if "alloc" in formula:
+    memory = bytearray(1 << 30)
+print("Options for the verification:")
+print("Verifying formula 1 at /tmp/query.q:1")
+if formula.startswith("Pr"):
+    print(" -- Pr(<> done) in [0.25,0.35] (95% CI)")
+print(" -- Formula is satisfied.")
+print(" -- address space limit", resource.getrlimit(resource.RLIMIT_AS)[0])
+"""
+
+MODEL = """<?xml version="1.0" encoding="utf-8"?>
+<nta>
+  <declaration>int x;</declaration>
+  <system>system Process;</system>
+  <queries>
+    <query><formula>A[] ok</formula></query>
+    <query><formula>Pr[&lt;=10](&lt;&gt; done)</formula></query>
+    <query><formula>E&lt;&gt; sleep</formula></query>
+    <query><formula>E&lt;&gt; alloc</formula></query>
+  </queries>
+</nta>
+"""
+
+
+@pytest.fixture
+def stub(tmp_path) -> str:
+    verifyta = tmp_path / "verifyta"
+    verifyta.write_text(STUB)
+    verifyta.chmod(0o755)
+    return str(verifyta)
+
+
+@pytest.fixture
+def model_file(tmp_path) -> str:
+    model = tmp_path / "model.xml"
+    model.write_text(MODEL)
+    return str(model)
+
+
+def test_run_all(stub, model_file):
+    limit = 512 * 1024 * 1024
+    verifier = Verifier(stub, timeout=2, memory_limit=limit)
+    jobs = VerificationJob.expand([model_file])
+    reported = []
+    results = verifier.run_all(jobs, 2, reported.append)
+
+    assert [result["query"] for result in results] == [0, 1, 2, 3]
+    assert len(reported) == 4
+    (satisfied, probability, timeout, alloc) = results
+
+    assert satisfied["outcome"] == "satisfied"
+    assert satisfied["returncode"] == 0
+    assert f"address space limit {limit}" in satisfied["message"]
+
+    assert probability["outcome"] == "satisfied"
+    assert (probability["ci_low"], probability["ci_high"]) == (0.25, 0.35)
+    assert probability["value"] == pytest.approx(0.3)
+
+    assert timeout["outcome"] == "timeout"
+    assert timeout["returncode"] is None
+    assert timeout["time"] < 10
+
+    # Over the limit the stub fails to allocate
+    assert alloc["outcome"] == "error"
+    assert alloc["returncode"] != 0
+    assert "MemoryError" in alloc["message"]
+
+
+def test_run_without_memory_limit(stub, model_file):
+    verifier = Verifier(stub)
+    [alloc] = verifier.run_all(VerificationJob.expand([model_file], selected=[3]), 1)
+    assert alloc["outcome"] == "satisfied"
+    assert "address space limit -1" in alloc["message"]
+
+
+def test_missing_verifyta(tmp_path, model_file):
+    for limit in [None, 1 << 30]:
+        verifier = Verifier(str(tmp_path / "missing"), memory_limit=limit)
+        [result] = verifier.run_all(VerificationJob.expand([model_file], selected=[0]), 1)
+        assert result["outcome"] == "error"
+
+
+@pytest.mark.parametrize("output", ["results.csv", "results.json"])
+def test_verify_script(tmp_path, stub, model_file, output):
+    output_file = str(tmp_path / output)
+    subprocess.run([sys.executable, "verify.py", model_file, "--verifyta", stub, "--query", "0",
+                    "--query", "1", "--query", "2", "--timeout", "2", "--memory_limit", "512",
+                    "--jobs", "2", "--output", output_file],
+                   cwd=SIMULATION_GUI, check=True, capture_output=True)
+
+    with open(output_file, newline="") as file:
+        if output.endswith(".json"):
+            results = json.load(file)
+        else:
+            results = list(csv.DictReader(file))
+            assert list(results[0]) == Verifier.columns
+    assert [result["outcome"] for result in results] == ["satisfied", "satisfied", "timeout"]
+    assert all(result["model"] == "model" and result["scenario"] == "default" for result in results)
+    assert str(512 * 1024 * 1024) in results[0]["message"]
+    assert float(results[1]["ci_high"]) == 0.35
+
+
+def test_run_all_cached(tmp_path, stub, model_file):
+    from components.VerificationCache import VerificationCache
+
+    verifier = Verifier(stub, cache=VerificationCache(str(tmp_path / "cache")))
+    jobs = VerificationJob.expand([model_file], selected=[0, 1])
+    first = verifier.run_all(jobs, 2)
+    second = verifier.run_all(jobs, 2)
+    assert [result["cached"] for result in first] == [False, False]
+    assert [result["cached"] for result in second] == [True, True]
+    assert [result["value"] for result in second] == [result["value"] for result in first]
@@ -0,0 +1,102 @@
+import struct
+
+import numpy as np
+import pytest
+
+from components.MapState import MapState
+from components.Wire import StateDecoder, MissingBaseState
+
+
+# Non-square, so that swapping columns and rows shows
+def random_state(random: np.random.Generator, N_COLS: int = 7, N_ROWS: int = 4) -> MapState:
+    return MapState(random.integers(0, MapState.max_cell + 1, (N_COLS, N_ROWS), dtype=np.uint8),
+                    random.integers(0, 2, (N_COLS, N_ROWS), dtype=np.uint8))
+
+
+def assert_same(state: MapState, expected: MapState) -> None:
+    assert state.cells.shape == expected.cells.shape
+    assert np.array_equal(state.cells, expected.cells)
+    assert np.array_equal(state.drones, expected.drones)
+
+
+def test_round_trip():
+    random = np.random.default_rng(0)
+    decoder = StateDecoder()
+    previous = random_state(random)
+    assert_same(decoder.decode(StateDecoder.encode(previous)), previous)
+
+    for _ in range(20):
+        state = previous.copy()
+        changed = random.integers(0, state.cells.size, 3)
+        state.cells.reshape(-1)[changed] = random.integers(0, MapState.max_cell + 1, 3)
+        state.drones.reshape(-1)[changed] ^= 1
+
+        body = StateDecoder.encode(state, previous)
+        assert StateDecoder.header.unpack_from(body)[2] == StateDecoder.DELTA
+        assert_same(decoder.decode(body), state)
+        previous = state
+
+    # Too many changes for a delta to be smaller
+    state = random_state(random)
+    body = StateDecoder.encode(state, previous)
+    assert StateDecoder.header.unpack_from(body)[2] == StateDecoder.FULL
+    assert_same(decoder.decode(body), state)
+
+
+def test_full_state_layout():
+    state = random_state(np.random.default_rng(1))
+    body = StateDecoder.encode(state)
+    # Cells then drones, flattened as [x][y] like the cells of the model
+    count = state.cells.size
+    cells = np.frombuffer(body, np.uint8, count, StateDecoder.header.size)
+    assert cells[1 * state.N_ROWS + 2] == state.cells[1, 2]
+    assert len(body) == StateDecoder.header.size + 2 * count
+
+
+def test_delta_without_base():
+    random = np.random.default_rng(2)
+    first = random_state(random)
+    second = first.copy()
+    second.cells[0, 0] = (first.cells[0, 0] + 1) % (MapState.max_cell + 1)
+    delta = StateDecoder.encode(second, first)
+    assert StateDecoder.header.unpack_from(delta)[2] == StateDecoder.DELTA
+
+    with pytest.raises(MissingBaseState):
+        StateDecoder().decode(delta)
+
+    # A base of another size is no base either
+    decoder = StateDecoder()
+    decoder.decode(StateDecoder.encode(random_state(random, 4, 7)))
+    with pytest.raises(MissingBaseState):
+        decoder.decode(delta)
+
+    decoder.reset()
+    with pytest.raises(MissingBaseState):
+        decoder.decode(delta)
+
+
+def test_delta_out_of_range():
+    state = random_state(np.random.default_rng(3))
+    decoder = StateDecoder()
+    decoder.decode(StateDecoder.encode(state))
+
+    def delta(index: int, cell: int, drone: int) -> bytes:
+        return (StateDecoder.header.pack(StateDecoder.magic, StateDecoder.version, StateDecoder.DELTA,
+                                         state.N_COLS, state.N_ROWS, 1) +
+                struct.pack("<IBB", index, cell, drone))
+
+    for body in [delta(state.cells.size, 0, 0), delta(0, MapState.max_cell + 1, 0), delta(0, 0, 2),
+                 delta(0, 0, 0)[:-1]]:
+        with pytest.raises(ValueError):
+            decoder.decode(body)
+    # The rejected deltas left the state untouched
+    assert_same(decoder.state, state)
+
+    assert decoder.decode(delta(state.cells.size - 1, 2, 1)).cells[-1, -1] == 2
+
+
+def test_malformed_full_state():
+    body = StateDecoder.encode(random_state(np.random.default_rng(4)))
+    for malformed in [body[:5], body[:-1], body + b"\0", b"XXXX" + body[4:]]:
+        with pytest.raises(ValueError):
+            StateDecoder().decode(malformed)
@@ -0,0 +1,93 @@
+import io
+from os import path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from components.Xtr import XtrReader
+
+SIMULATION_GUI = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Two processes and three variables: the initial state, a transition with a
+# select value on its second edge, and the state it leads to. Each state has
+# two clock constraints, the second one negative.
+TRACE = """0
+1
+.
+0
+1
+-5
+.
+1
+0
+0
+.
+.
+3
+-2
+7
+.
+0 1 ;
+1 0 4 ;
+.
+1
+1
+.
+0
+1
+-10
+.
+1
+0
+3
+.
+.
+4
+0
+8
+.
+.
+"""
+
+
+def layout(variables: int) -> SimpleNamespace:
+    return SimpleNamespace(variables=[f"v{i}" for i in range(variables)])
+
+
+def read(text: str, variables: int = 3, chunk_size: int = 1 << 20) -> np.ndarray:
+    return XtrReader(io.StringIO(text), layout(variables), chunk_size).read_states()
+
+
+def test_states_between_transitions():
+    expected = np.array([[3, -2, 7], [4, 0, 8]], dtype=np.int32)
+    assert np.array_equal(read(TRACE), expected)
+    # Lines split over chunks, down to a character per chunk
+    for chunk_size in [1, 2, 7]:
+        assert np.array_equal(read(TRACE, chunk_size=chunk_size), expected)
+    assert np.array_equal(read(TRACE.replace("\n", "\r\n"), chunk_size=5), expected)
+
+
+def test_mismatched_or_truncated_traces():
+    with pytest.raises(ValueError):
+        read(TRACE, variables=2)
+    with pytest.raises(ValueError):
+        read(TRACE, variables=4)
+    for end in [TRACE.index("-2"), TRACE.index("1 0 4 ;") + 8]:
+        with pytest.raises(ValueError):
+            read(TRACE[:end])
+    assert read("", variables=3).shape == (0, 3)
+
+
+# Trace exported by verifyta, with clocks and a transition between each state
+def test_verifyta_example():
+    trace_file = path.join(SIMULATION_GUI, "examples", "random_trace.xtr")
+    with open(trace_file) as file:
+        text = file.read()
+    lines = text.splitlines()
+    transitions = sum(line.endswith(";") and previous == "." for (previous, line) in zip(lines, lines[1:]))
+
+    states = read(text, variables=253)
+    assert states.shape == (transitions + 1, 253)
+    assert not states[0].any()
+    assert np.array_equal(read(text, variables=253, chunk_size=4096), states)
@@ -1,12 +1,63 @@
-
 #include <curlpp/Easy.hpp>
+#include <curlpp/Infos.hpp>
 #include <curlpp/Options.hpp>
 #include <curlpp/cURLpp.hpp>
 #include <nlohmann/json.hpp>
+#include <algorithm>
+#include <condition_variable>
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <deque>
+#include <list>
+#include <mutex>
 #include <sstream>
+#include <string>
+#include <thread>
+#include <vector>
 
-extern "C" void send_state_via_post_request(int n_cols, int n_rows, int cells[],
-                                            bool drones[]) {
+// Binary map state, see components/Wire.py for the decoder: a little endian
+// header ("MAPS", version, kind, n_cols, n_rows, count) followed by the raw
+// cells and drones, or by the indices and values of the cells that changed
+// since the previous state posted. A full state is sent every
+// VISUALIZER_KEYFRAME states (100 by default) so that a restarted visualizer
+// catches up even if it cannot answer with a conflict. Set VISUALIZER_FORMAT
+// to "json" to send the states as JSON or to "binary" to always send full
+// binary states.
+static const char *BINARY_CONTENT_TYPE = "application/vnd.map-state";
+static const uint8_t VERSION = 1;
+static const uint8_t FULL = 0;
+static const uint8_t DELTA = 1;
+static const long CONFLICT = 409;
+static const int DEFAULT_KEYFRAME = 100;
+
+
+static void put_u16(std::string &body, uint16_t value) {
+  body.push_back(value & 0xff);
+  body.push_back(value >> 8);
+}
+
+static void put_u32(std::string &body, uint32_t value) {
+  for (int i = 0; i < 4; i++)
+    body.push_back((value >> (8 * i)) & 0xff);
+}
+
+static std::string encode_header(uint8_t kind, int n_cols, int n_rows,
+                                 uint32_t count) {
+  std::string body("MAPS");
+  body.push_back(VERSION);
+  body.push_back(kind);
+  put_u16(body, n_cols);
+  put_u16(body, n_rows);
+  put_u32(body, count);
+  return body;
+}
+
+// The cells of the model are flattened as [x][y], n_rows cells per column
+static std::string encode_json(int n_cols, int n_rows,
+                               const std::vector<uint8_t> &cells,
+                               const std::vector<uint8_t> &drones) {
   nlohmann::json state;
 
   state["N_COLS"] = n_cols;
@@ -18,25 +69,266 @@ extern "C" void send_state_via_post_request(int n_cols, int n_rows, int cells[],
     state["cells"][x] = nlohmann::json::array();
     state["drones"][x] = nlohmann::json::array();
     for (int y = 0; y < n_rows; y++) {
-      state["cells"][x][y] = cells[x * n_cols + y];
-      state["drones"][x][y] = drones[x * n_cols + y];
+      state["cells"][x][y] = cells[x * n_rows + y];
+      state["drones"][x][y] = (bool)drones[x * n_rows + y];
     }
   }
 
-  std::list<std::string> header;
-  header.push_back("Content-Type: application/json");
+  return state.dump();
+}
+
+static std::string encode_full(int n_cols, int n_rows,
+                               const std::vector<uint8_t> &cells,
+                               const std::vector<uint8_t> &drones) {
+  std::string body = encode_header(FULL, n_cols, n_rows, cells.size());
+  body.append(cells.begin(), cells.end());
+  body.append(drones.begin(), drones.end());
+  return body;
+}
+
+static std::string encode_delta(int n_cols, int n_rows,
+                                const std::vector<uint8_t> &cells,
+                                const std::vector<uint8_t> &drones,
+                                const std::vector<uint8_t> &last_cells,
+                                const std::vector<uint8_t> &last_drones) {
+  std::vector<uint32_t> changed;
+  for (uint32_t i = 0; i < cells.size(); i++) {
+    if (cells[i] != last_cells[i] || drones[i] != last_drones[i])
+      changed.push_back(i);
+  }
+
+  // A delta costs 6 bytes per cell against 2 for a full state
+  if (6 * changed.size() >= 2 * cells.size())
+    return encode_full(n_cols, n_rows, cells, drones);
 
+  std::string body = encode_header(DELTA, n_cols, n_rows, changed.size());
+  for (uint32_t i : changed)
+    put_u32(body, i);
+  for (uint32_t i : changed)
+    body.push_back(cells[i]);
+  for (uint32_t i : changed)
+    body.push_back(drones[i]);
+  return body;
+}
+
+// Posts the states from a background thread over a single keep-alive
+// connection, so that the simulator never waits for the visualizer. The queue
+// holds at most VISUALIZER_QUEUE states (64 by default) and VISUALIZER_DROP
+// chooses what happens when it is full: "oldest" drops the oldest queued state
+// (the default), "newest" drops the incoming one and "block" waits for room.
+// States are encoded by the sender against the last state it posted, so any
+// state can be dropped without breaking the deltas.
+class Sender {
+public:
+  enum class DropPolicy { OLDEST, NEWEST, BLOCK };
+
+  struct State {
+    int n_cols;
+    int n_rows;
+    std::vector<uint8_t> cells;
+    std::vector<uint8_t> drones;
+  };
+
+  Sender() {
+    const char *format = std::getenv("VISUALIZER_FORMAT");
+    json = format != nullptr && std::strcmp(format, "json") == 0;
+    deltas = format == nullptr || std::strcmp(format, "binary") != 0;
+
+    const char *keyframe_env = std::getenv("VISUALIZER_KEYFRAME");
+    keyframe = keyframe_env ? std::atoi(keyframe_env) : DEFAULT_KEYFRAME;
+
+    const char *capacity_env = std::getenv("VISUALIZER_QUEUE");
+    capacity = capacity_env ? std::max(1, std::atoi(capacity_env))
+                            : DEFAULT_CAPACITY;
+
+    const char *drop = std::getenv("VISUALIZER_DROP");
+    if (drop != nullptr && std::strcmp(drop, "newest") == 0)
+      policy = DropPolicy::NEWEST;
+    else if (drop != nullptr && std::strcmp(drop, "block") == 0)
+      policy = DropPolicy::BLOCK;
+
+    std::list<std::string> header;
+    header.push_back(std::string("Content-Type: ") +
+                     (json ? "application/json" : BINARY_CONTENT_TYPE));
+    request.setOpt(new curlpp::options::HttpHeader(header));
+    request.setOpt(curlpp::options::Url(std::string("127.0.0.1:5000/state")));
+    request.setOpt(new curlpp::options::WriteStream(&response));
+    request.setOpt(new curlpp::options::ConnectTimeout(1));
+    request.setOpt(new curlpp::options::Timeout(5));
+
+    worker = std::thread(&Sender::run, this);
+  }
+
+  ~Sender() {
+    {
+      std::lock_guard<std::mutex> lock(mutex);
+      stopping = true;
+    }
+    not_empty.notify_all();
+    not_full.notify_all();
+    worker.join();
+
+    std::fprintf(stderr,
+                 "visualizer: %ld states queued, %ld dropped, %ld sent, "
+                 "%ld failed, max queue depth %zu\n",
+                 queued, dropped, sent, failed, max_depth);
+  }
+
+  void push(State &&state) {
+    std::unique_lock<std::mutex> lock(mutex);
+    if (queue.size() >= capacity) {
+      if (policy == DropPolicy::NEWEST) {
+        dropped++;
+        return;
+      } else if (policy == DropPolicy::OLDEST) {
+        queue.pop_front();
+        dropped++;
+      } else {
+        not_full.wait(lock,
+                      [this] { return queue.size() < capacity || stopping; });
+      }
+    }
+
+    queue.push_back(std::move(state));
+    queued++;
+    max_depth = std::max(max_depth, queue.size());
+    lock.unlock();
+    not_empty.notify_one();
+  }
+
+  int depth() {
+    std::lock_guard<std::mutex> lock(mutex);
+    return queue.size();
+  }
+
+  int dropped_states() {
+    std::lock_guard<std::mutex> lock(mutex);
+    return dropped;
+  }
+
+private:
+  static const std::size_t DEFAULT_CAPACITY = 64;
+
+  bool json = false;
+  bool deltas = true;
+  int keyframe;
+  std::size_t capacity;
+  DropPolicy policy = DropPolicy::OLDEST;
+
+  std::mutex mutex;
+  std::condition_variable not_empty;
+  std::condition_variable not_full;
+  std::deque<State> queue;
+  bool stopping = false;
+  std::thread worker;
+
+  // Counters, guarded by the mutex
+  long queued = 0;
+  long dropped = 0;
+  long sent = 0;
+  long failed = 0;
+  std::size_t max_depth = 0;
+
+  // Only used by the worker thread
   curlpp::Easy request;
   std::stringstream response;
+  std::vector<uint8_t> last_cells;
+  std::vector<uint8_t> last_drones;
+  bool has_last_state = false;
+  int since_full = 0;
+
+  void run() {
+    while (true) {
+      std::unique_lock<std::mutex> lock(mutex);
+      not_empty.wait(lock, [this] { return !queue.empty() || stopping; });
+      if (stopping && queue.empty())
+        return;
+
+      // When stopping, only the latest state is still worth drawing
+      bool last = stopping;
+      if (last) {
+        dropped += queue.size() - 1;
+        queue.erase(queue.begin(), queue.end() - 1);
+      }
+      State state = std::move(queue.front());
+      queue.pop_front();
+      lock.unlock();
+      not_full.notify_one();
+
+      bool ok = send(state);
+
+      lock.lock();
+      if (ok)
+        sent++;
+      else
+        failed++;
+      if (last)
+        return;
+    }
+  }
+
+  bool send(State &state) {
+    if (json)
+      return post(encode_json(state.n_cols, state.n_rows, state.cells,
+                              state.drones)) == 200;
+
+    bool delta = deltas && has_last_state &&
+                 last_cells.size() == state.cells.size() &&
+                 since_full < keyframe;
+    std::string body =
+        delta ? encode_delta(state.n_cols, state.n_rows, state.cells,
+                             state.drones, last_cells, last_drones)
+              : encode_full(state.n_cols, state.n_rows, state.cells,
+                            state.drones);
+
+    long status = post(body);
+    if (delta && status == CONFLICT) {
+      // The visualizer lost the previous state, e.g. it was restarted
+      status = post(encode_full(state.n_cols, state.n_rows, state.cells,
+                                state.drones));
+    }
+
+    // Deltas are only sent on top of a state the visualizer accepted
+    has_last_state = status == 200;
+    since_full = delta && status != CONFLICT ? since_full + 1 : 0;
+    last_cells.swap(state.cells);
+    last_drones.swap(state.drones);
+    return status == 200;
+  }
+
+  // The handle is reused, so that libcurl keeps the connection alive
+  long post(const std::string &body) {
+    request.setOpt(new curlpp::options::PostFields(body));
+    request.setOpt(new curlpp::options::PostFieldSize(body.size()));
+    response.str("");
 
-  request.setOpt(new curlpp::options::HttpHeader(header));
-  request.setOpt(curlpp::options::Url(std::string("127.0.0.1:5000/state")));
-  request.setOpt(new curlpp::options::PostFields(state.dump()));
-  request.setOpt(new curlpp::options::WriteStream(&response));
+    try {
+      request.perform();
+      return curlpp::infos::ResponseCode::get(request);
+    } catch (std::exception &e) {
+      return 0;
+    }
+  }
+};
+
+static Sender &sender() {
+  static Sender instance;
+  return instance;
+}
 
-  try {
-    request.perform();
-  } catch (std::exception e) {
-    // ...
+extern "C" void send_state_via_post_request(int n_cols, int n_rows, int cells[],
+                                            bool drones[]) {
+  std::size_t n_cells = n_cols * n_rows;
+  Sender::State state{n_cols, n_rows, std::vector<uint8_t>(n_cells),
+                      std::vector<uint8_t>(n_cells)};
+  for (std::size_t i = 0; i < n_cells; i++) {
+    state.cells[i] = cells[i];
+    state.drones[i] = drones[i];
   }
+  sender().push(std::move(state));
 }
+
+// Backpressure counters, which the model can import next to the function above
+extern "C" int visualizer_queue_depth() { return sender().depth(); }
+
+extern "C" int visualizer_dropped_states() { return sender().dropped_states(); }
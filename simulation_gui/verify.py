@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import glob
+import json
+import sys
+
+from components.Verifier import Verifier, VerificationJob
+from components.VerificationCache import VerificationCache
+
+parser = argparse.ArgumentParser(
+    description="Run verifyta on every query of every model and scenario")
+parser.add_argument("models", nargs="*", default=["../faster_model.xml", "../expressive_model.xml",
+                                                  "../faster_model_smc.xml",
+                                                  "../faster_model_scenario/*.xml",
+                                                  "../faster_model_smc_scenarios/*.xml"],
+                    help="Model files or glob patterns, each file being a scenario")
+parser.add_argument("--queries_file",
+                    help="Queries to run on every model instead of the ones in the model files")
+parser.add_argument("--query", type=int, action="append",
+                    help="Index of a query to run, all of them by default")
+parser.add_argument("--verifyta", default="verifyta",
+                    help="Path of the verifyta executable")
+parser.add_argument("--jobs", type=int,
+                    help="Number of verifyta processes run at once, the number of cores by default")
+parser.add_argument("--timeout", type=float,
+                    help="Maximum time, in seconds, of each verifyta run")
+parser.add_argument("--memory_limit", type=int,
+                    help="Maximum memory, in MiB, of each verifyta run")
+parser.add_argument("--output", default="results.csv",
+                    help="Results file, written as JSON if it ends in .json and as CSV otherwise")
+parser.add_argument("--cache_dir",
+                    help="Directory of the verification cache, no cache is used by default")
+parser.add_argument("--cache_size", type=int, default=1024,
+                    help="Maximum size, in MiB, of the verification cache")
+parser.add_argument("--traces", action="store_true",
+                    help="Keep the traces generated by verifyta in the cache")
+parser.add_argument("--verifyta_option", action="append", default=[],
+                    help="Additional verifyta option, repeat for options with values")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    model_files = []
+    for pattern in args.models:
+        model_files += sorted(glob.glob(pattern)) or [pattern]
+
+    jobs = VerificationJob.expand(model_files, args.queries_file, args.query)
+    cache = None
+    if args.cache_dir:
+        cache = VerificationCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    elif args.traces:
+        parser.error("--traces requires --cache_dir")
+
+    verifier = Verifier(args.verifyta, args.timeout,
+                        args.memory_limit and args.memory_limit * 1024 * 1024,
+                        args.verifyta_option, cache, args.traces)
+
+    done = 0
+
+    def report(result: dict) -> None:
+        global done
+        done += 1
+        print(f"[{done}/{len(jobs)}] {result['model']} {result['scenario']} "
+              f"query {result['query']}: {result['outcome']}"
+              f"{' (cached)' if result['cached'] else ''}", file=sys.stderr)
+
+    results = verifier.run_all(jobs, args.jobs, report)
+
+    with open(args.output, "w", newline="") as file:
+        if args.output.endswith(".json"):
+            json.dump(results, file, indent=2)
+        else:
+            writer = csv.DictWriter(file, fieldnames=Verifier.columns)
+            writer.writeheader()
+            writer.writerows([dict(result, traces=";".join(result["traces"]))
+                              for result in results])